@@ -0,0 +1,218 @@
+"""
+Benchmarks for the meta-lexer, parser, rule engines and highlighters on
+synthetic grammars and inputs. Results are written as JSON, and a run can
+be compared against an earlier one:
+
+    python bench.py -o before.json
+    python bench.py -o after.json --compare before.json
+
+Every case is timed `repeat` times and the fastest run is kept, except
+use() on inputs past HIGHLIGHT_LIMIT, timed once per engine. Inputs
+are generated from a fixed seed, so runs on the same machine compare.
+"""
+from tokenparser.lexer import Lexer
+from tokenparser.parser import Parser, organize_pattern
+from tokenparser.engine import compile_engine, DispatchEngine
+from tokenparser.use import use
+from tokenparser.all import coord_token
+import argparse, json, os, platform, random, subprocess, sys, time
+
+# (rules, share of literal rules, share of Special categories)
+GRAMMARS = [(10, 0.5, 0.5), (100, 0.0, 0.5), (100, 1.0, 0.5), (100, 0.5, 0.0), (1000, 0.5, 0.5)]
+SIZES = ["1K", "64K", "1M"]
+# the Qt highlighters work on a QTextDocument, keep those inputs small
+HIGHLIGHT_LIMIT = 1 << 20
+LOOKUPS = 10000
+
+
+def parse_size(size: str) -> int:
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if size[-1:].upper() in units:
+        return int(size[:-1]) * units[size[-1].upper()]
+    return int(size)
+
+def make_grammar(rules: int, literal: float, special: float, seed=0):
+    """
+    A description with `rules` rules, grouped a few per TokenName, and
+    the words that match them (to build inputs from).
+    """
+    rnd = random.Random(seed)
+    blocks = []
+    words = []
+    i = 0
+    while i < rules:
+        n = min(rnd.randint(1, 4), rules - i)
+        if rnd.random() < special:
+            subtokens = []
+            for j in range(i, i + n):
+                pattern, word = make_rule(rnd, j, literal)
+                subtokens.append(f'        S{j} r"{pattern}" #{rnd.randrange(1 << 24):06X}')
+                words.append(word)
+            blocks.append(f"T{i} {{\n    Special [\n" + ",\n".join(subtokens) + "\n    ]\n}")
+        else:
+            n = 1
+            pattern, word = make_rule(rnd, i, literal)
+            words.append(word)
+            blocks.append(f'T{i} {{\n    Normal r"{pattern}" #{rnd.randrange(1 << 24):06X}\n}}')
+        i += n
+    return "\n".join(blocks), words
+
+def make_rule(rnd, i, literal):
+    if rnd.random() < literal:
+        word = f"kw{i}x"
+        return word, word
+    return rf"r{i}_[a-z]+\d*", f"r{i}_{'abc'[:rnd.randint(1, 3)]}{rnd.randint(0, 99)}"
+
+def make_input(words, size, seed=0):
+    # random words and separators, a 64K piece repeated up to `size`
+    rnd = random.Random(seed)
+    parts = []
+    length = 0
+    while length < min(size, 1 << 16):
+        part = rnd.choice(words) + rnd.choice("  \n\t(),;")
+        parts.append(part)
+        length += len(part)
+    piece = "".join(parts)
+    return (piece * (size // len(piece) + 1))[:size]
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def import_time(module):
+    """
+    Seconds `import module` takes in a fresh interpreter (from -X importtime,
+    so interpreter startup isn't counted), and whether it pulled in PySide6.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    seconds = 0.0
+    qt = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            seconds = int(cumulative) / 1e6
+        qt = qt or name.strip().startswith("PySide6")
+    return seconds, qt
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": sys.version.split()[0], "platform": platform.platform(),
+            "machine": platform.machine(), "cpus": os.cpu_count(), "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def run(grammars, sizes, repeat, highlight=True):
+    results = {}
+    def record(name, seconds, **extra):
+        results[name] = {"seconds": seconds, **extra}
+        print(f"{name:<48} {seconds * 1000:10.3f} ms", file=sys.stderr)
+
+    for module in ["tokenparser.all"] + (["tokenparser.highlighter"] if highlight else []):
+        seconds, qt = import_time(module)
+        record(f"import/{module}", seconds, qt=qt)
+
+    if highlight:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PySide6.QtWidgets import QApplication # type: ignore
+        from PySide6.QtGui import QTextDocument # type: ignore
+        from tokenparser.highlighter import metaclass_LexerTestHighlighter, metaclass_LexerStreamHighlighter
+        app = QApplication.instance() or QApplication([])
+
+    for rules, literal, special in grammars:
+        grammar = f"{rules}r-{literal:g}lit-{special:g}sp"
+        description, words = make_grammar(rules, literal, special)
+        lexed = Lexer(description).tokenize()
+        parsed = Parser(lexed).parse()
+        organized = organize_pattern(parsed)
+        record(f"tokenize/{grammar}", timed(lambda: Lexer(description).tokenize(), repeat), bytes=len(description))
+        record(f"parse/{grammar}", timed(lambda: Parser(lexed).parse(), repeat))
+        record(f"organize/{grammar}", timed(lambda: organize_pattern(parsed), repeat))
+        engines = {kind: compile_engine(organized, kind) for kind in ("rules", "combined", "dispatch", "dfa")}
+        # what folding literal rules (tokenparser.fold) gains
+        engines["dispatch-unfolded"] = DispatchEngine(organized, fold=False)
+
+        for size in sizes:
+            text = make_input(words, parse_size(size))
+            case = f"{grammar}/{size}"
+            # inputs past HIGHLIGHT_LIMIT are lexed once per engine, whichever
+            # it is: at that size one run is long enough to time
+            count = repeat if len(text) <= HIGHLIGHT_LIMIT else 1
+            for kind, engine in engines.items():
+                tokens = use(organized, text, engine)
+                record(f"use[{kind}]/{case}", timed(lambda: use(organized, text, engine), count),
+                       bytes=len(text), tokens=len(tokens) - 1)
+            rnd = random.Random(0)
+            lines = len(tokens.index)
+            points = [(rnd.randint(1, lines), rnd.randint(1, 80)) for _ in range(LOOKUPS)]
+            def lookups():
+                for line, column in points:
+                    coord_token(tokens, line, column)
+            record(f"coord_token/{case}", timed(lookups, repeat), lookups=LOOKUPS)
+
+            if highlight and len(text) <= HIGHLIGHT_LIMIT:
+                document = QTextDocument()
+                document.setPlainText(text)
+                blocks = document.blockCount()
+                highlighter = metaclass_LexerTestHighlighter(organized)(document)
+                record(f"highlight[regex]/{case}", timed(highlighter.rehighlight, repeat), blocks=blocks)
+                highlighter.setDocument(None)
+                highlighter = metaclass_LexerStreamHighlighter(organized)(document)
+                highlighter.set_tokens(tokens)
+                record(f"highlight[stream]/{case}", timed(highlighter.rehighlight, repeat), blocks=blocks)
+                highlighter.setDocument(None)
+    return results
+
+def compare(results, baseline, threshold):
+    """Prints the change of every case in both runs; returns the regressions."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["seconds"], result["seconds"]
+        ratio = after / before if before else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<48} {before * 1000:10.3f} -> {after * 1000:10.3f} ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+def main(argv=None) -> int:
+    args = argparse.ArgumentParser(description="Benchmark the lexer pipeline.")
+    args.add_argument("-o", "--output", help="write results as JSON here")
+    args.add_argument("--compare", help="JSON results of an earlier run")
+    args.add_argument("--threshold", type=float, default=0.10, help="slowdown flagged as a regression (0.10 = 10%%)")
+    args.add_argument("--sizes", default=",".join(SIZES), help="input sizes, e.g. 1K,64K,1M,100M")
+    args.add_argument("--rules", help="only grammars with these rule counts, e.g. 10,100")
+    args.add_argument("--repeat", type=int, default=5)
+    args.add_argument("--no-highlight", action="store_true", help="skip the Qt highlighters")
+    args = args.parse_args(argv)
+
+    grammars = GRAMMARS
+    if args.rules:
+        counts = {int(count) for count in args.rules.split(",")}
+        grammars = [grammar for grammar in GRAMMARS if grammar[0] in counts]
+    results = run(grammars, args.sizes.split(","), args.repeat, not args.no_highlight)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,21 @@
 import sys, os
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,  # type: ignore
                                QHBoxLayout, QPushButton, QTabWidget, QLabel, QFrame, QTreeView,
-                               QSplitter, QPlainTextEdit, QStackedWidget, QFileSystemModel, QStatusBar)
-from PySide6.QtCore import Qt, QDir, QPoint, Signal, QEvent # type: ignore 
-from PySide6.QtGui import QFont, QTextCursor # type: ignore
+                               QSplitter, QPlainTextEdit, QStackedWidget, QFileSystemModel, QStatusBar,
+                               QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView, QTreeWidget, QTreeWidgetItem)
+from PySide6.QtCore import Qt, QDir, QPoint, Signal, QEvent, QObject, QRunnable, QThreadPool, QTimer # type: ignore 
+from PySide6.QtGui import QFont, QTextCursor, QTextLayout # type: ignore
 
 # Assumes tokenparser package exists as per your import
-from tokenparser.all import TokenDescHighlighter, metaclass_LexerTextHighlighter, organizer, lexer, coord_token
+from tokenparser.all import (TokenDescHighlighter, metaclass_LexerTextHighlighter, metaclass_LexerStreamHighlighter,
+                             coord_token, grammar_cache)
+from tokenparser.grammar import GrammarModel
+from tokenparser.incremental import IncrementalLexer
+from tokenparser.lazy import LazyLexer
+from tokenparser.peg import PackratParser, ParseError, spans
+from tokenparser.profiling import RuleProfile, profiled
+from tokenparser.stream import color_changes
+from tokenparser.use import rule_names
 
 code = """
 Identifier {
@@ -33,6 +42,16 @@ Color {
 }
 """.strip()
 
+# parse grammar (tokenparser.peg) of the test text, over the tokens of `code`
+parse_code = """
+Grammar    <- Block*
+Block      <- Identifier[Token] "{" Definition* "}"
+Definition <- Normal / Special
+Normal     <- "Normal" String Color?
+Special    <- "Special" "[" Subtoken+ "]" Color?
+Subtoken   <- Identifier String Color?
+""".strip()
+
 class ActivityButton(QPushButton):
     def __init__(self, text, active=False):
         super().__init__(text)
@@ -69,7 +88,104 @@ class HoverPlainTextEdit(QPlainTextEdit):
         col = cursor.columnNumber() + 1
         self.cursorChange.emit(line, col)
 
+class LexSignals(QObject):
+    # revision, (organized, incremental lexer, RuleProfile or None, parse tree, ParseError message or None)
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+
+class LexJob(QRunnable):
+    """
+    Compiles the definition and lexes the test text of one document
+    revision on a pool thread. With a base lexer for the same grammar and
+    the edit span since its text, only the edit is re-lexed. With
+    `profile`, the whole text is lexed with a profiled engine instead.
+    With `lazy`, only the grammar and its engine are built; the window
+    lexes a lazy document itself, as it is shown. With a `parser`, the
+    tokens are then parsed with `parse_grammar`.
+    """
+    def __init__(self, revision, latest, grammar, description, text, base, span, profile=False, kind='dispatch', lazy=False,
+                 parser=None, parse_grammar=None):
+        super().__init__()
+        self.signals = LexSignals()
+        self.revision = revision
+        self.latest = latest
+        self.grammar = grammar
+        self.description = description
+        self.text = text
+        self.base = base
+        self.span = span
+        self.profile = profile
+        self.kind = kind
+        self.lazy = lazy
+        self.parser = parser
+        self.parse_grammar = parse_grammar
+
+    def stale(self):
+        return self.latest() != self.revision
+
+    def run(self):
+        if self.stale():
+            return
+        try:
+            organized = self.grammar.update(self.description)
+            if self.stale():
+                return
+            profile = None
+            if self.lazy:
+                self.grammar.engine(self.kind)
+                incremental = None
+            elif self.profile:
+                engine = self.grammar.engine(self.kind)
+                profile = RuleProfile(organized)
+                incremental = IncrementalLexer(organized, self.text, profiled(engine, profile))
+                incremental.engine = engine
+                profile.count(incremental.tokens)
+            elif (self.base is not None and self.base.patternpair is organized and self.span is not None
+                  and self.base.engine is self.grammar.engine(self.kind)):
+                incremental = self.base.copy()
+                start, old_end, new_end = self.span
+                incremental.edit(self.text, start, old_end - start, new_end - start)
+            elif (self.base is not None and self.base.patternpair is organized and self.span is None
+                  and self.base.engine is self.grammar.engine(self.kind) and self.base.text == self.text):
+                incremental = self.base # only the parse grammar changed
+            else:
+                incremental = IncrementalLexer(organized, self.text, self.grammar.engine(self.kind))
+        except Exception as e:
+            self.signals.failed.emit(self.revision, str(e))
+            return
+        tree = error = None
+        if self.parser is not None and incremental is not None and not self.stale():
+            base = self.base.tokens if self.base is not None and incremental is not self.base else None
+            try:
+                tree = self.parser.parse(incremental.tokens, base, incremental.relexed, self.parse_grammar)
+            except ParseError as e:
+                error = str(e)
+        self.signals.finished.emit(self.revision, (organized, incremental, profile, tree, error))
+
+def merge_span(span, position, removed, added):
+    """
+    Folds one more contentsChange into `span`, the (start, old end, new end)
+    of everything that changed since the text the lexer last saw.
+    """
+    if span is None:
+        return position, position + removed, position + added
+    start, old_end, new_end = span
+    end = max(new_end, position + removed)
+    return min(start, position), old_end + end - new_end, end + added - removed
+
 class IDEWindow(QMainWindow):
+    debounce_ms = 150
+    profile_columns = ["Rule", "Category", "Tries", "Hits", "ms", "Chars"]
+    # color test_edit from the lexer's tokens rather than re-matching rules per block
+    highlight_from_tokens = True
+    # tokenparser.engine.engines: 'rules', 'combined', 'dispatch' or 'dfa'
+    lex_engine = 'dispatch'
+    # longer test texts are lexed lazily: what is shown first, the rest
+    # a few ms at a time when idle
+    lazy_chars = 1 << 20
+    lazy_margin = 1 << 14
+    fill_seconds = 0.01
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("MetaSyntax")
@@ -93,11 +209,37 @@ class IDEWindow(QMainWindow):
         # Highlighter Initialization & Signal Connection
         self.hl_def = TokenDescHighlighter(self.def_edit.document())
         self.hl_test = None
-        self.update_test_highlighter() # Initial build
+        # only touched by update_lexer() and then by the lexing thread
+        self.grammar = GrammarModel(grammar_cache)
+        self.parser = PackratParser() # only touched by the lexing thread
+        self.update_lexer() # Initial build
+        self.update_test_highlighter()
+
+        # Lexing runs on a pool thread, a short while after the last edit.
+        # Every edit bumps the revision; results for older ones are dropped.
+        self.revision = 0
+        self.pending_span = None
+        self.lex_pool = QThreadPool(self)
+        self.lex_pool.setMaxThreadCount(1)
+        self.lex_timer = QTimer(self)
+        self.lex_timer.setSingleShot(True)
+        self.lex_timer.setInterval(self.debounce_ms)
+        self.lex_timer.timeout.connect(self.start_lex_job)
+
+        # lazy mode: test_edit is colored block by block as it scrolls
+        # into view, without the highlighter (it would visit every block)
+        self.lazy = False
+        self.painted = 0 # blocks whose userState is this are up to date
+        self.fill_timer = QTimer(self)
+        self.fill_timer.timeout.connect(self.fill_step)
+        self.test_edit.updateRequest.connect(self.paint_viewport)
 
         # Re-build test highlighter when definition changes
-        self.def_edit.textChanged.connect(self.update_test_highlighter)
-        self.test_edit.textChanged.connect(self.update_lexer)
+        self.def_edit.textChanged.connect(self.schedule_lex)
+        self.test_edit.document().contentsChange.connect(self.update_lexer_edit)
+        self.peg_edit.textChanged.connect(self.schedule_lex)
+        self.parse_tree.itemExpanded.connect(self.expand_parse_item)
+        self.schedule_lex() # fills the Parsing tab
     
     def update_info_panel(self, line, col):
         selected = coord_token(self.lexed, line, col)
@@ -150,12 +292,39 @@ class IDEWindow(QMainWindow):
         print(model.rootPath())
         file_tree.setModel(model)
         model.setRootPath("..")
+        self.file_model = model
+        file_tree.doubleClicked.connect(self.open_file)
         file_layout.addWidget(file_tree)
         self.sidebar_stack.addWidget(file_panel)
 
-        # --- Panels 1 & 2: Empty Placeholders (G, D) ---
+        # --- Panel 1: Empty Placeholder (G) ---
         self.sidebar_stack.addWidget(QLabel("GIT/VERSION CONTROL"))
-        self.sidebar_stack.addWidget(QLabel("DEBUG VIEW"))
+
+        # --- Panel 2: Debug View (D), per-rule profile of the last lex ---
+        debug_panel = QWidget()
+        debug_layout = QVBoxLayout(debug_panel)
+        debug_layout.setContentsMargins(10, 5, 10, 5)
+        debug_layout.addWidget(QLabel("DEBUG VIEW"))
+        self.profile_check = QCheckBox("Profile rules")
+        self.profile_check.setStyleSheet("color: #d4d4d4;")
+        self.profile_check.toggled.connect(self.toggle_profile)
+        debug_layout.addWidget(self.profile_check)
+        self.profile_table = QTableWidget(0, len(self.profile_columns))
+        self.profile_table.setHorizontalHeaderLabels(self.profile_columns)
+        self.profile_table.setSortingEnabled(True)
+        self.profile_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.profile_table.verticalHeader().setVisible(False)
+        self.profile_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.profile_table.setStyleSheet("color: #d4d4d4; font-size: 11px;")
+        debug_layout.addWidget(self.profile_table)
+        self.profile_skipped = QLabel()
+        self.profile_skipped.setStyleSheet("color: #969696; font-size: 11px;")
+        debug_layout.addWidget(self.profile_skipped)
+        self.folded_label = QLabel()
+        self.folded_label.setWordWrap(True)
+        self.folded_label.setStyleSheet("color: #969696; font-size: 11px;")
+        debug_layout.addWidget(self.folded_label)
+        self.sidebar_stack.addWidget(debug_panel)
 
         main_sidebar_layout = QVBoxLayout(sidebar_frame)
         main_sidebar_layout.addWidget(self.sidebar_stack)
@@ -246,7 +415,30 @@ class IDEWindow(QMainWindow):
 
         token_layout.addWidget(h_split)
         tabs.addTab(token_widget, "Tokens")
-        tabs.addTab(QWidget(), "Parsing")
+
+        # Parsing Tab: parse grammar on the left, tree of the test text on the right
+        parse_split = QSplitter(Qt.Horizontal)
+        parse_split.setHandleWidth(1)
+        parse_split.setStyleSheet("QSplitter::handle { background-color: #3e3e42; }")
+        self.peg_edit = self._create_editor(parse_code)
+
+        tree_panel = QWidget()
+        tree_panel.setStyleSheet("background-color: #252526;")
+        tree_layout = QVBoxLayout(tree_panel)
+        tree_layout.setContentsMargins(0, 0, 0, 0)
+        self.parse_tree = QTreeWidget()
+        self.parse_tree.setHeaderLabels(["Node", "Text", "Line:Col"])
+        self.parse_tree.setStyleSheet("color: #d4d4d4; font-size: 12px; border: none;")
+        tree_layout.addWidget(self.parse_tree)
+        self.parse_status = QLabel()
+        self.parse_status.setWordWrap(True)
+        self.parse_status.setStyleSheet("color: #969696; font-size: 11px; padding: 2px 5px;")
+        tree_layout.addWidget(self.parse_status)
+
+        parse_split.addWidget(self.peg_edit)
+        parse_split.addWidget(tree_panel)
+        parse_split.setSizes([400, 500])
+        tabs.addTab(parse_split, "Parsing")
         self.main_layout.addWidget(tabs)
 
     def _create_editor(self, text):
@@ -258,21 +450,304 @@ class IDEWindow(QMainWindow):
         return edit
     
     def update_lexer(self):
-        self.organized = organizer(self.def_edit.toPlainText())
-        self.lexed = lexer(self.organized, self.test_edit.toPlainText())
+        self.organized = self.grammar.update(self.def_edit.toPlainText())
+        self.incremental = IncrementalLexer(self.organized, self.test_edit.toPlainText(), self.grammar.engine(self.lex_engine))
+        self.lexed = self.incremental.tokens
+        self.show_folded()
         print("lexer updated")
+
+    def update_lexer_edit(self, position, removed, added):
+        """Queues a re-lex around an edit of test_edit (QTextDocument.contentsChange)."""
+        if self.lazy:
+            self.lazy_edit(position, removed, added)
+            return
+        self.pending_span = merge_span(self.pending_span, position, removed, added)
+        self.schedule_lex()
+
+    def schedule_lex(self):
+        self.revision += 1
+        self.lex_timer.start()
+
+    def start_lex_job(self):
+        self.lex_pool.clear() # drop jobs that haven't started yet
+        if self.lazy: # only the grammar, apply_lex() starts the lazy lexer over
+            job = LexJob(self.revision, lambda: self.revision, self.grammar, self.def_edit.toPlainText(),
+                         "", None, None, kind=self.lex_engine, lazy=True)
+        else:
+            job = LexJob(self.revision, lambda: self.revision, self.grammar, self.def_edit.toPlainText(),
+                         self.test_edit.toPlainText(), self.incremental, self.pending_span,
+                         self.profile_check.isChecked(), self.lex_engine,
+                         parser=self.parser, parse_grammar=self.peg_edit.toPlainText())
+        job.signals.finished.connect(self.apply_lex)
+        job.signals.failed.connect(self.lex_failed)
+        self.lex_pool.start(job)
+
+    def apply_lex(self, revision, result):
+        if revision != self.revision:
+            return
+        if self.lazy:
+            organized = result[0]
+            if organized is not self.organized:
+                self.organized = organized
+                self.hl_test.set_rules(organized)
+                # no job is running now, the engine was built by this one
+                engine = self.grammar.engine(self.lex_engine)
+                self.incremental = self.lexed = LazyLexer(organized, self.incremental.text, engine)
+                self.repaint_lazy()
+                self.show_folded()
+            return
+        organized, self.incremental, profile, tree, error = result
+        old, span = self.lexed, self.pending_span
+        self.lexed = self.incremental.tokens
+        self.pending_span = None
+        if profile is not None:
+            self.show_profile(profile)
+        if self.highlight_from_tokens:
+            self.refresh_test_highlighter(old, organized, span)
+            self.organized = organized
+        elif organized is not self.organized:
+            self.organized = organized
+            self.update_test_highlighter()
+        self.show_folded()
+        self.show_parse(tree, error)
+
+    def refresh_test_highlighter(self, old, organized, span):
+        """
+        Gives the stream highlighter the new tokens and rules, and
+        rehighlights only the blocks whose colors differ from `old`.
+        """
+        old_colors = self.hl_test.colors
+        if organized is not self.organized:
+            self.hl_test.set_rules(organized)
+        edit = None
+        if span is not None:
+            start, old_end, new_end = span
+            edit = (start, old_end - start, new_end - start)
+        ranges = color_changes(old, self.lexed, old_colors, self.hl_test.colors, edit, self.incremental.relexed)
+        if span is not None:
+            # Qt colored the edited blocks with the old tokens when the
+            # edit was made, the block the edit ends in too
+            ranges.append((new_end, new_end + 1))
+        self.hl_test.set_tokens(self.lexed)
+        self.hl_test.refresh(ranges)
+
+    def open_file(self, index):
+        """Loads a file double-clicked in the File Explorer into test_edit."""
+        if self.file_model.isDir(index):
+            return
+        path = self.file_model.filePath(index)
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError as e:
+            print(f"Can't open {path}: {e}")
+            return
+        self.load_test_text(text)
+
+    def load_test_text(self, text):
+        """
+        Replaces the test text. One over lazy_chars is lexed lazily and
+        colored as it comes into view, so the first screen doesn't wait
+        for the whole text.
+        """
+        document = self.test_edit.document()
+        if not (self.highlight_from_tokens and len(text) > self.lazy_chars):
+            if self.lazy: # back to the highlighter, the next lex colors everything
+                self.lazy = False
+                self.fill_timer.stop()
+                self.incremental = None
+                self.hl_test.set_tokens(None)
+                self.hl_test.setDocument(document)
+            self.test_edit.setPlainText(text)
+            return
+        self.revision += 1 # drop lexing of the old text
+        self.lex_timer.stop()
+        self.pending_span = None
+        if not self.lazy:
+            self.hl_test.setDocument(None)
+        # a job still running may be updating the grammar, which is only
+        # used from one thread at a time; being stale now, it stops soon
+        self.lex_pool.clear()
+        self.lex_pool.waitForDone()
+        engine = self.grammar.engine(self.lex_engine)
+        document.contentsChange.disconnect(self.update_lexer_edit)
+        try:
+            self.test_edit.setPlainText(text)
+        finally:
+            document.contentsChange.connect(self.update_lexer_edit)
+        self.lazy = True
+        self.incremental = self.lexed = LazyLexer(self.organized, document.toPlainText(), engine)
+        self.repaint_lazy()
+        self.parse_tree.clear()
+        self.parse_status.setText("Not parsed: the text is lexed lazily")
+
+    def lazy_edit(self, position, removed, added):
+        """Moves the lazy lexer over an edit of test_edit and recolors the view."""
+        cursor = QTextCursor(self.test_edit.document())
+        cursor.setPosition(position)
+        cursor.setPosition(position + added, QTextCursor.KeepAnchor)
+        inserted = cursor.selectedText().replace("\u2029", "\n") # Qt's paragraph separator
+        text = self.incremental.text
+        self.incremental.edit(text[:position] + inserted + text[position + removed:], position, removed, added)
+        self.repaint_lazy()
+
+    def repaint_lazy(self):
+        # the tokens changed: every block is to be painted again, the
+        # visible ones now, and the rest lexed when idle
+        self.painted += 1
+        self.paint_viewport()
+        if not self.incremental.done:
+            self.fill_timer.start()
+
+    def visible_blocks(self):
+        edit = self.test_edit
+        offset = edit.contentOffset()
+        height = edit.viewport().height()
+        blocks = []
+        block = edit.firstVisibleBlock()
+        while block.isValid() and edit.blockBoundingGeometry(block).translated(offset).top() <= height:
+            blocks.append(block)
+            block = block.next()
+        return blocks
+
+    def paint_viewport(self, *_):
+        """Lexes and colors the blocks of test_edit in view (lazy mode)."""
+        if not self.lazy:
+            return
+        blocks = self.visible_blocks()
+        if not blocks:
+            return
+        lexer = self.incremental
+        start, end = blocks[0].position(), blocks[-1].position() + blocks[-1].length()
+        lexer.window(max(start - self.lazy_margin, 0), end + self.lazy_margin)
+        document = self.test_edit.document()
+        formats = self.hl_test.formats
+        for block in blocks:
+            if block.userState() == self.painted:
+                continue
+            block_start = block.position()
+            block_end = block_start + block.length() - 1
+            ranges = []
+            for token_start, token_end, rule in lexer.overlapping(block_start, block_end):
+                format = formats.get(rule)
+                if format is not None:
+                    token_start = max(token_start, block_start)
+                    format_range = QTextLayout.FormatRange()
+                    format_range.start = token_start - block_start
+                    format_range.length = min(token_end, block_end) - token_start
+                    format_range.format = format
+                    ranges.append(format_range)
+            block.layout().setFormats(ranges)
+            block.setUserState(self.painted)
+            document.markContentsDirty(block_start, block.length())
+
+    def fill_step(self):
+        """Lexes a little more of a lazy text; runs whenever the GUI is idle."""
+        lexer = self.incremental
+        if not self.lazy or lexer.done:
+            self.fill_timer.stop()
+            return
+        before = lexer.end
+        lexer.fill(self.fill_seconds)
+        blocks = self.visible_blocks()
+        if blocks and before < blocks[-1].position() + blocks[-1].length() and lexer.end > blocks[0].position():
+            # the prefix went over the view, its tokens may differ from the island's
+            self.painted += 1
+            self.paint_viewport()
+
+    def toggle_profile(self, checked):
+        if checked:
+            self.schedule_lex()
+        else:
+            self.profile_table.setRowCount(0)
+            self.profile_skipped.clear()
+
+    def show_profile(self, profile):
+        """Fills the Debug View table from a RuleProfile."""
+        table = self.profile_table
+        table.setSortingEnabled(False) # rows would move while being filled
+        rows = profile.rows()
+        table.setRowCount(len(rows))
+        for row, (token, category, subtoken, attempts, matches, seconds, chars) in enumerate(rows):
+            name = f"{token}[{subtoken}]" if subtoken else token
+            values = [name, category, attempts, matches, round(seconds * 1000, 3), chars]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem()
+                item.setData(Qt.DisplayRole, value) # numbers sort as numbers
+                table.setItem(row, column, item)
+        table.setSortingEnabled(True)
+        self.profile_skipped.setText(f"Unmatched: {profile.skipped} chars")
+
+    def show_folded(self):
+        """Lists the literal rules the engine looks up at once (tokenparser.fold)."""
+        names = rule_names(self.organized)
+        folded = ", ".join(names[index][0] for index in getattr(self.incremental.engine, "folded", []))
+        self.folded_label.setText(f"Folded literals: {folded or 'none'}")
+
+    def show_parse(self, tree, error):
+        """
+        Shows the tree PackratParser.parse() gave for self.lexed in the
+        Parsing tab. On an error the last tree stays, under the message.
+        Items get their children when first expanded.
+        """
+        if error is not None:
+            self.parse_status.setText(error)
+            return
+        if tree is None:
+            return
+        self.parse_tree.clear()
+        self.parse_tokens = self.lexed
+        self.parse_tree.addTopLevelItem(self.parse_item(tree, 0))
+        self.parse_status.setText(f"Parsed {tree.length} tokens")
+
+    def parse_item(self, node, first):
+        tokens = self.parse_tokens
+        unknown = len(tokens.names) - 1
+        start, last = first, first + node.length - 1
+        while start <= last and tokens.rules[start] == unknown:
+            start += 1 # UNKNOWN tokens skipped before the first one taken
+        name = node.name if node.name is not None else tokens.names[tokens.rules[last]][0]
+        text = where = ""
+        if start <= last:
+            offset = tokens.starts[start]
+            text = tokens.text[offset:tokens.ends[last]].split("\n", 1)[0][:60]
+            line, column = tokens.index.coords(offset)
+            where = f"{line}:{column}"
+        item = QTreeWidgetItem([name, text, where])
+        if node.children:
+            item.setData(0, Qt.UserRole, (node, first))
+            item.addChild(QTreeWidgetItem()) # placeholder, so it can be expanded
+        return item
+
+    def expand_parse_item(self, item):
+        data = item.data(0, Qt.UserRole)
+        if data is None or item.child(0).text(0):
+            return
+        node, first = data
+        item.takeChildren()
+        item.addChildren([self.parse_item(child, start) for child, start in spans(node, first)])
+
+    def lex_failed(self, revision, message):
+        if revision == self.revision:
+            # Prevents crash if regex/def is temporarily invalid while typing
+            print(f"Highlighter update skipped: {message}")
+
     def update_test_highlighter(self):
         """Recreates the test highlighter based on current definitions."""
 
         try:
             # Generate new Class from current text and Instantiate
-            self.update_lexer()
-            GeneratedHighlighter = metaclass_LexerTextHighlighter(self.organized)
+            if self.highlight_from_tokens:
+                GeneratedHighlighter = metaclass_LexerStreamHighlighter(self.organized)
+            else:
+                GeneratedHighlighter = metaclass_LexerTextHighlighter(self.organized)
             if self.hl_test:
                 self.hl_test.setDocument(None)
                 self.hl_test.deleteLater()
                 self.hl_test = None
             self.hl_test = GeneratedHighlighter(self.test_edit.document())
+            if self.highlight_from_tokens:
+                self.hl_test.set_tokens(self.lexed)
             
             # Force refresh
             self.test_edit.document().markContentsDirty(0, self.test_edit.document().characterCount())
@@ -282,6 +757,7 @@ class IDEWindow(QMainWindow):
             print(f"Highlighter update skipped: {e}")
 
 if __name__ == "__main__":
+    grammar_cache.directory = os.path.join(os.path.expanduser("~"), ".cache", "metasyntax")
     app = QApplication(sys.argv)
     window = IDEWindow()
     window.show()
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from tokenparser.grammar import GrammarModel
+
+# the description main.py opens with
+DESCRIPTION = r'''
+Identifier {
+    Normal r"[a-zA-Z_][a-zA-Z_0-9]*" #9CDCFE
+    Special [
+        Token r"[a-zA-Z_][a-zA-Z_0-9]*\b(?=\s*\{)" #DCDCAA,
+        Special r"Special" #C586C0,
+        Normal r"Normal" #C586C0
+    ]
+}
+Symbol {
+    Special [
+        LeftBrace r"\{",
+        RightBrace r"\}",
+        LeftBracket r"\[",
+        RightBracket r"\]"
+    ] #FFFFFF
+}
+String {
+    Normal r"r\"([^\"\\]|\\[\s\S])*\"" #6A9955
+}
+Color {
+    Normal r"#[0-9a-fA-F]{6}" #CE6021
+}
+'''.strip()
+
+# pieces random texts and edits are made of: the description's own
+# tokens, and the characters that open, close and break them
+PIECES = ["Normal", "Special", "abc", "x1", "{", "}", "[", "]", 'r"', '"', "\\", "#", "C586C0",
+          " ", "  ", "\n", "\n\n", ",", "/*", "*/"]
+
+
+@pytest.fixture(scope="session")
+def patternpair():
+    return GrammarModel().update(DESCRIPTION)
+
+
+def random_text(rnd: random.Random, size: int) -> str:
+    return "".join(rnd.choice(PIECES) for _ in range(size))
+
+
+def random_edits(rnd: random.Random, text: str, count: int):
+    """Yields (new text, position, removed, added) of `count` edits in a row."""
+    for _ in range(count):
+        position = rnd.randrange(len(text) + 1)
+        removed = rnd.randrange(min(6, len(text) - position) + 1)
+        inserted = random_text(rnd, rnd.randrange(3))
+        text = text[:position] + inserted + text[position + removed:]
+        yield text, position, removed, len(inserted)
+
+
+def columns(tokens, count=None):
+    # (rules, starts, ends) of a TokenStream, of its first `count` tokens
+    return list(tokens.rules[:count]), list(tokens.starts[:count]), list(tokens.ends[:count])
@@ -0,0 +1,57 @@
+import json
+import os
+import pickle
+
+import pytest
+from conftest import DESCRIPTION
+
+from tokenparser.all import build
+from tokenparser.cache import VERSION, GrammarCache
+
+
+def descriptions(count):
+    return [DESCRIPTION + "\n" * i for i in range(count)]
+
+
+def unused(description):
+    raise AssertionError("built again")
+
+
+def test_stored_as_json(tmp_path, patternpair):
+    cache = GrammarCache(directory=str(tmp_path))
+    assert cache.get(DESCRIPTION, build) == patternpair
+    with open(cache.path(cache.key(DESCRIPTION)), encoding="utf-8") as f:
+        assert json.load(f)["version"] == VERSION
+    # another process reads it back instead of building
+    assert GrammarCache(directory=str(tmp_path)).get(DESCRIPTION, unused) == patternpair
+
+
+@pytest.mark.parametrize("data", [
+    b"\x80not json",
+    pickle.dumps((1, [])),
+    json.dumps({"version": VERSION, "rules": [["(", 0, "A", "B", "", ""]]}).encode(),
+    json.dumps({"version": VERSION, "rules": [["a", 0]]}).encode(),
+    json.dumps({"version": VERSION - 1, "rules": []}).encode(),
+    json.dumps([]).encode(),
+])
+def test_bad_entry_is_a_miss(tmp_path, patternpair, data):
+    cache = GrammarCache(directory=str(tmp_path))
+    path = cache.path(cache.key(DESCRIPTION))
+    with open(path, "wb") as f:
+        f.write(data)
+    assert cache.load(cache.key(DESCRIPTION)) is None
+    assert not os.path.exists(path)
+    assert cache.get(DESCRIPTION, build) == patternpair
+
+
+def test_directory_keeps_maxsize(tmp_path):
+    first, second, third = descriptions(3)
+    cache = GrammarCache(maxsize=2, directory=str(tmp_path))
+    cache.get(first, build)
+    cache.get(second, build)
+    os.utime(cache.path(cache.key(first)), ns=(1, 1))
+    os.utime(cache.path(cache.key(second)), ns=(2, 2))
+    # a load counts as a use, so `second` is the least recently used
+    assert GrammarCache(directory=str(tmp_path)).load(cache.key(first)) is not None
+    cache.get(third, build)
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{cache.key(d)}.grammar" for d in (first, third))
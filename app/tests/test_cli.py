@@ -0,0 +1,125 @@
+import json
+import os
+import struct
+
+import pytest
+from conftest import DESCRIPTION, columns
+
+from tokenparser import cli
+from tokenparser.all import organizer
+from tokenparser.use import rule_names, use
+
+TEXTS = {
+    "a.txt": DESCRIPTION,
+    "b.txt": "Normal { x } Special [",
+    "c.txt": "",
+    "sub/d.txt": DESCRIPTION.replace("Normal", "Special"),
+}
+
+
+@pytest.fixture
+def files(tmp_path):
+    grammar = tmp_path / "grammar.txt"
+    grammar.write_text(DESCRIPTION, encoding="utf-8")
+    for name, text in TEXTS.items():
+        path = tmp_path / "in" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+    return str(grammar), str(tmp_path / "in")
+
+
+def expected(name):
+    tokens = use(organizer(DESCRIPTION), TEXTS[name])
+    return columns(tokens)
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        header, *records = map(json.loads, f)
+    return header, records
+
+
+def read_binary(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data.startswith(cli.MAGIC)
+    at = len(cli.MAGIC)
+    size, = struct.unpack_from("<I", data, at)
+    names = json.loads(data[at + 4:at + 4 + size])
+    at += 4 + size
+    records = []
+    while at < len(data):
+        name_length, count, error_length = cli.record.unpack_from(data, at)
+        at += cli.record.size
+        path = data[at:at + name_length].decode("utf-8")
+        at += name_length + error_length
+        rules = list(struct.unpack_from(f"<{count}i", data, at))
+        starts = list(struct.unpack_from(f"<{count}q", data, at + 4 * count))
+        ends = list(struct.unpack_from(f"<{count}q", data, at + 12 * count))
+        at += 20 * count
+        records.append((path, (rules, starts, ends)))
+    return names, records
+
+
+def relative(path, root):
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("engine", ["dispatch", "dfa"])
+def test_jsonl_in_order(files, tmp_path, jobs, engine):
+    grammar, root = files
+    out = str(tmp_path / "out.jsonl")
+    assert cli.main([grammar, root, "-j", str(jobs), "--engine", engine, "-o", out, "--chunksize", "1"]) == 0
+    header, records = read_jsonl(out)
+    assert header == {"rules": json.loads(json.dumps(rule_names(organizer(DESCRIPTION))))}
+    assert [relative(record["path"], root) for record in records] == sorted(TEXTS)
+    for record in records:
+        rules, starts, ends = expected(relative(record["path"], root))
+        assert record["tokens"] == [list(token) for token in zip(rules, starts, ends)]
+
+
+@pytest.mark.parametrize("mapped", [False, True])
+def test_binary_unordered(files, tmp_path, mapped):
+    grammar, root = files
+    out = str(tmp_path / "out.bin")
+    argv = [grammar, root, "-j", "2", "-f", "binary", "--unordered", "--check", "-o", out, "--chunksize", "1"]
+    assert cli.main(argv + ["--mmap"] * mapped) == 0
+    names, records = read_binary(out)
+    assert names == json.loads(json.dumps(rule_names(organizer(DESCRIPTION))))
+    assert sorted(relative(path, root) for path, _ in records) == sorted(TEXTS)
+    for path, tokens in records:
+        assert tokens == expected(relative(path, root)) # the texts are ASCII, bytes are characters
+
+
+def test_missing_file_fails(files, tmp_path):
+    grammar, root = files
+    out = str(tmp_path / "out.jsonl")
+    assert cli.main([grammar, os.path.join(root, "a.txt"), os.path.join(root, "nope.txt"), "-j", "1", "-o", out]) == 1
+    _, records = read_jsonl(out)
+    assert "tokens" in records[0] and "error" in records[1]
+
+
+@pytest.mark.parametrize("description", ['Word { Normal r"(" }', "Word { Normal", 'Word { Normal r"[é]" }'])
+def test_bad_grammar_exits(tmp_path, capsys, description):
+    grammar = tmp_path / "grammar.txt"
+    grammar.write_text(description, encoding="utf-8")
+    (tmp_path / "a.txt").write_text("x", encoding="utf-8")
+    argv = [str(grammar), str(tmp_path / "a.txt"), "-j", "2", "--mmap", "-o", str(tmp_path / "out")]
+    assert cli.main(argv) == 2
+    assert str(grammar) in capsys.readouterr().err
+
+
+def test_worker_failure_exits(files, tmp_path, monkeypatch, capsys):
+    grammar, root = files
+    parent = os.getpid()
+    compile_engine = cli.compile_engine
+
+    def fails_in_workers(*args):
+        if os.getpid() != parent:
+            raise MemoryError("out of memory")
+        return compile_engine(*args)
+
+    monkeypatch.setattr(cli, "compile_engine", fails_in_workers)
+    assert cli.main([grammar, root, "-j", "2", "-o", str(tmp_path / "out")]) == 2
+    assert "MemoryError: out of memory" in capsys.readouterr().err
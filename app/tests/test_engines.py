@@ -0,0 +1,49 @@
+import random
+import re
+
+import pytest
+from conftest import DESCRIPTION, random_text
+from test_incremental import COMMENTS, ODD
+
+from tokenparser.dfa import DFAEngine
+from tokenparser.engine import DispatchEngine, compile_engine, engines
+from tokenparser.use import conformance
+
+KEYWORDS = [(re.compile(source), name, "Keyword", "", "") for source, name in [
+    (r"[a-z]+", "Word"), (r"if", "If"), (r"in", "In"), (r"int", "Int"), (r"\{", "Open"), (r"\}", "Close"),
+    (r"\[\]", "Empty"), (r"\[", "Bracket"), (r"ab\b", "Ab"),
+]]
+
+
+def rule_sets(patternpair):
+    return {"description": patternpair, "comments": COMMENTS, "odd": ODD, "keywords": KEYWORDS}
+
+
+def texts(seed, count=150):
+    rnd = random.Random(seed)
+    yield DESCRIPTION
+    for _ in range(count):
+        yield random_text(rnd, rnd.randrange(80))
+
+
+@pytest.mark.parametrize("kind", sorted(engines))
+@pytest.mark.parametrize("rules", ["description", "comments", "odd", "keywords"])
+def test_engine_lexes_like_use(patternpair, rules, kind):
+    patternpair = rule_sets(patternpair)[rules]
+    engine = compile_engine(patternpair, kind)
+    for text in texts(f"{rules} {kind}"):
+        assert conformance(patternpair, text, engine) is None, text
+
+
+@pytest.mark.parametrize("rules", ["description", "keywords"])
+def test_dispatch_without_folding(patternpair, rules):
+    patternpair = rule_sets(patternpair)[rules]
+    engine = DispatchEngine(patternpair, fold=False)
+    for text in texts(rules):
+        assert conformance(patternpair, text, engine) is None, text
+
+
+def test_dfa_falls_back_for_what_it_cannot_run():
+    engine = DFAEngine(ODD)
+    assert engine.fallback # lookarounds, anchors, backreferences, case folding
+    assert len(engine.fallback) < len(ODD)
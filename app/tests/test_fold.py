@@ -0,0 +1,50 @@
+import random
+import re
+
+from test_engines import KEYWORDS
+
+from tokenparser.engine import DispatchEngine
+from tokenparser.fold import Literals, fold_literals
+
+RULES = [(re.compile(source), f"R{i}", "Normal", "", "") for i, source in enumerate([
+    r"[a-z]+", r"if", r"in", r"\d+", r"int", r"i", r"(?:fo)r", r"for", r"FOR(?i:x)",
+])]
+
+
+def tried(rules, text, pos):
+    # the rules tried in turn, as the engines do without folding
+    for index, match in rules:
+        m = match(text, pos)
+        if m:
+            return m if index is None else (index, m.end())
+    return None
+
+
+def test_literals_first_in_priority_wins():
+    literals = Literals([(7, "["), (6, "[]"), (5, "["), (4, "ab")])
+    assert literals.match("[]", 0) == (7, 1) # not the longest
+    assert literals.match("x[]", 1) == (7, 2)
+    assert literals.match("ab", 0) == (4, 2)
+    assert literals.match("a", 0) is None and literals.match("", 0) is None
+    assert literals.rules == [7, 6, 5, 4]
+
+
+def test_runs_stop_at_regex_rules():
+    rules = [(index, item[0].match) for index, item in reversed(list(enumerate(RULES)))]
+    folded_rules, folded = fold_literals(rules, RULES)
+    # FOR(?i:x) folds case, so isn't a literal; for, (?:fo)r, i and int
+    # are one run, \d+ ends it, in and if are the next
+    assert [index for index, _ in folded_rules] == [8, None, 3, None, 0]
+    assert sorted(folded) == [1, 2, 4, 5, 6, 7]
+    assert fold_literals(rules, RULES, least=3)[1] == [7, 6, 5, 4]
+    rnd = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rnd.choice(["i", "n", "t", "f", "o", "r", "FOR", "x", "1", " "]) for _ in range(6))
+        assert tried(folded_rules, text, 0) == tried(rules, text, 0), text
+
+
+def test_dispatch_folds_per_bucket(patternpair):
+    # only runs inside one first-character bucket fold, and each of the
+    # description's literals is the only one in its buckets
+    assert DispatchEngine(patternpair).folded == []
+    assert DispatchEngine(KEYWORDS).folded == [1, 2, 3, 6, 7]
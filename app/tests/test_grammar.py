@@ -0,0 +1,47 @@
+import random
+
+import pytest
+from conftest import DESCRIPTION
+
+from tokenparser.grammar import GrammarModel
+from tokenparser.position import LineIndex
+
+
+def error(description):
+    with pytest.raises(Exception) as e:
+        GrammarModel().update(description)
+    return str(e.value)
+
+
+def test_failed_update_keeps_state(patternpair):
+    model = GrammarModel()
+    model.update(DESCRIPTION)
+    broken = DESCRIPTION.replace("Symbol {", "Symbol {\n\n\n  ]")
+    with pytest.raises(Exception):
+        model.update(broken)
+    assert model.description == DESCRIPTION
+    assert list(model.index.starts) == list(LineIndex(DESCRIPTION).starts)
+    # errors of the next text point at its own lines, not the failed one's
+    later = DESCRIPTION.replace("String {", "String {\n[")
+    with pytest.raises(Exception) as e:
+        model.update(later)
+    assert str(e.value) == error(later)
+    assert model.update(DESCRIPTION) == patternpair
+
+
+@pytest.mark.filterwarnings("ignore::FutureWarning") # "[" typed into a pattern
+def test_edits_like_a_fresh_model():
+    rnd = random.Random(12)
+    model = GrammarModel()
+    model.update(DESCRIPTION)
+    for _ in range(300):
+        position = rnd.randrange(len(DESCRIPTION))
+        text = DESCRIPTION[:position] + rnd.choice(["\n", "[", "}", "x\n{", ""]) + DESCRIPTION[position + rnd.randrange(3):]
+        try:
+            expected = GrammarModel().update(text)
+        except Exception as e:
+            with pytest.raises(Exception) as got:
+                model.update(text)
+            assert str(got.value) == str(e)
+        else:
+            assert model.update(text) == expected
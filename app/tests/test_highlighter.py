@@ -0,0 +1,67 @@
+import os
+
+import pytest
+from conftest import DESCRIPTION
+
+QtGui = pytest.importorskip("PySide6.QtGui")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtCore import QRegularExpression  # noqa: E402
+
+from tokenparser.highlighter import RuleHighlighter, color_format, metaclass_LexerTestHighlighter  # noqa: E402
+from tokenparser.use import use  # noqa: E402
+
+
+@pytest.fixture(scope="module", autouse=True)
+def application():
+    return QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+
+
+def colors(highlighter_class, text):
+    # color name per character, "" where nothing is set
+    document = QtGui.QTextDocument()
+    highlighter = highlighter_class(document)
+    document.setPlainText(text)
+    highlighter.rehighlight()
+    found = [""] * len(text)
+    block = document.begin()
+    while block.isValid():
+        for piece in block.layout().formats():
+            color = piece.format.foreground().color().name()
+            for i in range(piece.start, piece.start + piece.length):
+                found[block.position() + i] = color
+        block = block.next()
+    return found
+
+
+def two_rules(*sources, combine=True):
+    class Highlighter(RuleHighlighter):
+        def __init__(self, parent=None):
+            super().__init__(parent)
+            for source, color in zip(sources, ("#ff0000", "#00ff00")):
+                self.rules.append((QRegularExpression(source), color_format(color)))
+            if combine:
+                self.combine()
+    return Highlighter
+
+
+def test_overlapping_rules():
+    # one pass: "ab" is found first and "bc" never starts
+    assert colors(two_rules("ab", "bc"), "abc") == ["#ff0000", "#ff0000", ""]
+    # rule by rule, the later rule paints over the earlier one
+    assert colors(two_rules("ab", "bc", combine=False), "abc") == ["#ff0000", "#00ff00", "#00ff00"]
+    # at the same offset the later rule wins either way
+    assert colors(two_rules("ab", "abc"), "abc") == ["#00ff00"] * 3
+
+
+def test_colors_like_the_lexer(patternpair):
+    text = DESCRIPTION + "\nNormal r\"unclosed\n#12345g Special{ }"
+    tokens = use(patternpair, text)
+    expected = [""] * len(text)
+    for rule, start, end in zip(tokens.rules, tokens.starts, tokens.ends):
+        if rule < len(patternpair):
+            for i in range(start, end):
+                expected[i] = patternpair[rule][4].lower()
+    found = colors(metaclass_LexerTestHighlighter(patternpair), text)
+    assert [c if text[i] != "\n" else "" for i, c in enumerate(found)] == \
+        [c if text[i] != "\n" else "" for i, c in enumerate(expected)]
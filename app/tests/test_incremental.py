@@ -0,0 +1,92 @@
+import random
+import re
+
+import pytest
+from conftest import DESCRIPTION, columns, random_edits, random_text
+
+from tokenparser.engine import engines, compile_engine
+from tokenparser.incremental import IncrementalLexer
+from tokenparser.use import use
+
+COMMENTS = [
+    (re.compile(r"/\*[\s\S]*?\*/"), "Comment", "Comment", "", ""),
+    (re.compile(r"\w+"), "Word", "Word", "", ""),
+]
+
+# anchors, lookarounds both ways, backreferences, case folding, lazy,
+# possessive and empty-matching repeats
+ODD = [(re.compile(source), f"Rule{i}", "Rule", "", "") for i, source in enumerate([
+    r"\w+(?=\s*\{)", r"(?<=\])\w", r"^Normal", r"\}$", r"\bx1\b", r"(\w)\1", r"(?i)SPECIAL",
+    r"#\w*\n", r"(?:\[?)*\]", r"\[[^\]]*\]", r"(?s)r\".*?\"", r"\s*+\\", r"(\{)?(?(1)\}|\[)", r"\Z",
+])]
+
+
+def test_lookahead_across_lines(patternpair):
+    # `a` is a Token once a brace follows it, on whatever line
+    lexer = IncrementalLexer(patternpair, "a\n")
+    lexer.edit("a\n{{}", 2, 0, 3)
+    assert columns(lexer.tokens) == columns(use(patternpair, "a\n{{}"))
+    assert lexer.tokens.names[lexer.tokens.rules[0]][0] == "Identifier[Token]"
+
+
+def test_comment_closed_lines_later():
+    text = "x /* a\nb\nc d\n"
+    lexer = IncrementalLexer(COMMENTS, text)
+    lexer.edit(text + "*/", len(text), 0, 2)
+    assert columns(lexer.tokens) == columns(use(COMMENTS, text + "*/"))
+    assert lexer.tokens.rules[-1] == 0
+
+
+@pytest.mark.parametrize("kind", sorted(engines))
+@pytest.mark.parametrize("rules", ["description", "comments", "odd"])
+def test_edits_lex_like_use(patternpair, rules, kind):
+    patternpair = {"description": patternpair, "comments": COMMENTS, "odd": ODD}[rules]
+    engine = compile_engine(patternpair, kind)
+    rnd = random.Random(f"{rules} {kind}")
+    for _ in range(60):
+        text = random_text(rnd, rnd.randrange(40))
+        lexer = IncrementalLexer(patternpair, text, engine)
+        for text, position, removed, added in random_edits(rnd, text, 25):
+            lexer.edit(text, position, removed, added)
+            assert columns(lexer.tokens) == columns(use(patternpair, text)), (text, position, removed, added)
+
+
+def test_copy_is_edited_alone(patternpair):
+    lexer = IncrementalLexer(patternpair, DESCRIPTION)
+    other = lexer.copy()
+    other.edit("x" + DESCRIPTION, 0, 0, 1)
+    assert columns(lexer.tokens) == columns(use(patternpair, DESCRIPTION))
+    assert columns(other.tokens) == columns(use(patternpair, "x" + DESCRIPTION))
+
+
+@pytest.mark.parametrize("rules", ["description", "comments", "odd"])
+def test_edits_in_a_row_read_lazily(patternpair, rules):
+    # the offsets past each edit stay moved lazily from one edit to the
+    # next; lookups read around that, and the columns settle to use()'s
+    patternpair = {"description": patternpair, "comments": COMMENTS, "odd": ODD}[rules]
+    rnd = random.Random(rules)
+    pending = 0
+    for _ in range(40):
+        text = random_text(rnd, rnd.randrange(80))
+        lexer = IncrementalLexer(patternpair, text)
+        lexer.tokens.index # edited along
+        for text, position, removed, added in random_edits(rnd, text, 30):
+            if rnd.random() < 0.3:
+                lexer = lexer.copy()
+            tokens = lexer.edit(text, position, removed, added)
+            pending += bool(tokens.offsets.delta)
+            expected = use(patternpair, text)
+            for _ in range(5):
+                offset = rnd.randrange(len(text) + 1)
+                end = offset + rnd.randrange(10)
+                assert tokens.token_at(offset) == expected.token_at(offset)
+                assert list(tokens.overlapping(offset, end)) == list(expected.overlapping(offset, end))
+                assert tokens.index.coords(offset) == expected.index.coords(offset)
+                if len(expected) > 1:
+                    i = rnd.randrange(len(expected) - 1)
+                    assert tokens[i] == expected[i]
+            if rnd.random() < 0.1:
+                assert columns(tokens) == columns(expected)
+                assert tokens.index.starts == expected.index.starts
+        assert columns(lexer.tokens) == columns(expected)
+    assert pending
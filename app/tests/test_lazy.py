@@ -0,0 +1,67 @@
+import random
+
+import pytest
+from conftest import DESCRIPTION, columns, random_edits, random_text
+from test_incremental import COMMENTS, ODD
+
+from tokenparser.all import coord_token
+from tokenparser.lazy import LazyLexer
+from tokenparser.use import use
+
+
+def known(lexer, text):
+    # (start, end, rule) of every token overlapping() knows, prefix and island
+    return list(lexer.overlapping(0, len(text) + 1))
+
+
+@pytest.mark.parametrize("rules", ["description", "comments", "odd"])
+def test_edits_lex_like_use(patternpair, rules):
+    patternpair = {"description": patternpair, "comments": COMMENTS, "odd": ODD}[rules]
+    rnd = random.Random(rules)
+    for _ in range(80):
+        text = random_text(rnd, rnd.randrange(60))
+        lexer = LazyLexer(patternpair, text)
+        for text, position, removed, added in random_edits(rnd, text, 25):
+            # some of the old text lexed, some of it only as an island
+            lexer.advance(rnd.randrange(len(lexer.text) + 1))
+            if lexer.text and rnd.random() < 0.4:
+                start = rnd.randrange(len(lexer.text))
+                lexer.window(start, start + rnd.randrange(1, 20), margin=rnd.choice([0, 8]))
+            lexer.edit(text, position, removed, added)
+            expected = use(patternpair, text)
+            lexer.advance(rnd.randrange(len(text) + 1))
+            count = len(lexer.tokens.starts)
+            assert columns(lexer.tokens) == columns(expected, count), (text, position, removed, added)
+            assert lexer.end == (expected.ends[count - 1] if count else 0)
+        lexer.advance(len(text))
+        assert columns(lexer.tokens) == columns(use(patternpair, text))
+
+
+def test_window_then_prefix(patternpair):
+    text = (DESCRIPTION + "\n") * 50
+    lexer = LazyLexer(patternpair, text)
+    middle = len(text) // 2
+    lexer.window(middle, middle + 100, margin=0)
+    assert lexer.island
+    assert lexer.end == 0
+    lexer.advance(len(text))
+    assert not lexer.island
+    assert columns(lexer.tokens) == columns(use(patternpair, text))
+    assert known(lexer, text) == list(zip(lexer.tokens.starts, lexer.tokens.ends, lexer.tokens.rules))
+
+
+def test_copy_raises(patternpair):
+    with pytest.raises(TypeError):
+        LazyLexer(patternpair, DESCRIPTION).copy()
+
+
+def test_coord_token_lexes_around_it(patternpair):
+    text = (DESCRIPTION + "\n") * 2000
+    tokens = use(patternpair, text)
+    lines = len(tokens.index)
+    lexer = LazyLexer(patternpair, text)
+    for line, column in [(lines - 3, 5), (lines, 1), (lines - 1, 200), (lines // 2, 9), (1, 1), (2, 3)]:
+        assert coord_token(lexer, line, column) == coord_token(tokens, line, column)
+    # the prefix only ran up to the lookups near the start
+    assert lexer.end < len(text) // 10
+    assert coord_token(LazyLexer(patternpair, ""), 1, 1) == coord_token(use(patternpair, ""), 1, 1)
@@ -0,0 +1,138 @@
+import random
+import re
+
+import pytest
+from conftest import DESCRIPTION, PIECES
+
+from tokenparser.lexer import Lexer, TokenType
+
+stringpattern = re.compile(r'("(?:[^\"\\]|\\[\s\S])*")')
+
+
+class WalkingLexer:
+    """The character-walking lexer the master pattern replaced, as it was, giving (type, value, line, column, position)."""
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.line = 1
+        self.column = 1
+        self.current_char = self.text[0] if self.text else ""
+
+    def advance(self, much=1):
+        for i in range(much):
+            if self.current_char == '\n':
+                self.line += 1
+                self.column = 0
+            self.pos += 1
+            if self.pos < len(self.text):
+                self.current_char = self.text[self.pos]
+                self.column += 1
+            else:
+                self.current_char = ""
+                break
+
+    def token(self, type, value, position):
+        return type, value, self.line, self.column, position
+
+    def read_identifier(self):
+        result = ''
+        starting = self.pos
+        while self.current_char != "" and (self.current_char.isalnum() or self.current_char == '_'):
+            result += self.current_char
+            self.advance()
+        return self.token(TokenType.IDENTIFIER, result, starting)
+
+    def read_string(self):
+        result = ''
+        starting = self.pos
+        if self.current_char == 'r':
+            result += self.current_char
+            self.advance()
+        if self.current_char != '"':
+            return self.token(TokenType.UNKNOWN, result, starting)
+        s = self.pos
+        match = stringpattern.match(self.text, self.pos)
+        if match:
+            d = match.end()
+            result += self.text[s:d]
+        else:
+            d = s+1
+        self.advance(d-s)
+        return self.token(TokenType.STRING, result, starting)
+
+    def get_next_token(self):
+        starting = self.pos
+        symbols = {'{': TokenType.LBRACE, '}': TokenType.RBRACE, '[': TokenType.LBRACKET,
+                   ']': TokenType.RBRACKET, ',': TokenType.COMMA}
+        while self.current_char != "":
+            if self.current_char.isspace():
+                while self.current_char != "" and self.current_char.isspace():
+                    self.advance()
+                continue
+            if self.current_char.isalpha():
+                if self.pos + 1 < len(self.text) and self.text[self.pos+1] == '"':
+                    return self.read_string()
+                return self.read_identifier()
+            if self.current_char == "#":
+                color = self.text[self.pos:self.pos+7]
+                self.advance(7)
+                return self.token(TokenType.COLOR, color, starting)
+            if self.current_char in symbols:
+                char = self.current_char
+                self.advance()
+                return self.token(symbols[char], char, starting)
+            char = self.current_char
+            self.advance()
+            return self.token(TokenType.UNKNOWN, char, starting)
+        return self.token(TokenType.EOF, '', starting)
+
+    def tokenize(self):
+        # the tokens, and whether it stopped short: on a letter other than
+        # r in front of a quote it returned the same empty token forever
+        tokens = []
+        while True:
+            token = self.get_next_token()
+            if token[0] == TokenType.UNKNOWN and not token[1]:
+                return tokens, True
+            tokens.append(token)
+            if token[0] == TokenType.EOF:
+                return tokens, False
+
+
+# strings with escapes, colors cut short, identifiers against quotes,
+# characters that start nothing, and input ending inside each of them
+CORPUS = [
+    "", " ", "\n", "x", "\n\n  \n", DESCRIPTION,
+    r'Word { Normal r"a\"b\\" #123456 }', r'r"\\\"\n\t"', 'r"', 'r"abc', r'r"abc\"', 'r"\\',
+    '"a"', 'x"a"', 'rr"a"', 'r"a"b"c"', 'ab"c', 'é"x"',
+    "#", "#12", "#123456789", "# \n 12345", "#\n\n\n\n\n\n\n", "a#FFFFFF,b",
+    "_x", "1abc", "x_1 y2", "café naïve", "Ωmega", "x²", "١٢٣",
+    "{}[],", "@ $ % ; :", "\t{\r\n}\r\n", "a\n", "a\n\n",
+    "Special [ A r\"a\", B r\"b\" #FFFFFF ]",
+]
+MORE = ["é", "_", "1", "@", "\t", "\r\n", "#FFFFFF", 'r"a\\"', "x\"", "ü"]
+
+
+def like_walking_lexer(text):
+    tokens = [tuple(token) for token in Lexer(text).tokenize()]
+    expected, stuck = WalkingLexer(text).tokenize()
+    assert tokens[:len(expected)] == expected, text
+    if stuck: # where it looped, the letter is UNKNOWN
+        type, value, *_ = tokens[len(expected)]
+        assert (type, value) == (TokenType.UNKNOWN, text[text.index('"', tokens[len(expected)][4]) - 1]), text
+    else:
+        assert len(tokens) == len(expected), text
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_corpus_like_walking_lexer(text):
+    like_walking_lexer(text)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_random_like_walking_lexer(seed):
+    rnd = random.Random(seed)
+    pieces = PIECES + MORE
+    for _ in range(300):
+        text = "".join(rnd.choice(pieces) for _ in range(rnd.randrange(30)))
+        like_walking_lexer(text)
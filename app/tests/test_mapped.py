@@ -0,0 +1,72 @@
+import random
+import re
+
+import pytest
+from conftest import DESCRIPTION, columns, random_text
+
+from tokenparser.engine import compile_engine, engines
+from tokenparser.mapped import byte_rules, use_mapped
+from tokenparser.use import use
+
+# non-ASCII characters outside classes, written out and as escapes
+WORDS = [
+    (re.compile(r"café+"), "Cafe", "Normal", "", ""),
+    (re.compile(r"\N{GREEK SMALL LETTER ALPHA}[a-z]*"), "Greek", "Normal", "", ""),
+    (re.compile(r"\x41\101\U0001F600?"), "A", "Normal", "", ""),
+    (re.compile(r"\u00fc{2}"), "Umlaut", "Normal", "", ""),
+    (re.compile(r"[a-z]+"), "Word", "Normal", "", ""),
+    (re.compile(r"\s+"), "Space", "Normal", "", ""),
+]
+PIECES = ["café", "caféé", "cafe", "αβ", "αabc", "AA", "AA\U0001F600", "üü", "ü", "x", " ", "\n", "é"]
+
+
+def byte_columns(tokens, text):
+    # columns of a TokenStream over utf-8 bytes, offsets in characters
+    offsets = {len(text[:i].encode("utf-8")): i for i in range(len(text) + 1)}
+    rules, starts, ends = columns(tokens)
+    return rules, [offsets[start] for start in starts], [offsets[end] for end in ends]
+
+
+@pytest.mark.parametrize("rules", ["description", "words"])
+def test_lexes_like_use(patternpair, tmp_path, rules):
+    patternpair = {"description": patternpair, "words": WORDS}[rules]
+    pieces = PIECES if rules == "words" else None
+    rnd = random.Random(rules)
+    path = tmp_path / "text"
+    for _ in range(40):
+        if pieces:
+            text = "".join(rnd.choice(pieces) for _ in range(rnd.randrange(40)))
+        else:
+            text = random_text(rnd, rnd.randrange(60)) + "é"
+        path.write_bytes(text.encode("utf-8"))
+        expected = columns(use(patternpair, text))
+        assert byte_columns(use_mapped(patternpair, str(path)), text) == expected
+        for kind in engines:
+            engine = compile_engine(byte_rules(patternpair), kind)
+            assert byte_columns(use_mapped(patternpair, str(path), engine), text) == expected, kind
+
+
+def test_description_file(patternpair, tmp_path):
+    path = tmp_path / "description"
+    path.write_bytes(DESCRIPTION.encode("utf-8"))
+    tokens = use_mapped(patternpair, str(path))
+    assert columns(tokens) == columns(use(patternpair, DESCRIPTION))
+    assert tokens.index.coords(tokens.starts[-1]) == use(patternpair, DESCRIPTION).index.coords(tokens.starts[-1])
+
+
+def test_empty_file(patternpair, tmp_path):
+    path = tmp_path / "empty"
+    path.write_bytes(b"")
+    assert columns(use_mapped(patternpair, str(path))) == ([], [], [])
+
+
+@pytest.mark.parametrize("source, flags", [
+    ("[à-ÿ]+", 0),
+    ("[é]", 0),
+    (r"[\u00e9]", 0),
+    (r"[^\N{LATIN SMALL LETTER E WITH ACUTE}]", 0),
+    ("é", re.IGNORECASE),
+])
+def test_refuses_what_bytes_cant_match(source, flags):
+    with pytest.raises(ValueError, match="rule 1"):
+        byte_rules([WORDS[0], (re.compile(source, flags), "Bad", "Normal", "", "")])
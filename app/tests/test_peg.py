@@ -0,0 +1,75 @@
+import random
+
+import pytest
+from conftest import DESCRIPTION, random_edits
+
+from tokenparser.incremental import IncrementalLexer
+from tokenparser.peg import PackratParser, ParseError
+from tokenparser.use import use
+
+# the parse grammar main.py opens with
+GRAMMAR = """
+Grammar    <- Block*
+Block      <- Identifier[Token] "{" Definition* "}"
+Definition <- Normal / Special
+Normal     <- "Normal" String Color?
+Special    <- "Special" "[" Subtoken+ "]" Color?
+Subtoken   <- Identifier String Color?
+""".strip()
+
+# definitions edits insert; each keeps a description valid
+SNIPPETS = ['Normal r"x" #123456 ', 'Normal r"y" ', 'Special [ A r"a" ] ', 'Special [ A r"a" B r"b" #FFFFFF ] ']
+
+
+def dump(node):
+    return node.name, node.length, [dump(child) for child in node.children]
+
+
+def outcome(parser, *args, **kwargs):
+    # the tree, or the error, parse() gives
+    try:
+        return dump(parser.parse(*args, **kwargs))
+    except ParseError as e:
+        return str(e)
+
+
+def edits(rnd: random.Random, text: str, count: int):
+    """
+    Yields (new text, position, removed, added): definitions added, names
+    in strings changed, and random edits that break the text, each undone
+    by the next edit.
+    """
+    for _ in range(count):
+        choice = rnd.random()
+        if choice < 0.4:
+            position = text.find("{\n", rnd.randrange(len(text))) + 1 or text.find("{\n") + 1
+            removed, inserted = 0, " " + rnd.choice(SNIPPETS)
+        elif choice < 0.8:
+            position = text.find('r"', rnd.randrange(len(text)))
+            position = (text.find('r"') if position < 0 else position) + 2
+            removed, inserted = 1, rnd.choice("QZq_")
+        else:
+            old = text
+            text, position, removed, added = next(random_edits(rnd, text, 1))
+            yield text, position, removed, added
+            text = old
+            yield text, position, added, removed
+            continue
+        text = text[:position] + inserted + text[position + removed:]
+        yield text, position, removed, len(inserted)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_reparse_like_fresh_parse(patternpair, seed):
+    rnd = random.Random(seed)
+    text = "\n".join(DESCRIPTION for _ in range(20))
+    lexer = IncrementalLexer(patternpair, text)
+    parser = PackratParser()
+    parser.parse(lexer.tokens, source=GRAMMAR)
+    for text, position, removed, added in edits(rnd, text, 120):
+        base = lexer.tokens
+        lexer = lexer.copy()
+        tokens = lexer.edit(text, position, removed, added)
+        reparsed = outcome(parser, tokens, base, lexer.relexed)
+        assert reparsed == outcome(PackratParser(), use(patternpair, text), source=GRAMMAR), \
+            (position, removed, text[position:position + added])
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+from conftest import DESCRIPTION, random_edits
+
+from tokenparser.all import coord_token
+from tokenparser.position import BufferLineIndex, LineIndex
+from tokenparser.use import use
+
+# no trailing newline, CRLF, blank lines, newlines only, empty
+TEXTS = ["", "a", "\n", "\n\n", "ab\ncd", "ab\ncd\n", "ab\r\ncd\r\n", "a\r\n\r\nb", "\n\nx", DESCRIPTION,
+         DESCRIPTION.replace("\n", "\r\n") + "\r\nlast"]
+
+
+def naive_coords(text, offset):
+    return text.count("\n", 0, offset) + 1, offset - (text.rfind("\n", 0, offset) + 1) + 1
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("kind", ["text", "buffer"])
+def test_round_trip(text, kind):
+    index = LineIndex(text) if kind == "text" else BufferLineIndex(text.encode("ascii"))
+    for offset in range(len(text) + 1):
+        line, column = index.coords(offset)
+        assert (line, column) == naive_coords(text, offset)
+        assert index.offset(line, column) == offset
+    assert len(index) == text.count("\n") + 1
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_offset_clamped(text):
+    index = LineIndex(text)
+    lines = text.split("\n")
+    assert index.offset(0, 0) == 0
+    assert index.offset(len(lines) + 3, 1) == len(text) - len(lines[-1])
+    for line, content in enumerate(lines, 1):
+        start = index.offset(line, 1)
+        assert index.offset(line, len(content) + 10) == start + len(content) # the newline, or the end
+        assert index.offset(line, -5) == start
+
+
+def test_buffer_reads_as_needed():
+    text = DESCRIPTION * 50
+    index = BufferLineIndex(text.encode("ascii"))
+    assert index.coords(3) == (1, 4)
+    assert index.scanned < len(DESCRIPTION)
+    assert index.offset(2, 1) == text.index("\n") + 1
+    assert index.scanned < len(DESCRIPTION)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_edits_like_fresh(seed):
+    rnd = random.Random(seed)
+    text = DESCRIPTION.replace("{\n", "{\r\n")
+    index = LineIndex(text)
+    for text, position, removed, added in random_edits(rnd, text, 150):
+        index.edit(text, position, removed, added)
+        for offset in rnd.sample(range(len(text) + 1), min(20, len(text) + 1)):
+            line, column = index.coords(offset)
+            assert (line, column) == naive_coords(text, offset)
+            assert index.offset(line, column) == offset
+    assert list(index.starts) == list(LineIndex(text).starts)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_coord_token(patternpair, text):
+    tokens = use(patternpair, text)
+    listed = list(tokens)
+    for offset in range(len(text) + 2):
+        line, column = naive_coords(text, min(offset, len(text)))
+        # the last token starting at or before the offset
+        expected = ([token for token in listed if token[3:5] <= (line, column)] or listed)[-1]
+        assert coord_token(tokens, line, column) == expected
+        assert coord_token(listed, line, column) == expected
@@ -0,0 +1,48 @@
+from collections import Counter
+
+import pytest
+from test_engines import rule_sets, texts
+
+from tokenparser.engine import RuleEngine, compile_engine, engines
+from tokenparser.profiling import RuleProfile, profiled
+from tokenparser.use import use
+
+
+@pytest.mark.parametrize("kind", sorted(engines))
+@pytest.mark.parametrize("rules", ["description", "comments", "odd", "keywords"])
+def test_lexes_like_unprofiled(patternpair, rules, kind):
+    patternpair = rule_sets(patternpair)[rules]
+    engine = compile_engine(patternpair, kind)
+    profile = RuleProfile(patternpair)
+    size = 0
+    for text in texts(f"{rules} {kind}", 40):
+        assert use(patternpair, text, engine, profile) == use(patternpair, text, engine), text
+        size += len(text)
+    # every character is in one rule's tokens or skipped, and every
+    # rule matched only when tried
+    assert sum(profile.chars) + profile.skipped == size
+    assert all(0 <= matches <= attempts for attempts, matches in zip(profile.attempts, profile.matches))
+
+
+@pytest.mark.parametrize("kind", sorted(engines))
+@pytest.mark.parametrize("rules", ["description", "keywords"])
+def test_counts_add_up(patternpair, rules, kind):
+    patternpair = rule_sets(patternpair)[rules]
+    profile = RuleProfile(patternpair)
+    tokens = Counter()
+    for text in texts(rules, 40):
+        tokens.update(use(patternpair, text, compile_engine(patternpair, kind), profile).rules)
+    assert profile.matches == [tokens[i] for i in range(len(patternpair))]
+    if not isinstance(profiled(compile_engine(patternpair, kind), RuleProfile(patternpair)), RuleEngine):
+        # dispatch tries some of the rules, in the same order, at the same offsets
+        every = RuleProfile(patternpair)
+        for text in texts(rules, 40):
+            use(patternpair, text, RuleEngine(patternpair), every)
+        assert all(map(int.__le__, profile.attempts, every.attempts))
+        assert sum(profile.attempts) < sum(every.attempts)
+        return
+    # rules are tried in order until one matches, at every offset tried
+    order = [index for index, _ in RuleEngine(patternpair).rules]
+    for before, after in zip(order, order[1:]):
+        assert profile.attempts[after] == profile.attempts[before] - profile.matches[before]
+    assert profile.attempts[order[-1]] - profile.matches[order[-1]] <= profile.skipped
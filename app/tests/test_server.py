@@ -0,0 +1,95 @@
+import asyncio
+import json
+import random
+
+import pytest
+from conftest import DESCRIPTION, random_edits
+
+from tokenparser.cache import GrammarCache
+from tokenparser.incremental import IncrementalLexer
+from tokenparser.server import INVALID_PARAMS, SERVER_ERROR, LexServer, semantic_tokens
+
+
+def call(server, method, **params):
+    response = server.handle(json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params}))
+    return response.get("result"), response.get("error")
+
+
+@pytest.fixture
+def server():
+    return LexServer(GrammarCache(maxsize=2))
+
+
+def test_open_edit_close(server):
+    grammar = call(server, "grammar/register", description=DESCRIPTION)[0]["grammar"]
+    result, error = call(server, "document/open", uri="a", grammar=grammar, text="Normal {")
+    assert error is None and result["data"]
+    result, error = call(server, "document/edit", uri="a", edits=[{"offset": 0, "removed": 0, "text": "x"}])
+    assert result == {"length": 9}
+    assert call(server, "document/close", uri="a") == (None, None)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_patched_like_fresh(server, patternpair, seed):
+    # the data patched after each edit, and the client's copy the deltas
+    # keep, are what encoding the text afresh gives
+    rnd = random.Random(seed)
+    text = "\n".join(DESCRIPTION for _ in range(5))
+    grammar = call(server, "grammar/register", description=DESCRIPTION)[0]["grammar"]
+    result = call(server, "document/open", uri="a", grammar=grammar, text=text)[0]
+    result_id, data = result["resultId"], result["data"]
+    for text, position, removed, added in random_edits(rnd, text, 80):
+        edit = {"offset": position, "removed": removed, "text": text[position:position + added]}
+        assert call(server, "document/edit", uri="a", edits=[edit])[0] == {"length": len(text)}
+        fresh = semantic_tokens(IncrementalLexer(patternpair, text).tokens)
+        assert server.documents["a"].data == fresh
+        if rnd.random() < 0.5:
+            result = call(server, "document/semanticTokens/full/delta", uri="a", previousResultId=result_id)[0]
+            result_id = result["resultId"]
+            for change in result["edits"]:
+                data[change["start"]:change["start"] + change["deleteCount"]] = change["data"]
+            assert data == fresh
+    result = call(server, "document/semanticTokens/full/delta", uri="a", previousResultId="stale")[0]
+    assert result["data"] == fresh
+    result = call(server, "document/semanticTokens/full/delta", uri="a", previousResultId=result["resultId"])[0]
+    assert result["edits"] == []
+
+
+@pytest.mark.parametrize("method, params", [
+    ("document/open", {"uri": "a"}),
+    ("document/open", {"uri": "a", "grammar": "g", "text": "", "extra": 1}),
+    ("document/open", {"uri": "a", "grammar": "g", "text": 3}),
+    ("document/edit", {"uri": "a", "edits": [{"offset": 0}]}),
+    ("grammar/register", {"description": "Broken {"}),
+])
+def test_invalid_params(server, method, params):
+    if method == "document/edit":
+        grammar = call(server, "grammar/register", description=DESCRIPTION)[0]["grammar"]
+        call(server, "document/open", uri="a", grammar=grammar, text="")
+    assert call(server, method, **params)[1]["code"] == INVALID_PARAMS
+
+
+def test_internal_type_error(server, monkeypatch):
+    def broken(uri: str):
+        raise TypeError("a bug, not the client's")
+    server.methods["document/close"] = broken
+    assert call(server, "document/close", uri="a")[1] == {"code": SERVER_ERROR, "message": "a bug, not the client's"}
+
+
+def test_grammars_pruned(server):
+    keys = [call(server, "grammar/register", description=DESCRIPTION + "\n" * i)[0]["grammar"] for i in range(5)]
+    assert list(server.grammars) == keys[-2:]
+    call(server, "document/open", uri="a", grammar=keys[-1], text="")
+    for i in range(5, 10):
+        call(server, "grammar/register", description=DESCRIPTION + "\n" * i)
+    assert keys[-1] in server.grammars and len(server.grammars) == 3
+    call(server, "document/close", uri="a")
+    assert keys[-1] not in server.grammars and len(server.grammars) == 2
+
+
+def test_socket_path_not_a_socket(server, tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("keep me")
+    with pytest.raises(FileExistsError):
+        asyncio.run(server.serve_unix(str(path)))
+    assert path.read_text() == "keep me"
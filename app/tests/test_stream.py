@@ -0,0 +1,52 @@
+import random
+
+import pytest
+from conftest import DESCRIPTION, random_edits
+
+from tokenparser.incremental import IncrementalLexer
+from tokenparser.stream import color_changes
+
+
+def colors_of(patternpair):
+    # what RuleHighlighter colors: rule id -> color, rules with one
+    return {rule: color for rule, (_, _, _, _, color) in enumerate(patternpair) if color}
+
+
+def painted(tokens, colors):
+    # the color of every character, None where there is none
+    out = [None] * len(tokens.text)
+    for start, end, rule in tokens.overlapping(0, len(tokens.text)):
+        out[start:end] = [colors.get(rule)] * (end - start)
+    return out
+
+
+@pytest.mark.parametrize("window", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_edits_cover_every_change(patternpair, seed, window):
+    rnd = random.Random(seed)
+    colors = colors_of(patternpair)
+    text = "\n".join(DESCRIPTION for _ in range(3))
+    lexer = IncrementalLexer(patternpair, text)
+    for text, position, removed, added in random_edits(rnd, text, 150):
+        old = lexer.tokens.copy()
+        lexer.edit(text, position, removed, added)
+        changes = color_changes(old, lexer.tokens, colors, colors, (position, removed, added),
+                                lexer.relexed if window else None)
+        assert changes == sorted(changes)
+        assert all(end < start for (_, end), (start, _) in zip(changes, changes[1:])) # apart
+        assert any(start <= position and position + added <= end for start, end in changes)
+        before, after = painted(old, colors), painted(lexer.tokens, colors)
+        moved = before[:position] + [None] * added + before[position + removed:]
+        for offset, (was, now) in enumerate(zip(moved, after)):
+            if was != now and not position <= offset < position + added:
+                assert any(start <= offset < end for start, end in changes), offset
+
+
+def test_new_colors(patternpair):
+    # the same tokens, one rule recolored: just its tokens change
+    lexer = IncrementalLexer(patternpair, DESCRIPTION)
+    colors = colors_of(patternpair)
+    recolored = {**colors, 0: "#000000"}
+    changes = color_changes(lexer.tokens, lexer.tokens, colors, recolored)
+    tokens = lexer.tokens
+    assert changes == [(start, end) for start, end, rule in tokens.overlapping(0, len(DESCRIPTION)) if rule == 0]
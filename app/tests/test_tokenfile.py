@@ -0,0 +1,77 @@
+import os
+import struct
+
+import pytest
+from conftest import DESCRIPTION, columns
+
+from tokenparser.tokenfile import TokenFile, header, save
+from tokenparser.use import use
+
+
+@pytest.fixture
+def saved(tmp_path, patternpair):
+    path = str(tmp_path / "description.tokens")
+    save(path, patternpair, use(patternpair, DESCRIPTION))
+    with open(path, "rb") as f:
+        return path, f.read()
+
+
+def rewrite(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_round_trip(saved, patternpair):
+    path, _ = saved
+    with TokenFile(path) as tokens:
+        assert tokens.patternpair == patternpair
+        assert columns(tokens.tokens(DESCRIPTION)) == columns(use(patternpair, DESCRIPTION))
+    assert os.listdir(os.path.dirname(path)) == ["description.tokens"]
+
+
+def test_truncated(saved):
+    path, data = saved
+    rules_at, columns_at = header.unpack_from(data)[-2:]
+    for size in {0, 3, header.size - 1, header.size, rules_at + 10, columns_at, len(data) - 1}:
+        rewrite(path, data[:size])
+        with pytest.raises(ValueError):
+            TokenFile(path)
+
+
+@pytest.mark.parametrize("field, value", [
+    (3, 1 << 20),  # rule count, the table runs into the columns
+    (6, 0),        # rules inside the header
+    (6, 1 << 40),  # rules past the end
+    (7, 41),       # columns not aligned
+    (7, 1 << 40),  # columns past the end
+])
+def test_corrupt_header(saved, field, value):
+    path, data = saved
+    fields = list(header.unpack_from(data))
+    fields[field] = value
+    rewrite(path, header.pack(*fields) + data[header.size:])
+    with pytest.raises(ValueError):
+        TokenFile(path)
+
+
+@pytest.mark.parametrize("size", [0xFFFFFFFF, 3])
+def test_corrupt_rule_table(saved, size):
+    path, data = saved
+    # the length of the first rule's source: past the columns, or short,
+    # with a byte that isn't utf-8 in what's left of it
+    at = header.unpack_from(data)[6] + 4
+    data = bytearray(data)
+    struct.pack_into("<I", data, at, size)
+    if size == 3:
+        data[at + 4 + 2] = 0xC3
+    rewrite(path, bytes(data))
+    with pytest.raises(ValueError):
+        TokenFile(path)
+
+
+def test_failed_save_leaves_no_temp(tmp_path, patternpair):
+    path = tmp_path / "taken"
+    path.mkdir() # os.replace can't put the file there
+    with pytest.raises(OSError):
+        save(str(path), patternpair, use(patternpair, DESCRIPTION))
+    assert os.listdir(tmp_path) == ["taken"]
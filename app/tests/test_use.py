@@ -0,0 +1,21 @@
+import io
+import random
+
+import pytest
+from test_engines import rule_sets, texts
+
+from tokenparser.use import iter_use, use
+
+
+@pytest.mark.parametrize("window", [4, 32, 1 << 16])
+@pytest.mark.parametrize("rules", ["description", "comments", "odd", "keywords"])
+def test_iter_use_lexes_like_use(patternpair, rules, window):
+    patternpair = rule_sets(patternpair)[rules]
+    rnd = random.Random(f"{rules} {window}")
+    for text in texts(rules, 80):
+        expected = list(use(patternpair, text))
+        assert list(iter_use(patternpair, text, window=window)) == expected
+        assert list(iter_use(patternpair, io.StringIO(text), window=window)) == expected
+        cuts = sorted(rnd.sample(range(len(text) + 1), min(len(text) + 1, 5)))
+        pieces = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+        assert list(iter_use(patternpair, iter(pieces), window=window)) == expected
@@ -1 +1,15 @@
-from . import lexer, parser, highlighter
\ No newline at end of file
+import importlib
+
+# submodules are imported when first asked for: `import tokenparser`
+# stays cheap, and highlighter, which needs PySide6, is only loaded by
+# whoever uses it, so the rest of the package works headless
+submodules = {
+    "all", "analyze", "cache", "cli", "dfa", "engine", "fold", "grammar", "highlighter", "incremental",
+    "lazy", "lexer", "mapped", "parser", "peg", "position", "profiling", "reach", "server", "stream",
+    "tokenfile", "use",
+}
+
+def __getattr__(name):
+    if name in submodules:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,29 +1,63 @@
-from .highlighter import TokenDescHighlighter, metaclass_LexerTestHighlighter as metaclass
 from .lexer import Lexer
 from .parser import Parser, organize_pattern
 from .use import use
+from .stream import TokenStream
+from .lazy import LazyLexer
+from .cache import GrammarCache
+from bisect import bisect_right
 
-def organizer(description):
+# the highlighters need PySide6, they are imported on first use
+_lazy_attrs = {
+    'TokenDescHighlighter': 'TokenDescHighlighter',
+    'metaclass': 'metaclass_LexerTestHighlighter',
+    'metaclass_LexerStreamHighlighter': 'metaclass_LexerStreamHighlighter',
+}
+
+def __getattr__(name):
+    if name in _lazy_attrs:
+        from . import highlighter
+        return getattr(highlighter, _lazy_attrs[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# set grammar_cache.directory to keep compiled grammars across runs
+grammar_cache = GrammarCache()
+
+def build(description):
     lexed = Lexer(description).tokenize()
     parsed = Parser(lexed).parse()
     organized = organize_pattern(parsed)
     return organized
 
+def organizer(description, cache=grammar_cache):
+    if cache is None:
+        return build(description)
+    return cache.get(description, build)
+
 def lexer(organized, text):
     return use(organized, text)
 
 def metaclass_LexerTextHighlighter(organized):
+    from .highlighter import metaclass_LexerTestHighlighter as metaclass
     meta = metaclass(organized)
     return meta
 
 def coord_token(lexed, line, column):
-    i = 0
-    current = lexed[i]
-    max_len = len(lexed)
-    while current[3] < line and i < max_len:
-        i += 1
-        current = lexed[i]
-    while current[4] < column and i < max_len:
-        i += 1
-        current = lexed[i]
-    return lexed[i-1]
\ No newline at end of file
+    # last token starting at or before (line, column); a LazyLexer lexes
+    # just around it, as window() does for the view
+    if isinstance(lexed, LazyLexer):
+        return lazy_token(lexed, lexed.tokens.index.offset(line, column))
+    if isinstance(lexed, TokenStream):
+        i = lexed.token_at(lexed.index.offset(line, column))
+    else:
+        i = bisect_right(lexed, (line, column), key=lambda token: token[3:5]) - 1
+    return lexed[max(i, 0)]
+
+def lazy_token(lexer, offset):
+    tokens = lexer.tokens
+    offset = min(offset, len(tokens.text) - 1) # past the end is the last token
+    if offset < 0:
+        return tokens[0] # EOF, the text is empty
+    lexer.window(offset, offset + 1)
+    start, end, rule = next(lexer.overlapping(offset, offset + 1))
+    name, category = tokens.names[rule]
+    return (name, tokens.text[start:end], category, *tokens.index.coords(start))
@@ -0,0 +1,147 @@
+from functools import lru_cache
+import re
+try:
+    from re import _parser as sre_parse, _constants as sre
+except ImportError: # Python < 3.11
+    import sre_parse, sre_constants as sre # type: ignore
+
+# Static facts about a single rule's regex, read off the parse tree of `re`.
+
+MAX_RANGE = 256 # wider classes ([^...], \w, [\u0000-￿]) are not worth listing
+
+
+def parse(pattern: re.Pattern):
+    return sre_parse.parse(pattern.pattern, pattern.flags)
+
+@lru_cache(maxsize=4096)
+def first_chars(pattern: re.Pattern):
+    """
+    Set of characters a match of `pattern` can start with, or None when it
+    can't be told (wide classes, backrefs, case folding) or when the
+    pattern may match the empty string.
+    Keys are 1-char str for str patterns and ints for bytes patterns.
+    """
+    found = _chars(pattern)
+    if found is None or found[1]:
+        return None
+    return found[0]
+
+@lru_cache(maxsize=4096)
+def start_chars(pattern: re.Pattern):
+    """
+    Like first_chars(), but the characters a non-empty match can start
+    with, also for patterns that may match the empty string.
+    """
+    found = _chars(pattern)
+    return None if found is None else found[0]
+
+@lru_cache(maxsize=4096)
+def literal(pattern: re.Pattern):
+    """
+    The text `pattern` matches if it is a plain non-empty literal (groups
+    allowed, no classes, repeats, anchors or case folding), else None.
+    """
+    if pattern.flags & re.IGNORECASE:
+        return None
+    chars = []
+    try:
+        _literal(parse(pattern), chars)
+    except _Unknown:
+        return None
+    if not chars:
+        return None
+    if isinstance(pattern.pattern, str):
+        return "".join(map(chr, chars))
+    return bytes(chars)
+
+def skipper(patternpair):
+    """
+    Pattern whose search() finds the next offset where some rule could
+    start a non-empty match, or None if a rule could start anywhere.
+    """
+    chars = set()
+    for item in patternpair:
+        first = start_chars(item[0])
+        if first is None:
+            return None
+        chars |= first
+    if patternpair and isinstance(patternpair[0][0].pattern, bytes):
+        return re.compile(b"[" + b"".join(re.escape(bytes([c])) for c in sorted(chars)) + b"]" if chars else b"(?!)")
+    return re.compile("[" + "".join(re.escape(c) for c in sorted(chars)) + "]" if chars else "(?!)")
+
+def _chars(pattern):
+    # (first characters, may match empty) or None
+    if pattern.flags & re.IGNORECASE:
+        return None
+    try:
+        chars, nullable = _first(parse(pattern))
+    except _Unknown:
+        return None
+    if isinstance(pattern.pattern, str):
+        return frozenset(map(chr, chars)), nullable
+    return frozenset(chars), nullable
+
+
+class _Unknown(Exception):
+    pass
+
+def _first(items):
+    # -> (code points a match can start with, can the sequence match empty)
+    chars = set()
+    for op, av in items:
+        first, nullable = _first_item(op, av)
+        chars |= first
+        if not nullable:
+            return chars, False
+    return chars, True
+
+def _first_item(op, av):
+    if op is sre.LITERAL:
+        return {av}, False
+    if op is sre.IN:
+        return _first_in(av), False
+    if op in (sre.AT, sre.ASSERT, sre.ASSERT_NOT):
+        return set(), True
+    if op is sre.SUBPATTERN:
+        _, add_flags, _, items = av
+        if add_flags & sre.SRE_FLAG_IGNORECASE:
+            raise _Unknown()
+        return _first(items)
+    if op is sre.BRANCH:
+        chars = set()
+        nullable = False
+        for items in av[1]:
+            first, empty = _first(items)
+            chars |= first
+            nullable = nullable or empty
+        return chars, nullable
+    if op in (sre.MAX_REPEAT, sre.MIN_REPEAT) or op is getattr(sre, 'POSSESSIVE_REPEAT', None):
+        low, high, items = av
+        if high == 0:
+            return set(), True
+        first, nullable = _first(items)
+        return first, nullable or low == 0
+    if op is getattr(sre, 'ATOMIC_GROUP', None):
+        return _first(av)
+    # ANY, NOT_LITERAL, GROUPREF, GROUPREF_EXISTS, ...
+    raise _Unknown()
+
+def _literal(items, chars):
+    for op, av in items:
+        if op is sre.LITERAL:
+            chars.append(av)
+        elif op is sre.SUBPATTERN and not av[1] and not av[2]:
+            _literal(av[3], chars)
+        else:
+            raise _Unknown()
+
+def _first_in(items):
+    chars = set()
+    for op, av in items:
+        if op is sre.LITERAL:
+            chars.add(av)
+        elif op is sre.RANGE and av[1] - av[0] < MAX_RANGE:
+            chars.update(range(av[0], av[1] + 1))
+        else: # NEGATE, CATEGORY, wide RANGE
+            raise _Unknown()
+    return chars
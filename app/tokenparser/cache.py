@@ -0,0 +1,114 @@
+from .parser import patternpairtype
+from collections import OrderedDict
+from typing import Callable, Optional
+import hashlib, json, os, re
+
+VERSION = 2 # 1 was pickled
+
+
+class GrammarCache:
+    """
+    Rule tables (organize_pattern output) keyed by a hash of the
+    description text. At most `maxsize` are kept in memory, least
+    recently used dropped first. With `directory`, tables are also
+    written there as JSON, so another process or a later launch skips
+    the meta-lexer, parser and organize step. The directory keeps at
+    most `maxsize` tables as well, the least recently used (by file
+    modification time) removed when a new one is written.
+    """
+    def __init__(self, maxsize: int = 16, directory: Optional[str] = None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.entries: OrderedDict[str, patternpairtype] = OrderedDict()
+
+    @staticmethod
+    def key(description: str) -> str:
+        return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+    def get(self, description: str, build: Callable[[str], patternpairtype]) -> patternpairtype:
+        key = self.key(description)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        organized = self.load(key)
+        if organized is None:
+            organized = build(description)
+            self.store(key, organized)
+        self.entries[key] = organized
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return organized
+
+    def clear(self):
+        self.entries.clear()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.grammar") # type: ignore
+
+    def load(self, key: str) -> Optional[patternpairtype]:
+        """The table stored for `key`, None if there is none. A file that can't be read back is removed."""
+        if not self.directory:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            stored = json.loads(data)
+            if stored["version"] != VERSION:
+                raise ValueError(f"version {stored['version']}")
+            organized = [(re.compile(source, flags), name, category, subtoken, color)
+                         for source, flags, name, category, subtoken, color in stored["rules"]]
+        except Exception: # not JSON, another version, bad rules: a miss
+            self.remove(path)
+            return None
+        try:
+            os.utime(path) # recently used
+        except OSError:
+            pass
+        return organized
+
+    def store(self, key: str, organized: patternpairtype):
+        if not self.directory:
+            return
+        rules = [(pattern.pattern, pattern.flags, name, category, subtoken, color)
+                 for pattern, name, category, subtoken, color in organized]
+        import tempfile # only needed for writing, keep it off the import path
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": VERSION, "rules": rules}, f)
+            os.replace(temp, self.path(key))
+        except (OSError, TypeError, ValueError): # bytes patterns aren't stored
+            self.remove(temp)
+            return
+        self.evict()
+
+    def evict(self):
+        # the directory down to maxsize tables, least recently used out first
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".grammar")]
+        except OSError:
+            return
+        if len(names) <= self.maxsize:
+            return
+        used = []
+        for name in names:
+            path = os.path.join(self.directory, name) # type: ignore
+            try:
+                used.append((os.stat(path).st_mtime_ns, path))
+            except OSError:
+                pass
+        used.sort()
+        for _, path in used[:len(used) - self.maxsize]:
+            self.remove(path)
+
+    @staticmethod
+    def remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,183 @@
+"""
+Lexes files with a grammar from the command line, on a pool of worker
+processes:
+
+    python -m tokenparser grammar.txt src/ "docs/**/*.md" -j 8 > tokens.jsonl
+
+The grammar is compiled here first, so errors in it stop the run, then
+once in each worker. Output is JSON lines, a header with the rule table
+and then one record per file, or the binary format below with --format
+binary.
+"""
+from .all import organizer
+from .engine import compile_engine, engines
+from .use import use, rule_names, conformance
+from .mapped import use_mapped, byte_rules, map_file
+from multiprocessing import Pool
+from typing import Iterable, Iterator
+import argparse, glob, json, os, struct, sys
+
+# Binary output: MAGIC, the rule table as JSON after its uint32 length,
+# then per file a little-endian header of
+# (path length, token count, error length), the utf-8 path, the utf-8
+# error, and the token columns: int32 rules, int64 starts, int64 ends.
+MAGIC = b"MTOK\x01"
+record = struct.Struct("<IQI")
+
+# set in each worker by init_worker()
+failure = None
+rules = None
+engine = None
+encoding = "utf-8"
+binary = False
+check = False
+mapped = False
+
+
+def init_worker(description: str, kind: str, text_encoding: str, binary_output: bool, check_output=False, mapped_input=False):
+    global rules, engine, encoding, binary, check, mapped
+    rules = organizer(description)
+    engine = compile_engine(byte_rules(rules) if mapped_input else rules, kind)
+    encoding = text_encoding
+    binary = binary_output
+    check = check_output
+    mapped = mapped_input
+
+class WorkerError(Exception):
+    """A worker couldn't compile the grammar."""
+
+def start_worker(*initargs):
+    # the pool's initializer: raising here would have the pool start new
+    # workers that fail the same way for good, so the failure is kept and
+    # lex_file() hands it to the parent
+    global failure
+    try:
+        init_worker(*initargs)
+    except Exception as e:
+        failure = f"{type(e).__name__}: {e}"
+
+def lex_file(path: str) -> tuple[bool, bytes]:
+    """Lexes one file in a worker; returns (ok, its record already encoded)."""
+    if failure is not None:
+        raise WorkerError(failure)
+    if mapped:
+        return lex_mapped(path)
+    try:
+        with open(path, encoding=encoding, errors="replace") as f:
+            text = f.read()
+    except OSError as e:
+        return False, encode(path, None, str(e))
+    if check:
+        at = conformance(rules, text, engine)
+        if at is not None:
+            return False, encode(path, None, f"engine differs from use() at token {at}")
+    return True, encode(path, use(rules, text, engine), None)
+
+def lex_mapped(path: str) -> tuple[bool, bytes]:
+    try:
+        buffer = map_file(path)
+    except OSError as e:
+        return False, encode(path, None, str(e))
+    try:
+        tokens = use_mapped(rules, buffer, engine)
+        if check and use_mapped(rules, buffer) != tokens:
+            return False, encode(path, None, "engine differs from use_mapped()")
+        return True, encode(path, tokens, None)
+    finally:
+        if not isinstance(buffer, bytes):
+            buffer.close()
+
+def encode(path: str, tokens, error) -> bytes:
+    if binary:
+        name = path.encode("utf-8", "surrogateescape")
+        message = error.encode("utf-8") if error else b""
+        if tokens is None:
+            return record.pack(len(name), 0, len(message)) + name + message
+        columns = [tokens.rules, tokens.starts, tokens.ends]
+        if sys.byteorder != "little":
+            columns = [column.__copy__() for column in columns]
+            for column in columns:
+                column.byteswap()
+        return (record.pack(len(name), len(tokens.rules), len(message)) + name + message
+                + b"".join(column.tobytes() for column in columns))
+    if tokens is None:
+        line = {"path": path, "error": error}
+    else:
+        line = {"path": path, "tokens": list(zip(tokens.rules, tokens.starts, tokens.ends))}
+    return (json.dumps(line, separators=(",", ":")) + "\n").encode("utf-8")
+
+def expand(patterns: Iterable[str]) -> Iterator[str]:
+    """Files named by `patterns`: paths, directories (walked) and globs."""
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        elif glob.has_magic(pattern):
+            for path in sorted(glob.iglob(pattern, recursive=True)):
+                if os.path.isfile(path):
+                    yield path
+        else:
+            yield pattern
+
+def main(argv=None) -> int:
+    args = argparse.ArgumentParser(prog="python -m tokenparser", description="Lex files with a token description.")
+    args.add_argument("grammar", help="token description file")
+    args.add_argument("paths", nargs="+", help="files, directories or globs (** is recursive)")
+    args.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes, 1 lexes in this process")
+    args.add_argument("-f", "--format", choices=("jsonl", "binary"), default="jsonl")
+    args.add_argument("-o", "--output", help="output file (default: stdout)")
+    args.add_argument("--engine", choices=sorted(engines), default="dispatch")
+    args.add_argument("--encoding", default="utf-8", help="encoding of the input files")
+    args.add_argument("--mmap", action="store_true", help="lex the mapped bytes of each file; offsets are in bytes")
+    args.add_argument("--unordered", action="store_true", help="write records as files finish, not in input order")
+    args.add_argument("--check", action="store_true", help="also lex with the reference engine and fail files where the output differs")
+    args.add_argument("--chunksize", type=int, default=64, help="files handed to a worker at a time")
+    args = args.parse_args(argv)
+
+    with open(args.grammar, encoding="utf-8") as f:
+        description = f.read()
+    binary_output = args.format == "binary"
+    initargs = (description, args.engine, args.encoding, binary_output, args.check, args.mmap)
+    # compiled here first, so a grammar the workers can't compile stops
+    # the run instead of the pool starting workers that fail again
+    try:
+        init_worker(*initargs)
+    except Exception as e:
+        print(f"{args.grammar}: {e}", file=sys.stderr)
+        return 2
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    failed = False
+    try:
+        names = json.dumps(rule_names(organizer(description)), separators=(",", ":"))
+        if binary_output:
+            names = names.encode("utf-8")
+            out.write(MAGIC + struct.pack("<I", len(names)) + names)
+        else:
+            out.write(f'{{"rules":{names}}}\n'.encode("utf-8"))
+        paths = expand(args.paths)
+        if args.jobs <= 1:
+            records = map(lex_file, paths)
+            failed = write(out, records)
+        else:
+            with Pool(args.jobs, initializer=start_worker, initargs=initargs) as pool:
+                imap = pool.imap_unordered if args.unordered else pool.imap
+                failed = write(out, imap(lex_file, paths, args.chunksize))
+    except WorkerError as e:
+        print(f"{args.grammar}: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+    return 1 if failed else 0
+
+def write(out, records: Iterable[tuple[bool, bytes]]) -> bool:
+    # returns whether some file could not be read
+    failed = False
+    for ok, data in records:
+        failed = failed or not ok
+        out.write(data)
+    return failed
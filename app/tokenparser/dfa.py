@@ -0,0 +1,321 @@
+from .parser import patternpairtype
+from .analyze import parse, sre, skipper
+from typing import Optional
+import re
+
+# A DFA for the rules re would give the same answer for: one automaton
+# walks all of them at once, in time linear in the token, instead of one
+# backtracking match per rule.
+#
+# Rules are compiled to one NFA program, each ending in MATCH. A DFA
+# state is the ordered list of NFA threads alive after some input, most
+# preferred first (rules by priority, then the order re would try the
+# alternatives in). Threads after the first MATCH are dropped, which is
+# what makes the result the match re picks, not the longest one.
+# States are built on demand and cached per input character.
+
+CHAR, SPLIT, JMP, MATCH = range(4)
+
+MAX_PROGRAM = 20000 # NFA instructions per engine, before giving rules to re
+MAX_STATES = 10000  # cached DFA states, before the cache is dropped
+
+
+class Unsupported(Exception):
+    pass
+
+
+def category_test(category, ascii, bytes):
+    if ascii and not bytes:
+        test = category_test(category, True, True)
+        return lambda c: test(ord(c))
+    if category in (sre.CATEGORY_DIGIT, sre.CATEGORY_NOT_DIGIT):
+        test = (lambda c: 48 <= c <= 57) if ascii else str.isdecimal
+    elif category in (sre.CATEGORY_WORD, sre.CATEGORY_NOT_WORD):
+        test = (lambda c: c == 95 or 48 <= c <= 57 or 65 <= c <= 90 or 97 <= c <= 122) if ascii \
+            else (lambda c: c == "_" or c.isalnum())
+    elif category in (sre.CATEGORY_SPACE, sre.CATEGORY_NOT_SPACE):
+        test = frozenset(b" \t\n\r\f\v").__contains__ if ascii else str.isspace
+    else:
+        raise Unsupported(category)
+    if category in (sre.CATEGORY_NOT_DIGIT, sre.CATEGORY_NOT_WORD, sre.CATEGORY_NOT_SPACE):
+        return lambda c: not test(c)
+    return test
+
+
+class Program:
+    """NFA program of one DFA segment: ops[pc] with args[pc]."""
+    def __init__(self):
+        self.ops = []
+        self.args = []
+
+    def emit(self, op, arg=None):
+        self.ops.append(op)
+        self.args.append(arg)
+        if len(self.ops) > MAX_PROGRAM:
+            raise Unsupported("program too large")
+        return len(self.ops) - 1
+
+    def rule(self, pattern: re.Pattern, index: int) -> int:
+        """Appends a rule; returns its entry. Raises Unsupported, leaving the program as it was."""
+        size = len(self.ops)
+        flags = pattern.flags
+        if flags & (re.IGNORECASE | re.LOCALE):
+            raise Unsupported("flags")
+        self.bytes = isinstance(pattern.pattern, bytes)
+        # \d, \w, \s: bytes patterns and re.ASCII only know ASCII, and bytes
+        # patterns see ints, so the ASCII tests compare ints
+        self.ascii = self.bytes or bool(flags & re.ASCII)
+        self.dotall = bool(flags & re.DOTALL)
+        try:
+            self.sequence(parse(pattern))
+            self.emit(MATCH, index)
+        except Unsupported:
+            del self.ops[size:], self.args[size:]
+            raise
+        return size
+
+    def sequence(self, items):
+        for op, av in items:
+            self.item(op, av)
+
+    def item(self, op, av):
+        if op is sre.LITERAL or op is sre.NOT_LITERAL or op is sre.ANY or op is sre.IN:
+            self.emit(CHAR, self.test(op, av))
+        elif op is sre.SUBPATTERN:
+            _, add_flags, del_flags, items = av
+            if add_flags or del_flags:
+                raise Unsupported("scoped flags")
+            self.sequence(items)
+        elif op is sre.BRANCH:
+            alternatives = av[1]
+            jumps = []
+            for items in alternatives[:-1]:
+                split = self.emit(SPLIT, [len(self.ops) + 1, None])
+                self.sequence(items)
+                jumps.append(self.emit(JMP, None))
+                self.args[split][1] = len(self.ops)
+            self.sequence(alternatives[-1])
+            for jump in jumps:
+                self.args[jump] = len(self.ops)
+        elif op is sre.MAX_REPEAT or op is sre.MIN_REPEAT:
+            low, high, items = av
+            if nullable(items):
+                raise Unsupported("repeat of something that can be empty")
+            greedy = op is sre.MAX_REPEAT
+            for _ in range(low):
+                self.sequence(items)
+            if high == sre.MAXREPEAT:
+                split = self.emit(SPLIT, None)
+                self.sequence(items)
+                self.emit(JMP, split)
+                self.args[split] = [split + 1, len(self.ops)] if greedy else [len(self.ops), split + 1]
+            else:
+                splits = []
+                for _ in range(high - low):
+                    splits.append(self.emit(SPLIT, None))
+                    self.sequence(items)
+                for split in splits:
+                    self.args[split] = [split + 1, len(self.ops)] if greedy else [len(self.ops), split + 1]
+        else: # AT, ASSERT, ASSERT_NOT, GROUPREF, atomic and possessive
+            raise Unsupported(str(op))
+
+    def test(self, op, av):
+        # a predicate on one element of the text (1-char str, or int for bytes)
+        if op is sre.LITERAL:
+            literal = av if self.bytes else chr(av)
+            return literal.__eq__
+        if op is sre.NOT_LITERAL:
+            literal = av if self.bytes else chr(av)
+            return literal.__ne__
+        if op is sre.ANY:
+            if self.dotall:
+                return lambda c: True
+            newline = 10 if self.bytes else "\n"
+            return newline.__ne__
+        negate = False
+        chars = set()
+        tests = []
+        for op, av in av:
+            if op is sre.NEGATE:
+                negate = True
+            elif op is sre.LITERAL:
+                chars.add(av)
+            elif op is sre.RANGE:
+                low, high = av
+                if high - low < 256:
+                    chars.update(range(low, high + 1))
+                elif self.bytes:
+                    tests.append(lambda c, low=low, high=high: low <= c <= high)
+                else:
+                    tests.append(lambda c, low=low, high=high: low <= ord(c) <= high)
+            elif op is sre.CATEGORY:
+                tests.append(category_test(av, self.ascii, self.bytes))
+            else:
+                raise Unsupported(str(op))
+        members = frozenset(chars if self.bytes else map(chr, chars))
+        if not tests:
+            return members.__contains__ if not negate else lambda c: c not in members
+        def test(c):
+            return c in members or any(t(c) for t in tests)
+        if negate:
+            return lambda c: not test(c)
+        return test
+
+
+def nullable(items) -> bool:
+    # can the sequence match the empty string (only for what Program supports)
+    for op, av in items:
+        if op is sre.SUBPATTERN:
+            if not nullable(av[3]):
+                return False
+        elif op is sre.BRANCH:
+            if not any(nullable(alternative) for alternative in av[1]):
+                return False
+        elif op is sre.MAX_REPEAT or op is sre.MIN_REPEAT:
+            if av[0] and not nullable(av[2]):
+                return False
+        elif op in (sre.LITERAL, sre.NOT_LITERAL, sre.ANY, sre.IN):
+            return False
+        else:
+            raise Unsupported(str(op))
+    return True
+
+
+class State:
+    __slots__ = ("threads", "accept", "next")
+
+    def __init__(self, threads, accept):
+        self.threads = threads # pcs of CHAR instructions, maybe a MATCH last
+        self.accept = accept   # rule index if the state ends in MATCH
+        self.next = {}
+
+
+class DFA:
+    """Lazily built DFA over the rules of one Program, best rule first."""
+    def __init__(self, program: Program, entries: list[int]):
+        self.ops = program.ops
+        self.args = program.args
+        self.tests = [arg if op == CHAR else None for op, arg in zip(program.ops, program.args)]
+        self.entries = entries
+        self.states = {}
+        self.dead = State((), None)
+        self.start = self.state(self.closure(entries))
+
+    def closure(self, pcs, out=None, seen=None):
+        # follows SPLIT and JMP depth-first, preferred branch first, and
+        # stops at the first MATCH: everything after it is less preferred
+        out = [] if out is None else out
+        seen = set() if seen is None else seen
+        ops, args = self.ops, self.args
+        stack = list(reversed(pcs))
+        while stack:
+            pc = stack.pop()
+            if pc in seen:
+                continue
+            seen.add(pc)
+            op = ops[pc]
+            if op == JMP:
+                stack.append(args[pc])
+            elif op == SPLIT:
+                stack.append(args[pc][1])
+                stack.append(args[pc][0])
+            else:
+                out.append(pc)
+                if op == MATCH:
+                    break
+        return out
+
+    def state(self, threads) -> State:
+        threads = tuple(threads)
+        if not threads:
+            return self.dead
+        state = self.states.get(threads)
+        if state is None:
+            if len(self.states) >= MAX_STATES:
+                for old in self.states.values():
+                    old.next.clear()
+                self.states.clear()
+            last = threads[-1]
+            accept = self.args[last] if self.ops[last] == MATCH else None
+            state = self.states[threads] = State(threads, accept)
+        return state
+
+    def step(self, state: State, c) -> State:
+        out = []
+        seen = set()
+        tests, ops = self.tests, self.ops
+        for pc in state.threads:
+            if ops[pc] == MATCH:
+                break
+            if tests[pc](c):
+                self.closure([pc + 1], out, seen)
+                if out and ops[out[-1]] == MATCH:
+                    break
+        following = self.state(out)
+        state.next[c] = following
+        return following
+
+    def match(self, text, pos):
+        state = self.start
+        dead = self.dead
+        found = None
+        n = len(text)
+        i = pos
+        while True:
+            if state.accept is not None:
+                found = (state.accept, i)
+            if i >= n:
+                return found
+            c = text[i]
+            following = state.next.get(c)
+            if following is None:
+                following = self.step(state, c)
+            if following is dead:
+                return found
+            state = following
+            i += 1
+
+
+class DFAEngine:
+    """
+    Engine (see tokenparser.engine) that runs consecutive rules re can be
+    replaced for through one DFA. A rule using anchors, lookarounds,
+    backreferences, case folding or empty-matching repeats keeps its own
+    re match in its place in the priority order; `fallback` lists them.
+    """
+    def __init__(self, patternpair: patternpairtype):
+        self.patternpair = patternpair
+        self.skip = skipper(patternpair)
+        self.fallback = []
+        self.parts = []
+        program, entries = Program(), []
+        for index, item in reversed(list(enumerate(patternpair))):
+            try:
+                entries.append(program.rule(item[0], index))
+                continue
+            except Unsupported:
+                pass
+            if entries:
+                self.parts.append((DFA(program, entries), None, None))
+                program, entries = Program(), []
+                try: # the program may just have been full
+                    entries.append(program.rule(item[0], index))
+                    continue
+                except Unsupported:
+                    pass
+            self.fallback.append(index)
+            self.parts.append((None, index, item[0].match))
+        if entries:
+            self.parts.append((DFA(program, entries), None, None))
+
+    def match(self, text, pos) -> Optional[tuple[int, int]]:
+        for dfa, index, match in self.parts:
+            if dfa is not None:
+                found = dfa.match(text, pos)
+                if found is not None:
+                    return found
+            else:
+                m = match(text, pos)
+                if m:
+                    return index, m.end()
+        return None
@@ -0,0 +1,178 @@
+from .parser import patternpairtype
+from .analyze import first_chars, skipper
+from .dfa import DFAEngine
+from .fold import fold_literals
+from typing import Optional
+import re
+
+# An engine answers one question for use(): which rule matches at `pos`?
+# match(text, pos) -> (index into patternpair, end offset) or None.
+# Rules are tried from the last one to the first, first hit wins.
+# Engines also carry `skip`, analyze.skipper() of their rules, for scan().
+
+matchtype = Optional[tuple[int, int]]
+
+# \1 .. \9 and (?(1)...) point at group numbers, which move once the rule
+# is wrapped inside a bigger pattern. "\\\\" is consumed so "\\1" is skipped.
+numbered_ref = re.compile(r'\\(?:\\|[1-9])|\(\?\(\d')
+
+
+class RuleEngine:
+    """One `pat.match` per rule until one of them hits."""
+    def __init__(self, patternpair: patternpairtype):
+        self.patternpair = patternpair
+        self.skip = skipper(patternpair)
+        self.rules = [(index, item[0].match) for index, item in reversed(list(enumerate(patternpair)))]
+
+    def match(self, text, pos) -> matchtype:
+        for index, match in self.rules:
+            m = match(text, pos)
+            if m:
+                return index, m.end()
+        return None
+
+
+class CombinedEngine:
+    """
+    All rules joined into one alternation of named groups, in the same
+    order RuleEngine tries them, so the regex engine picks the same rule.
+    Raises ValueError when the rules can't share a single pattern.
+    """
+    def __init__(self, patternpair: patternpairtype):
+        self.patternpair = patternpair
+        self.skip = skipper(patternpair)
+        if not patternpair:
+            self.pattern = re.compile(r"(?!x)x")
+            self.rule_at = []
+            return
+
+        flags = {item[0].flags for item in patternpair}
+        if len(flags) != 1:
+            raise ValueError("rules use different flags")
+
+        names = set()
+        parts = []
+        for index, item in reversed(list(enumerate(patternpair))):
+            pat = item[0]
+            source = pat.pattern if isinstance(pat.pattern, str) else pat.pattern.decode("latin-1")
+            if pat.groups and any(m.group() != "\\\\" for m in numbered_ref.finditer(source)):
+                raise ValueError(f"rule {index} refers to groups by number")
+            for name in pat.groupindex:
+                if name in names:
+                    raise ValueError(f"group name {name!r} is used twice")
+                names.add(name)
+            parts.append((f"_r{index}", pat.pattern))
+        for name, _ in parts:
+            if name in names:
+                raise ValueError(f"group name {name!r} is already taken")
+
+        joiner = "|" if isinstance(parts[0][1], str) else b"|"
+        source = joiner.join(wrap(name, pattern) for name, pattern in parts)
+        try:
+            self.pattern = re.compile(source, flags.pop())
+        except re.error as e:
+            raise ValueError(str(e)) from e
+
+        self.rule_at = [None] * (self.pattern.groups + 1)
+        for name, group in self.pattern.groupindex.items():
+            if name.startswith("_r") and name[2:].isdigit():
+                self.rule_at[group] = int(name[2:])
+
+    def match(self, text, pos) -> matchtype:
+        m = self.pattern.match(text, pos)
+        if m:
+            return self.rule_at[m.lastindex], m.end()
+        return None
+
+
+class DispatchEngine:
+    """
+    Rules bucketed by the character they can start with. Each bucket keeps
+    the priority order; rules whose first character can't be worked out
+    (see analyze.first_chars) sit in every bucket and in the catch-all.
+    With `fold`, literal rules next to each other in a bucket are looked
+    up at once (see tokenparser.fold); `folded` lists them.
+    """
+    def __init__(self, patternpair: patternpairtype, fold=True):
+        self.patternpair = patternpair
+        self.skip = skipper(patternpair)
+        rules = []
+        keys = set()
+        for index, item in reversed(list(enumerate(patternpair))):
+            first = first_chars(item[0])
+            rules.append((index, item[0].match, first))
+            if first is not None:
+                keys |= first
+        self.fallback = [(index, match) for index, match, first in rules if first is None]
+        self.buckets = {
+            key: [(index, match) for index, match, first in rules if first is None or key in first]
+            for key in keys
+        }
+        folded = set()
+        if fold: # literals always have first characters, so never in the catch-all
+            for key, bucket in self.buckets.items():
+                self.buckets[key], found = fold_literals(bucket, patternpair)
+                folded.update(found)
+        self.folded = sorted(folded)
+
+    def match(self, text, pos) -> matchtype:
+        for index, match in self.buckets.get(text[pos], self.fallback):
+            m = match(text, pos)
+            if m:
+                if index is None: # folded literals, m is (index, end)
+                    return m
+                return index, m.end()
+        return None
+
+
+def wrap(name, pattern):
+    if isinstance(pattern, bytes):
+        return b"(?P<" + name.encode() + b">" + pattern + b")"
+    return f"(?P<{name}>{pattern})"
+
+
+engines = {
+    'rules': RuleEngine,
+    'combined': CombinedEngine,
+    'dispatch': DispatchEngine,
+    'dfa': DFAEngine,
+}
+
+def compile_engine(patternpair: patternpairtype, kind='combined'):
+    """Builds the requested engine, falling back to RuleEngine if it can't be built."""
+    try:
+        return engines[kind](patternpair)
+    except ValueError:
+        return RuleEngine(patternpair)
+
+
+def scan(engine, text, pos=0):
+    """
+    Yields (rule index, start, end) for every token from `pos` on. A run
+    of text no rule matches is one token of rule len(patternpair), the
+    UNKNOWN rule of use.rule_names(); engine.skip jumps over the offsets
+    where no rule can start.
+    """
+    match = engine.match
+    skip = engine.skip
+    unknown = len(engine.patternpair)
+    n = len(text)
+    run = -1 # start of the unmatched run we're in
+    while pos < n:
+        found = match(text, pos)
+        if found and found[1] > pos:
+            if run >= 0:
+                yield unknown, run, pos
+                run = -1
+            yield found[0], pos, found[1]
+            pos = found[1]
+        else:
+            if run < 0:
+                run = pos
+            if skip is None:
+                pos += 1
+            else:
+                m = skip.search(text, pos + 1)
+                pos = m.start() if m else n
+    if run >= 0:
+        yield unknown, run, n
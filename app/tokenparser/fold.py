@@ -0,0 +1,62 @@
+from .analyze import literal
+
+# Literal rules (keywords, symbols) don't need a regex each: the text at
+# `pos` can be looked up instead. A run of literal rules next to each
+# other in priority order is folded into one Literals lookup; rules can't
+# move past a regex rule, so the result is the rule trying them in turn
+# would give. DispatchEngine folds within each first-character bucket,
+# so a grammar gains only where two literals start with the same
+# character; the default description has none (its symbols and keywords
+# each start differently) and folds nothing.
+
+
+class Literals:
+    """
+    Literal rules as one dict per literal length. match() looks up the
+    text at `pos` in each and, of the literals found, returns the one
+    first in priority order, as (rule index, end).
+    """
+    def __init__(self, rules):
+        # rules: (index, literal), highest priority first
+        tables = {}
+        for rank, (index, text) in enumerate(rules):
+            tables.setdefault(len(text), {}).setdefault(text, (rank, index, len(text)))
+        self.rules = [index for index, _ in rules]
+        self.tables = sorted(tables.items())
+
+    def match(self, text, pos):
+        best = None
+        for length, table in self.tables:
+            hit = table.get(text[pos:pos + length])
+            if hit is not None and (best is None or hit < best):
+                best = hit
+        if best is None:
+            return None
+        return best[1], pos + best[2]
+
+
+def fold_literals(rules, patternpair, least=2):
+    """
+    `rules`, (index, match) in priority order, with each run of at least
+    `least` literal rules replaced by (None, Literals.match). Returns the
+    new list and the indices of the folded rules.
+    """
+    out = []
+    folded = []
+    run = []
+    def flush():
+        if len(run) >= least:
+            out.append((None, Literals([(index, text) for index, _, text in run]).match))
+            folded.extend(index for index, _, _ in run)
+        else:
+            out.extend((index, match) for index, match, _ in run)
+        run.clear()
+    for index, match in rules:
+        text = literal(patternpair[index][0])
+        if text is None:
+            flush()
+            out.append((index, match))
+        else:
+            run.append((index, match, text))
+    flush()
+    return out, folded
@@ -0,0 +1,168 @@
+from .lexer import Lexer, Token, TokenType
+from .parser import Parser, organize_pattern, patternpairtype
+from .position import LineIndex
+from .engine import compile_engine
+from bisect import bisect_left, bisect_right
+import re
+
+
+def common_prefix(a: str, b: str) -> int:
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a)-mid:len(a)-lo] == b[len(b)-mid:len(b)-lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class GrammarModel:
+    """
+    Rule table of a description that keeps being edited. The description
+    is cut into its `TokenName { ... }` blocks, and update() only lexes
+    and parses the blocks between the parts the old and new text have in
+    common. A block whose text was parsed before, and every rule of an
+    untouched block, keeps its rule tuples; patterns are compiled once per
+    source. Engines from engine() are kept until the rules change.
+
+    Not thread safe; the IDE only updates it from its one lexing thread.
+    """
+    def __init__(self, cache=None):
+        # a GrammarCache to seed the patterns from and to store the first build in
+        self.cache = cache
+        self.description = None
+        self.index = None
+        self.blocks = []   # (start, end, source) tiling the description, the last one runs to EOF
+        self.parsed = {}   # block source -> {token name: [desc, its rules once organized]}
+        self.patterns = {} # pattern source -> re.Pattern
+        self.organized: patternpairtype = []
+        self.changed = []  # indexes of the rules the last update() added or replaced
+        self.engines = {}
+
+    def compile(self, source: str) -> re.Pattern:
+        pattern = self.patterns.get(source)
+        if pattern is None:
+            pattern = self.patterns[source] = re.compile(source)
+        return pattern
+
+    def engine(self, kind='dispatch'):
+        engine = self.engines.get(kind)
+        if engine is None:
+            engine = self.engines[kind] = compile_engine(self.organized, kind)
+        return engine
+
+    def update(self, description: str) -> patternpairtype:
+        """
+        Returns the rule table of `description`, the same list object as
+        before if no rule changed. Raises like Parser does on errors, and
+        then keeps the previous state.
+        """
+        old = self.description
+        if description == old:
+            return self.organized
+        if old is None:
+            self.seed(description)
+            index = LineIndex(description)
+            head, tail, resume = 0, 0, 0
+            suffix = delta = 0
+        else:
+            prefix = common_prefix(old, description)
+            suffix = common_suffix(old, description, min(len(old), len(description)) - prefix)
+            delta = len(description) - len(old)
+            index = self.index.copy() # kept if parsing fails
+            index.edit(description, prefix, len(old) - prefix - suffix, len(description) - prefix - suffix)
+            # blocks that end before the change, and blocks that start in
+            # the common suffix (candidates to resync on)
+            head = min(bisect_right(self.blocks, prefix, key=lambda block: block[1]), len(self.blocks) - 1)
+            tail = bisect_left(self.blocks, len(old) - suffix, key=lambda block: block[0])
+            resume = len(self.blocks)
+
+        blocks = self.blocks[:head]
+        start = blocks[-1][1] if blocks else 0
+        sync = len(description) - suffix
+        lexer = Lexer(description, index)
+        lexer.pos = start
+        tokens = []
+        fresh = []
+        while True:
+            token = lexer.get_next_token()
+            tokens.append(token)
+            if token.type is TokenType.EOF:
+                fresh.append((start, len(description), tokens))
+                break
+            if token.type is TokenType.RBRACE:
+                end = lexer.pos
+                eof = tuple.__new__(Token, (TokenType.EOF, '', token.line, token.column, end))
+                fresh.append((start, end, tokens + [eof]))
+                tokens = []
+                start = end
+                if end >= sync:
+                    # from an old block start on, both texts are the same
+                    at = bisect_left(self.blocks, end - delta, tail, key=lambda block: block[0])
+                    if at < len(self.blocks) and self.blocks[at][0] == end - delta:
+                        resume = at
+                        break
+
+        parsed = {}
+        for start, end, tokens in fresh:
+            source = description[start:end]
+            if source not in self.parsed and source not in parsed:
+                rules = Parser(tokens, compile=self.compile).parse()
+                parsed[source] = {name: [desc, None] for name, desc in rules.items()}
+            blocks.append((start, end, source))
+        blocks += [(start + delta, end + delta, source) for start, end, source in self.blocks[resume:]]
+
+        # a later block with the same token name replaces the rules in place, like Parser.parse
+        self.parsed.update(parsed)
+        owners = {}
+        for _, _, source in blocks:
+            for name in self.parsed[source]:
+                owners[name] = self.parsed[source]
+        organized = []
+        for name, entries in owners.items():
+            entry = entries[name]
+            if entry[1] is None:
+                entry[1] = organize_pattern({name: entry[0]})
+            organized += entry[1]
+
+        self.description = description
+        self.index = index
+        self.blocks = blocks
+        if organized != self.organized:
+            previous = set(self.organized)
+            self.changed = [i for i, rule in enumerate(organized) if rule not in previous]
+            self.organized = organized
+            self.engines = {}
+        else:
+            self.changed = []
+        self.prune()
+        if old is None and self.cache is not None:
+            self.cache.get(description, lambda _: organized)
+        return self.organized
+
+    def seed(self, description: str):
+        # patterns of a cached table for this description need no compiling
+        if self.cache is None:
+            return
+        key = self.cache.key(description)
+        organized = self.cache.entries.get(key) or self.cache.load(key)
+        for pattern, *_ in organized or ():
+            self.patterns.setdefault(pattern.pattern, pattern)
+
+    def prune(self):
+        # drop blocks and patterns of text that is gone, once they pile up
+        if len(self.parsed) > 2 * len(self.blocks) + 16:
+            self.parsed = {source: self.parsed[source] for _, _, source in self.blocks}
+        if len(self.patterns) > 2 * len(self.organized) + 64:
+            self.patterns = {rule[0].pattern: rule[0] for rule in self.organized}
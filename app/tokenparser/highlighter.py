@@ -1,57 +1,119 @@
 from PySide6.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor # type: ignore
 from PySide6.QtCore import QRegularExpression # type: ignore
 from .parser import patternpairtype
-import re
+from .engine import numbered_ref
 
-class TokenDescHighlighter(QSyntaxHighlighter):
+formats = {}
+regexes = {}
+
+def color_format(color):
+    """Shared QTextCharFormat for a foreground color."""
+    format = formats.get(color)
+    if format is None:
+        format = QTextCharFormat()
+        format.setForeground(QColor(color))
+        formats[color] = format
+    return format
+
+def regex(source):
+    """Shared QRegularExpression for a pattern source."""
+    pattern = regexes.get(source)
+    if pattern is None:
+        pattern = regexes[source] = QRegularExpression(source)
+    return pattern
+
+def combine_rules(rules):
+    """
+    Joins (QRegularExpression, format) rules, where later rules overwrite
+    earlier ones, into one alternation of named groups with the later
+    rules first. Returns the pattern and the format for each group number,
+    or None if some rule can't be embedded (named groups, numbered
+    backreferences, invalid pattern).
+
+    One pass colors what use() would lex: at each offset the last rule
+    that matches wins, and the scan goes on after its match. Rules whose
+    matches only overlap differ from the per-rule loop there: with `ab`
+    and then `bc`, "abc" is colored `ab` then, not `a` and then `bc`.
+    """
+    parts = []
+    group_formats = [None]
+    for index, (pattern, format) in reversed(list(enumerate(rules))):
+        source = pattern.pattern()
+        if any(pattern.namedCaptureGroups()[1:]) or any(m.group() != "\\\\" for m in numbered_ref.finditer(source)):
+            return None
+        parts.append(f"(?<r{index}>{source})")
+        group_formats += [format] * (pattern.captureCount() + 1)
+    combined = QRegularExpression("|".join(parts))
+    if not combined.isValid():
+        return None
+    return combined, group_formats
+
+class RuleHighlighter(QSyntaxHighlighter):
+    """
+    Highlights with self.rules, a list of (QRegularExpression, format)
+    where later rules overwrite earlier ones. Call combine() once the rules
+    are in place to scan each block once with the joined pattern, which
+    colors partly overlapping matches like the lexer (see combine_rules).
+    """
     def __init__(self, parent=None):
         super().__init__(parent)
         self.rules = []
+        self.combined = None
+
+    def combine(self):
+        self.combined = combine_rules(self.rules)
+
+    def highlightBlock(self, text):
+        if self.combined is not None:
+            combined, group_formats = self.combined
+            iterator = combined.globalMatch(text)
+            while iterator.hasNext():
+                match = iterator.next()
+                self.setFormat(match.capturedStart(), match.capturedLength(), group_formats[match.lastCapturedIndex()])
+            return
+        # Loop through rules. Later rules in the list overwrite earlier ones
+        # (if using setFormat on the same range).
+        for pattern, format in self.rules:
+            iterator = pattern.globalMatch(text)
+            while iterator.hasNext():
+                match = iterator.next()
+                self.setFormat(match.capturedStart(), match.capturedLength(), format)
+
+class TokenDescHighlighter(RuleHighlighter):
+    def __init__(self, parent=None):
+        super().__init__(parent)
 
         # 1. Base Identifier (Skyblue) -> SubToken
         # We apply this first. Specific rules below will overwrite this.
-        sub_token_fmt = QTextCharFormat()
-        sub_token_fmt.setForeground(QColor("#9CDCFE")) # Skyblue
-        self.rules.append((QRegularExpression(r'\b[a-zA-Z_]\w*\b[^"]'), sub_token_fmt))
+        sub_token_fmt = color_format("#9CDCFE") # Skyblue
+        self.rules.append((QRegularExpression(r'\b[a-zA-Z_]\w*\b(?!")'), sub_token_fmt))
 
         # 2. Categories (Purple) -> Special, Normal
         # Overwrites SubToken color for these specific words
-        category_fmt = QTextCharFormat()
-        category_fmt.setForeground(QColor("#C586C0")) # Purple
+        category_fmt = color_format("#C586C0") # Purple
         self.rules.append((QRegularExpression(r'\b(Special|Normal)\b'), category_fmt))
 
         # 3. TokenName (Yellow)
         # Identifier followed by '{'. 
         # Regex: Identifier (?= lookahead for whitespace and {)
-        token_name_fmt = QTextCharFormat()
-        token_name_fmt.setForeground(QColor("#DCDCAA")) # Yellow
+        token_name_fmt = color_format("#DCDCAA") # Yellow
         self.rules.append((QRegularExpression(r'\b[a-zA-Z_]\w*\b(?=\s*\{)'), token_name_fmt))
 
         # 4. Symbols (White) -> { } [ ] ,
         # Overwrites previous if matched
-        symbol_fmt = QTextCharFormat()
-        symbol_fmt.setForeground(QColor("#FFFFFF")) # White
+        symbol_fmt = color_format("#FFFFFF") # White
         self.rules.append((QRegularExpression(r'[\[\]{},]'), symbol_fmt))
 
         # 5. Pattern (Green) -> r"..."
-        pattern_fmt = QTextCharFormat()
-        pattern_fmt.setForeground(QColor("#6A9955")) # Green
+        pattern_fmt = color_format("#6A9955") # Green
         self.rules.append((QRegularExpression(r'"([^\"\\]|\\[\s\S])*"'), pattern_fmt))
 
         # 5. Pattern (Green) -> r"..."
-        pattern_fmt = QTextCharFormat()
-        pattern_fmt.setForeground(QColor("#CE6021")) # Green
+        pattern_fmt = color_format("#CE6021") # Green
         self.rules.append((QRegularExpression(r'#[0-9a-fA-F]{6}'), pattern_fmt))
 
-    def highlightBlock(self, text):
-        # Loop through rules. Later rules in the list overwrite earlier ones 
-        # (if using setFormat on the same range).
-        # Our order: SubToken -> Category -> TokenName -> Pattern -> Symbol
-        for pattern, format in self.rules:
-            iterator = pattern.globalMatch(text)
-            while iterator.hasNext():
-                match = iterator.next()
-                self.setFormat(match.capturedStart(), match.capturedLength(), format)
+        # Our order: SubToken -> Category -> TokenName -> Symbol -> Pattern -> Color
+        self.combine()
 
 def metaclass_LexerTestHighlighter(patternpair: patternpairtype):
     normals = []
@@ -68,36 +130,69 @@ def metaclass_LexerTestHighlighter(patternpair: patternpairtype):
         exceptional.append((pattern.pattern, color))
     normal_re = ("|".join(normals)) if normals else r"(?!x)x"
     special_re = ("|".join(specials)) if specials else r"(?!x)x"
-    class Highlighter(QSyntaxHighlighter):
+    class Highlighter(RuleHighlighter):
         def __init__(self, parent=None):
             super().__init__(parent)
-            self.rules = []
 
-            #symbol_fmt = QTextCharFormat()
-            #symbol_fmt.setForeground(QColor("#FFFFFF")) # White
+            #symbol_fmt = color_format("#FFFFFF") # White
             #self.rules.append((QRegularExpression(r'[\[\]{},]'), symbol_fmt))
 
-            normal_token_fmt = QTextCharFormat()
-            normal_token_fmt.setForeground(QColor("#DCDCAA")) # Yellow
+            normal_token_fmt = color_format("#DCDCAA") # Yellow
             self.rules.append((QRegularExpression(normal_re), normal_token_fmt))
             
             for pattern, color in exceptional:
-                exceptional_token_fmt = QTextCharFormat()
-                exceptional_token_fmt.setForeground(QColor(color))
-                self.rules.append((QRegularExpression(pattern), exceptional_token_fmt))
+                self.rules.append((regex(pattern), color_format(color)))
 
-            special_token_fmt = QTextCharFormat()
-            special_token_fmt.setForeground(QColor("#9CDCFE")) # Skyblue
+            special_token_fmt = color_format("#9CDCFE") # Skyblue
             self.rules.append((QRegularExpression(special_re), special_token_fmt))
 
+            self.combine()
 
-        def highlightBlock(self, text):
-            # Loop through rules. Later rules in the list overwrite earlier ones 
-            # (if using setFormat on the same range).
-            # Our order: SubToken -> Category -> TokenName -> Pattern -> Symbol
-            for pattern, format in self.rules:
-                iterator = pattern.globalMatch(text)
-                while iterator.hasNext():
-                    match = iterator.next()
-                    self.setFormat(match.capturedStart(), match.capturedLength(), format)
     return Highlighter
+
+def metaclass_LexerStreamHighlighter(patternpair: patternpairtype):
+    """
+    Highlighter that colors the tokens the lexer already found instead of
+    matching the rules again. Give it a TokenStream with set_tokens(); each
+    block then only looks at the tokens overlapping it. set_rules() moves
+    it to another rule table without a new highlighter (and without
+    rehighlighting; refresh() the blocks that changed).
+    """
+    class StreamHighlighter(QSyntaxHighlighter):
+        def __init__(self, parent=None):
+            super().__init__(parent)
+            self.tokens = None
+            self.set_rules(patternpair)
+
+        def set_rules(self, patternpair):
+            # rule id -> color, for tokenparser.stream.color_changes
+            self.colors = {rule: color for rule, (_, _, _, _, color) in enumerate(patternpair) if color}
+            self.formats = {rule: color_format(color) for rule, color in self.colors.items()}
+
+        def set_tokens(self, tokens):
+            self.tokens = tokens
+
+        def refresh(self, ranges):
+            """Rehighlights the blocks touching the (start, end) offset ranges."""
+            document = self.document()
+            if document is None:
+                return
+            for start, end in ranges:
+                block = document.findBlock(start)
+                last = document.findBlock(max(start, end - 1)).blockNumber()
+                while block.isValid() and block.blockNumber() <= last:
+                    self.rehighlightBlock(block)
+                    block = block.next()
+
+        def highlightBlock(self, text):
+            if self.tokens is None:
+                return
+            block_start = self.currentBlock().position()
+            block_end = block_start + len(text)
+            formats = self.formats
+            for start, end, rule in self.tokens.overlapping(block_start, block_end):
+                format = formats.get(rule)
+                if format is not None:
+                    start = max(start, block_start)
+                    self.setFormat(start - block_start, min(end, block_end) - start, format)
+    return StreamHighlighter
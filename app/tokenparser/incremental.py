@@ -0,0 +1,122 @@
+from .parser import patternpairtype
+from .engine import RuleEngine
+from .reach import Reach
+from .position import Offsets
+from .stream import TokenStream
+from .use import rule_names
+from array import array
+from itertools import repeat
+
+
+class IncrementalLexer:
+    """
+    Holds the TokenStream of one text and, on edit(), re-lexes from the
+    token before the edit until the new tokens line up with the old ones
+    again, then reuses the old tail. `relexed` is the (start, end) of the
+    new text whose tokens were lexed again by the last edit (all of it
+    after a full lex); outside it the tokens are the old ones, shifted.
+
+    `reached` has, per token, how far lexing up to and including it
+    read (see tokenparser.reach): tokens an edit can't have changed are
+    the ones lexed without reading the edited text.
+
+    The offsets of the tokens after an edit, and their `reached`, are
+    moved lazily (see position.Offsets), so an edit costs about the
+    tokens lexed again, not all of the ones after it.
+    """
+    def __init__(self, patternpair: patternpairtype, text: str, engine=None, reach=None):
+        self.patternpair = patternpair
+        self.engine = engine if engine is not None else RuleEngine(patternpair)
+        self.reach = reach if reach is not None else Reach(patternpair)
+        self.tokens = TokenStream(text, rule_names(patternpair))
+        self.reached = array('q')
+        append = self.reached.append
+        for rule, start, end, top in self.reach.scan(self.engine, text):
+            self.tokens.append(rule, start, end)
+            append(top)
+        self.relexed = (0, len(text))
+
+    @property
+    def text(self):
+        return self.tokens.text
+
+    @property
+    def reached(self) -> array:
+        offsets = self._reached
+        if offsets.delta:
+            offsets = self._reached = offsets.settled()
+        return offsets.columns[0]
+
+    @reached.setter
+    def reached(self, reached: array):
+        self._reached = Offsets((reached,), len(reached))
+
+    def copy(self) -> "IncrementalLexer":
+        """A lexer with its own copy of the tokens, to edit on another thread."""
+        other = IncrementalLexer.__new__(IncrementalLexer)
+        other.patternpair = self.patternpair
+        other.engine = self.engine
+        other.reach = self.reach
+        other.tokens = self.tokens.copy()
+        other._reached = self._reached.copy()
+        other.relexed = self.relexed
+        return other
+
+    def restart(self, old: str, position: int) -> int:
+        """
+        Number of tokens of `old`, the text before an edit at `position`,
+        that are kept; lexing starts again where the last of them ends.
+        """
+        # Keep the tokens lexed before anything read the edit. A restart
+        # right after an UNKNOWN run would split it, so it is re-lexed too.
+        k = self._reached.bisect_right(0, position)
+        if k and self.tokens.rules[k-1] == len(self.patternpair):
+            k -= 1
+        return k
+
+    def edit(self, text: str, position: int, removed: int, added: int) -> TokenStream:
+        """
+        `text` is the whole new text, the rest is what
+        QTextDocument.contentsChange reports. Returns the updated stream.
+        """
+        old = self.text
+        tokens = self.tokens
+        delta = added - removed
+        if position < 0 or position + removed > len(old) or len(text) != len(old) + delta:
+            # not an edit of the text we hold (e.g. setPlainText), start over
+            self.__init__(self.patternpair, text, self.engine, self.reach)
+            return self.tokens
+
+        offsets, reached = tokens.offsets, self._reached
+        k = self.restart(old, position)
+        restart = offsets.value(1, k-1) if k else 0
+        top = reached.value(0, k-1) if k else 0
+
+        # Stop at the first new token past the edit that starts where an
+        # old token started, far enough past it that looking back from
+        # there doesn't see the edit; from there on both texts lex the same.
+        sync = position + added + max(self.reach.behind, 1)
+        j = n = len(offsets)
+        new_starts, new_ends, new_rules, new_reached = array('q'), array('q'), array('i'), array('q')
+        for rule, start, end, reach in self.reach.scan(self.engine, text, restart, top):
+            if start >= sync:
+                at = offsets.bisect_left(0, start - delta, k)
+                if at < n and offsets.value(0, at) == start - delta:
+                    j = at
+                    break
+            new_starts.append(start)
+            new_ends.append(end)
+            new_rules.append(rule)
+            new_reached.append(reach)
+            top = reach
+
+        self.relexed = (restart, offsets.value(0, j) + delta if j < n else len(text))
+        tokens.offsets = offsets.splice(k, j, (new_starts, new_ends), delta)
+        tokens.rules[k:j] = new_rules
+        m = reached.bisect_left(0, top - delta, j) # shifted, reached is past top from here
+        new_reached.extend(repeat(top, m - j))
+        self._reached = reached.splice(k, m, (new_reached,), delta)
+        if tokens._index is not None:
+            tokens._index.edit(text, position, removed, added)
+        tokens.text = text
+        return tokens
@@ -0,0 +1,245 @@
+from .parser import patternpairtype
+from .engine import RuleEngine
+from .incremental import IncrementalLexer
+from .reach import Reach
+from .stream import TokenStream
+from .use import rule_names
+from array import array
+from bisect import bisect_left, bisect_right
+from time import perf_counter
+
+# A lexer only carries its position, so the end of any token it produced
+# is a checkpoint it can resume from. LazyLexer keeps the tokens of a
+# prefix of the text, front to back, and a paused scan() at the end of it
+# to lex more when asked.
+#
+# Text further on can be lexed ahead of the prefix into an island,
+# starting at a line start: a guess, as the line may start inside a
+# token. Once the prefix reaches a token start the island also has, both
+# lex the same from there and the island is adopted; a prefix that runs
+# past the island without meeting it drops it. After an edit, the old
+# tokens past the edit become the island, like the tail IncrementalLexer
+# reuses. An island is a list of Pieces whose offsets are only shifted
+# when read, so an edit doesn't touch every token after it.
+
+
+class Piece:
+    """
+    Token columns of part of an island, from `lo` on, with how far lexing
+    them read like IncrementalLexer.reached; offsets are `delta` off.
+    """
+    __slots__ = ("starts", "ends", "rules", "reached", "lo", "delta")
+
+    def __init__(self, starts, ends, rules, reached, lo=0, delta=0):
+        self.starts = starts
+        self.ends = ends
+        self.rules = rules
+        self.reached = reached
+        self.lo = lo
+        self.delta = delta
+
+    def first(self) -> int:
+        return self.starts[self.lo] + self.delta
+
+    def last(self) -> int:
+        return self.ends[-1] + self.delta
+
+
+class LazyLexer(IncrementalLexer):
+    """
+    Tokens of a text lexed on demand. `tokens` holds the tokens of
+    text[:end] only; ensure(), advance() and fill() lex further, and
+    window() also lexes a range far ahead into an island. overlapping()
+    gives the tokens known for a range, prefix or island, so highlighters
+    can take a LazyLexer where they take a TokenStream.
+    """
+    def __init__(self, patternpair: patternpairtype, text: str, engine=None, reach=None):
+        self.patternpair = patternpair
+        self.engine = engine if engine is not None else RuleEngine(patternpair)
+        self.reach = reach if reach is not None else Reach(patternpair)
+        self.tokens = TokenStream(text, rule_names(patternpair))
+        self.reached = array('q')
+        self.island = [] # Pieces, in order and back to back
+        self.end = 0
+        self.scanner = None # scan() paused at end, None when it moved
+        self.relexed = (0, 0)
+
+    @property
+    def done(self) -> bool:
+        return self.end >= len(self.text)
+
+    def copy(self):
+        """
+        Raises TypeError: a LazyLexer only has the tokens of what was
+        looked at, and is lexed and edited on the GUI thread alone.
+        """
+        raise TypeError("a LazyLexer can't be copied")
+
+    def advance(self, offset: int) -> int:
+        """Lexes the prefix until it reaches `offset` (or the end); returns the new end."""
+        while self.end < offset and not self.done:
+            if self.island and self.island[0].first() == self.end:
+                self.adopt(offset)
+            else:
+                self.lex(offset)
+        return self.end
+
+    def lex(self, offset: int):
+        # scans until `offset`, or until the scan meets the island
+        tokens = self.tokens
+        reached = self.reached
+        island = self.island
+        first = island[0].first() if island else None
+        if self.scanner is None:
+            self.scanner = self.reach.scan(self.engine, self.text, self.end, reached[-1] if reached else 0)
+        for rule, start, end, reach in self.scanner:
+            if first is not None and start >= first:
+                if self.meet(start):
+                    # same position as the island, same tokens from here on
+                    self.scanner = None
+                    return
+                if start >= island[-1].last():
+                    del island[:]
+                    first = None
+            tokens.append(rule, start, end)
+            reached.append(reach)
+            self.end = end
+            if end >= offset:
+                return
+        self.end = len(self.text)
+
+    def meet(self, offset: int) -> bool:
+        # drops the island before a token starting at `offset`, if it has one
+        island = self.island
+        for i, piece in enumerate(island):
+            at = bisect_left(piece.starts, offset - piece.delta, piece.lo)
+            if at < len(piece.starts):
+                if piece.starts[at] + piece.delta != offset:
+                    return False
+                piece.lo = at
+                del island[:i]
+                return True
+        return False
+
+    def adopt(self, offset: int):
+        # moves island tokens starting before `offset` to the prefix
+        piece = self.island[0]
+        starts, ends, rules, lo, delta = piece.starts, piece.ends, piece.rules, piece.lo, piece.delta
+        j = max(bisect_left(starts, offset - delta, lo), lo + 1)
+        tokens = self.tokens
+        if delta:
+            tokens.starts.extend(start + delta for start in starts[lo:j])
+            tokens.ends.extend(end + delta for end in ends[lo:j])
+        else:
+            tokens.starts.extend(starts[lo:j])
+            tokens.ends.extend(ends[lo:j])
+        tokens.rules.extend(rules[lo:j])
+        top = self.reached[-1] if self.reached else 0
+        self.reached.extend(max(top, reach + delta) for reach in piece.reached[lo:j])
+        self.end = ends[j-1] + delta
+        self.scanner = None
+        piece.lo = j
+        if j == len(starts):
+            del self.island[0]
+
+    def ensure(self, offset: int):
+        """Lexes the prefix past `offset`, so the token at `offset` is known."""
+        if self.end <= offset:
+            self.advance(offset + 1)
+
+    def fill(self, seconds: float, chunk: int = 1 << 14) -> bool:
+        """Lexes the prefix for about `seconds`; returns whether text is left."""
+        stop = perf_counter() + seconds
+        while not self.done and perf_counter() < stop:
+            self.advance(self.end + chunk)
+        return not self.done
+
+    def window(self, start: int, end: int, margin: int = 1 << 16):
+        """
+        Makes tokens known for text[start:end]: by lexing the prefix up
+        to it if it is within `margin`, else into an island.
+        """
+        if start <= self.end + margin:
+            self.advance(end)
+            return
+        island = self.island
+        if island and island[0].first() <= start <= island[-1].last():
+            piece = island[-1]
+            begin = piece.last()
+            top = piece.reached[-1] + piece.delta
+        else:
+            begin = self.text.rfind('\n', 0, start) + 1
+            if begin <= self.end: # one long line, lex up to it
+                self.advance(end)
+                return
+            piece = Piece(array('q'), array('q'), array('i'), array('q'))
+            self.island = island = [piece]
+            top = 0
+        delta = piece.delta
+        if begin < end:
+            for rule, s, e, top in self.reach.scan(self.engine, self.text, begin, top):
+                piece.starts.append(s - delta)
+                piece.ends.append(e - delta)
+                piece.rules.append(rule)
+                piece.reached.append(top - delta)
+                if e >= end:
+                    break
+        if piece.lo >= len(piece.starts):
+            island.remove(piece)
+
+    def overlapping(self, start: int, end: int):
+        """Yields (start, end, rule) of the known tokens that overlap [start, end)."""
+        if start < self.end:
+            yield from self.tokens.overlapping(start, min(end, self.end))
+        for piece in self.island:
+            if piece.last() <= start or piece.first() >= end:
+                continue
+            starts, ends, rules, delta = piece.starts, piece.ends, piece.rules, piece.delta
+            i = max(bisect_right(starts, start - delta, piece.lo) - 1, piece.lo)
+            while i < len(starts) and starts[i] + delta < end:
+                if ends[i] + delta > start and starts[i] + delta >= self.end:
+                    yield starts[i] + delta, ends[i] + delta, rules[i]
+                i += 1
+
+    def edit(self, text: str, position: int, removed: int, added: int) -> TokenStream:
+        """
+        Like IncrementalLexer.edit, but nothing is lexed: the prefix is cut
+        back to where lexing restarts, and the old tokens past the edit
+        become the island. `relexed` is the range whose tokens were dropped.
+        """
+        old = self.text
+        tokens = self.tokens
+        delta = added - removed
+        if position < 0 or position + removed > len(old) or len(text) != len(old) + delta:
+            self.__init__(self.patternpair, text, self.engine, self.reach)
+            return self.tokens
+        k = self.restart(old, position)
+        starts, ends, rules = tokens.starts, tokens.ends, tokens.rules
+        restart = ends[k-1] if k else 0
+        # old offsets of tokens past the edit, looking back from them included
+        after = position + removed + max(self.reach.behind, 1)
+
+        # the island goes on from the prefix's tail, if it did, then only
+        # tokens past the edit stay, shifted
+        island = self.island
+        at = bisect_left(starts, after)
+        if at < len(starts):
+            if island and island[0].first() != self.end:
+                island = []
+            island = [Piece(starts[at:], ends[at:], rules[at:], self.reached[at:])] + island
+        kept = []
+        for piece in island:
+            piece.lo = bisect_left(piece.starts, after - piece.delta, piece.lo)
+            if piece.lo < len(piece.starts):
+                piece.delta += delta
+                kept.append(piece)
+
+        self.relexed = (restart, kept[0].first() if kept else len(text))
+        del starts[k:], ends[k:], rules[k:], self.reached[k:]
+        if tokens._index is not None:
+            tokens._index.edit(text, position, removed, added)
+        tokens.text = text
+        self.island = kept
+        self.end = restart
+        self.scanner = None
+        return tokens
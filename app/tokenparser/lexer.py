@@ -1,9 +1,9 @@
-import sys
+from .position import LineIndex
+from bisect import bisect_right
 from enum import Enum, auto
+from typing import NamedTuple
 import re
 
-stringpattern = re.compile(r'("(?:[^\"\\]|\\[\s\S])*")')
-
 class TokenType(Enum):
     IDENTIFIER = auto()  # TokenName, Category, SubToken
     STRING = auto()      # r"..."
@@ -16,132 +16,97 @@ class TokenType(Enum):
     EOF = auto()
     COLOR = auto()
 
-class Token:
-    def __init__(self, type, value, line=0, column=0, position=0):
-        self.type = type
-        self.value = value
-        self.line = line
-        self.column = column
-        self.position = position
+class Token(NamedTuple):
+    type: TokenType
+    value: str
+    line: int = 0
+    column: int = 0
+    position: int = 0
 
     def __repr__(self):
         return f"Token({self.type.name}, '{self.value}')"
 
+# One step of the scanner: whitespace, then the first alternative that
+# matches decides the token (none left: EOF). A color is "#" and the 6
+# characters after it, whatever they are.
+master = re.compile(r"""
+    \s*
+    (?:
+        (?P<string>r"(?:[^"\\]|\\[\s\S])*")
+      | (?P<open>r")
+      | (?P<word>\w+)
+      | (?P<color>\#.{0,6})
+      | (?P<symbol>[{}\[\],])
+      | (?P<other>.)
+    )?
+""", re.VERBOSE | re.DOTALL)
+
+symbols = {
+    '{': TokenType.LBRACE,
+    '}': TokenType.RBRACE,
+    '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET,
+    ',': TokenType.COMMA,
+}
+
 class Lexer:
     """
     Lexer for the Token Description Language.
     Input: "Identifier { Special r'if' }"
     Output: Stream of Token objects.
+
+    A token's line/column is where the lexer stands after reading it, and
+    its position is where the token starts, except for symbols, colors,
+    unknown characters and EOF, whose position is where the lexer stood
+    before the whitespace in front of them.
     """
-    def __init__(self, text):
+    def __init__(self, text, index=None):
         self.text = text
         self.pos = 0
-        self.line = 1
-        self.column = 1
-        self.current_char = self.text[0] if self.text else ""
-
-    def advance(self, much=1):
-        for i in range(much):
-            if self.current_char == '\n':
-                self.line += 1
-                self.column = 0
-            
-            self.pos += 1
-            if self.pos < len(self.text):
-                self.current_char = self.text[self.pos]
-                self.column += 1
-            else:
-                self.current_char = ""
-                break
-
-    def skip_whitespace(self):
-        while self.current_char != "" and self.current_char.isspace():
-            self.advance()
-
-    def read_identifier(self):
-        result = ''
-        starting = self.pos
-        while self.current_char != "" and (self.current_char.isalnum() or self.current_char == '_'):
-            result += self.current_char
-            self.advance()
-        return Token(TokenType.IDENTIFIER, result, self.line, self.column, starting)
-
-    def read_string(self):
-        # Expecting r"..."
-        result = ''
-        starting = self.pos
-        # Consume 'r'
-        if self.current_char == 'r':
-            result += self.current_char
-            self.advance()
-        
-        # Check for quote
-        if self.current_char != '"':
-            return Token(TokenType.UNKNOWN, result, self.line, self.column, starting)
-        
-        s = self.pos
-        match = stringpattern.match(self.text, self.pos)
-        if match:
-            d = match.end()
-            result += self.text[s:d]
-            #result += match.group()
-            d = match.end()
-        else:
-            d = s+1
-        self.advance(d-s)
-        return Token(TokenType.STRING, result, self.line, self.column, starting)
+        self.index = index if index is not None else LineIndex(text)
+        self.last = len(text) - 1
 
     def get_next_token(self):
+        text = self.text
         starting = self.pos
-        while self.current_char != "":
-            if self.current_char.isspace():
-                self.skip_whitespace()
-                continue
-
-            if self.current_char.isalpha():
-                # Check if it is start of r"..."
-                if self.pos + 1 < len(self.text) and self.text[self.pos+1] == '"':
-                    return self.read_string()
-                return self.read_identifier()
-
-            if self.current_char == "#":
-                color = self.text[self.pos:self.pos+7]
-                self.advance(7)
-                return Token(TokenType.COLOR, color, self.line, self.column, starting)
-
-            if self.current_char == '{':
-                self.advance()
-                return Token(TokenType.LBRACE, '{', self.line, self.column, starting)
-            
-            if self.current_char == '}':
-                self.advance()
-                return Token(TokenType.RBRACE, '}', self.line, self.column, starting)
-
-            if self.current_char == '[':
-                self.advance()
-                return Token(TokenType.LBRACKET, '[', self.line, self.column, starting)
-
-            if self.current_char == ']':
-                self.advance()
-                return Token(TokenType.RBRACKET, ']', self.line, self.column, starting)
-
-            if self.current_char == ',':
-                self.advance()
-                return Token(TokenType.COMMA, ',', self.line, self.column, starting)
-
-            # Unknown char
-            char = self.current_char
-            self.advance()
-            return Token(TokenType.UNKNOWN, char, self.line, self.column, starting)
-
-        return Token(TokenType.EOF, '', self.line, self.column, starting)
+        m = master.match(text, starting)
+        kind = m.lastgroup
+        end = m.end()
+        if kind is None:
+            value, type, position = '', TokenType.EOF, starting
+        elif kind == 'word':
+            pos = m.start(kind)
+            value = m.group(kind)
+            if not value[0].isalpha():
+                # identifiers start with a letter, _ and digits are unknown
+                value, type, position, end = value[0], TokenType.UNKNOWN, starting, pos + 1
+            elif end == pos + 1 and text[end:end+1] == '"':
+                # a letter other than r in front of a quote
+                type, position = TokenType.UNKNOWN, pos
+            else:
+                type, position = TokenType.IDENTIFIER, pos
+        elif kind == 'string':
+            value, type, position = m.group(kind), TokenType.STRING, m.start(kind)
+        elif kind == 'open':
+            # r" without a closing quote
+            value, type, position = 'r', TokenType.STRING, m.start(kind)
+        elif kind == 'color':
+            value, type, position = m.group(kind), TokenType.COLOR, starting
+        else:
+            value, position = m.group(kind), starting
+            type = symbols.get(value, TokenType.UNKNOWN)
+        self.pos = end
+        # where the lexer stands after the token; at the very end the
+        # column stays on the last character
+        line = bisect_right(self.index.starts, end)
+        column = min(end, self.last) - self.index.starts[line-1] + 1 if self.text else 1
+        return tuple.__new__(Token, (type, value, line, column, position))
 
     def tokenize(self):
         tokens = []
         while True:
             token = self.get_next_token()
             tokens.append(token)
-            if token.type == TokenType.EOF:
+            if token.type is TokenType.EOF:
                 break
         return tokens
-
@@ -0,0 +1,130 @@
+from .parser import patternpairtype
+from .engine import RuleEngine, scan
+from .stream import TokenStream
+from .position import BufferLineIndex
+from .use import rule_names
+import mmap, re, unicodedata
+
+# Lexing a file through an mmap of it: the rules are recompiled as bytes
+# patterns and matched on the mapped bytes, so the file is never read
+# into a str. Offsets, and columns, are in bytes.
+
+RELEASE = 64 << 20 # bytes lexed between handing the pages behind us back to the OS
+
+
+def byte_rules(patternpair: patternpairtype) -> patternpairtype:
+    """
+    The rules with their patterns compiled as utf-8 bytes. A non-ASCII
+    character, written out or as an escape, becomes the group of its
+    bytes, so a repeat after it repeats all of them. In a bytes pattern
+    a character class, ., \\w, \\d and \\s see single bytes, so
+    classes holding non-ASCII characters, and case folding of them, are
+    refused with a ValueError; the others match byte by byte.
+    """
+    rules = []
+    for index, (pattern, *rest) in enumerate(patternpair):
+        try:
+            source = pattern_bytes(pattern)
+            rules.append((re.compile(source, pattern.flags & ~re.UNICODE), *rest))
+        except (ValueError, re.error) as e:
+            raise ValueError(f"rule {index} {pattern.pattern!r} can't be matched on bytes: {e}") from e
+    return rules
+
+# an escape in a str pattern that stands for one character, with its
+# code point in group 1 (hex) or 2 (octal); \N{name} is looked up
+escape = re.compile(r"\\(?:x([0-9a-fA-F]{2})|u([0-9a-fA-F]{4})|U([0-9a-fA-F]{8})|N\{([^}]*)\}"
+                    r"|(0[0-7]{0,2}|[1-3][0-7]{2})|(.))", re.DOTALL)
+
+def pattern_bytes(pattern: re.Pattern) -> bytes:
+    # the source of a str pattern in utf-8, its non-ASCII characters
+    # spelled as bytes; re.error for one inside a class
+    source = pattern.pattern
+    fold = bool(pattern.flags & re.IGNORECASE)
+    out = []
+    in_class = False
+    first = False # right after the [ or [^ opening a class, where ] is literal
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if c == "\\":
+            m = escape.match(source, i)
+            if m is None:
+                raise re.error("bad escape (end of pattern)", source, i)
+            i = m.end()
+            hexa, short, long, name, octal, other = m.groups()
+            if other is not None:
+                if other.isascii():
+                    out.append(m.group().encode("ascii"))
+                else: # an escaped non-ASCII character stands for itself
+                    out.append(character(ord(other), in_class, fold, source, m.start()))
+                first = False
+                continue
+            if name is not None:
+                try:
+                    code = ord(unicodedata.lookup(name))
+                except KeyError:
+                    raise re.error(f"undefined character name {name!r}", source, m.start())
+            elif octal is not None:
+                code = int(octal, 8)
+            else:
+                code = int(hexa or short or long, 16)
+            out.append(character(code, in_class, fold, source, m.start()))
+            first = False
+            continue
+        if in_class:
+            if c == "]" and not first:
+                in_class = False
+            first = first and c == "^" and source[i - 1] == "["
+        elif c == "[":
+            in_class = first = True
+        if c.isascii():
+            out.append(c.encode("ascii"))
+        else:
+            out.append(character(ord(c), in_class, fold, source, i))
+        i += 1
+    return b"".join(out)
+
+def character(code: int, in_class: bool, fold: bool, source: str, at: int) -> bytes:
+    if code < 0x80:
+        return b"\\x%02x" % code
+    if in_class:
+        raise re.error(f"non-ASCII character {chr(code)!r} in a class", source, at)
+    if fold and chr(code).lower() != chr(code).upper():
+        raise re.error(f"case folding non-ASCII character {chr(code)!r}", source, at)
+    return b"(?:" + b"".join(b"\\x%02x" % byte for byte in chr(code).encode("utf-8")) + b")"
+
+def map_file(path: str):
+    """Read-only mmap of a file; b"" for an empty one, which can't be mapped."""
+    with open(path, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # empty file
+            return b""
+
+def use_mapped(patternpair: patternpairtype, source, engine=None, release=RELEASE) -> TokenStream:
+    """
+    use() over the bytes of `source`, a path or a buffer such as an mmap.
+    `patternpair` is the usual str rule table; `engine`, if given, must be
+    built on byte_rules(patternpair). The TokenStream keeps the mapping
+    as its text, so values are bytes, and its index only reads the file
+    up to the tokens that are looked at.
+
+    While lexing a mapping, the pages already lexed are released every
+    `release` bytes, so the resident memory is mostly the token columns.
+    """
+    buffer = map_file(source) if isinstance(source, str) else source
+    if engine is None:
+        engine = RuleEngine(byte_rules(patternpair))
+    out = TokenStream(buffer, rule_names(patternpair), index=BufferLineIndex(buffer))
+    rules, starts, ends = out.rules.append, out.starts.append, out.ends.append
+    can_release = isinstance(buffer, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED") and release
+    released = 0
+    for rule, start, end in scan(engine, buffer):
+        rules(rule)
+        starts(start)
+        ends(end)
+        if can_release and start - released >= release:
+            upto = start - start % mmap.PAGESIZE
+            buffer.madvise(mmap.MADV_DONTNEED, released, upto - released)
+            released = upto
+    return out
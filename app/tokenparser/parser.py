@@ -24,10 +24,12 @@ patternpairtype = list[tuple[re.Pattern, str, str, str, str]]
 
 
 class Parser:
-    def __init__(self, lexed: list[Token]):
+    def __init__(self, lexed: list[Token], compile=re.compile):
         self.lexed = lexed
         self.index = 0
         self.tree = None
+        # called with each pattern's source; GrammarModel passes a caching one
+        self.compile = compile
     
     def current(self):
         if self.index < len(self.lexed):
@@ -47,7 +49,7 @@ class Parser:
     
     def parse_pattern(self):
         pattern = self.consume(TokenType.STRING).value
-        pattern = re.compile(pattern[2:-1])
+        pattern = self.compile(pattern[2:-1])
         return {'pattern':pattern}
     
     def parse_color(self):
@@ -0,0 +1,374 @@
+from .stream import TokenStream
+from array import array
+from bisect import bisect_left
+from itertools import compress, count
+from operator import add
+import ast
+import re
+
+# Second stage: a PEG over the tokens use() gives. A parse grammar is a
+# list of rules
+#
+#     Grammar <- Block* !.
+#     Block   <- Identifier[Token] "{" Definition* "}"
+#
+# where a name defined with <- is a rule and any other name is a token:
+# `Identifier[Token]` is that token, `Identifier` any Identifier token,
+# with or without a subtoken. "text" is a token with that text and `.`
+# any token. Then, as usual, `/` (ordered choice), `*` `+` `?`, `&` `!`
+# and parentheses. UNKNOWN tokens (spaces, unmatched text) are skipped,
+# the token after them is taken; the first rule is the start rule and
+# has to take all the tokens.
+#
+# The parser is packrat: a rule's result at a token is kept, so every
+# rule runs at most once per token. A result also records how far past
+# its token it looked, so after an edit the results that only looked at
+# unchanged tokens are kept too, and only the part of the tree around the
+# edit is parsed again. Rules run on an explicit stack, not Python's, so
+# input size isn't limited by the recursion limit.
+
+
+class ParseError(Exception):
+    """Parse grammar that doesn't compile, or tokens it doesn't parse."""
+
+
+TOKEN, RULE, SEQUENCE, CHOICE, REPEAT, AND, NOT = range(7)
+
+SYNTAX = re.compile(r"""
+    (?P<space>\s+|\#[^\n]*)
+  | (?P<arrow><-)
+  | (?P<name>[A-Za-z_]\w*(?:\[\w*\])?)
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<op>[/*+?&!().])
+""", re.VERBOSE)
+
+
+class Node:
+    """
+    A rule's match: `length` tokens of the TokenStream, covered by
+    `children` back to back. Offsets are not stored, so a Node stays
+    valid when tokens before it are edited; spans() gives the children's
+    first token. A token taken is a child with no name, and its length
+    counts the UNKNOWN tokens skipped before it.
+    """
+    __slots__ = ("name", "length", "children")
+
+    def __init__(self, name, length, children):
+        self.name = name
+        self.length = length
+        self.children = children
+
+    def __repr__(self):
+        return f"Node({self.name!r}, {self.length}, {len(self.children)} children)"
+
+# a token taken right where it was looked for; which one follows from where it is
+LEAF = Node(None, 1, ())
+
+def spans(node: Node, first: int):
+    """(child, index of its first token) of each child of a node starting at token `first`."""
+    for child in node.children:
+        yield child, first
+        first += child.length
+
+
+def read_grammar(source: str):
+    # (name, expression) per rule, expressions as nested tuples with
+    # names still unresolved: ('name', text, offset)
+    items = []
+    pos = 0
+    while pos < len(source):
+        m = SYNTAX.match(source, pos)
+        if m is None:
+            raise ParseError(f"parse grammar, offset {pos}: unexpected {source[pos]!r}")
+        if m.lastgroup != "space":
+            items.append((m.lastgroup, m.group(), pos))
+        pos = m.end()
+    items.append(("end", "", pos))
+    at = 0
+
+    def peek(kind=None, text=None):
+        k, t, _ = items[at]
+        return (kind is None or k == kind) and (text is None or t == text)
+
+    def fail(expected):
+        kind, text, offset = items[at]
+        raise ParseError(f"parse grammar, offset {offset}: expected {expected}, got {text or kind!r}")
+
+    def take(kind, text=None):
+        nonlocal at
+        if not peek(kind, text):
+            fail(text or kind)
+        at += 1
+        return items[at-1]
+
+    def starts_rule():
+        return peek("name") and items[at+1][0] == "arrow"
+
+    def choice():
+        options = [sequence()]
+        while peek("op", "/"):
+            take("op")
+            options.append(sequence())
+        return options[0] if len(options) == 1 else (CHOICE, tuple(options))
+
+    def sequence():
+        parts = []
+        while not (peek("end") or peek("op", "/") or peek("op", ")") or starts_rule()):
+            parts.append(prefix())
+        if not parts:
+            fail("an expression")
+        return parts[0] if len(parts) == 1 else (SEQUENCE, tuple(parts))
+
+    def prefix():
+        if peek("op", "&") or peek("op", "!"):
+            _, op, _ = take("op")
+            return (AND if op == "&" else NOT, suffix())
+        return suffix()
+
+    def suffix():
+        expr = primary()
+        while peek("op", "*") or peek("op", "+") or peek("op", "?"):
+            _, op, _ = take("op")
+            expr = (REPEAT, expr, 1 if op == "+" else 0, 1 if op == "?" else None)
+        return expr
+
+    def primary():
+        if peek("name"):
+            _, text, offset = take("name")
+            return ("name", text, offset)
+        if peek("string"):
+            _, text, _ = take("string")
+            return (TOKEN, None, ast.literal_eval(text))
+        if peek("op", "."):
+            take("op")
+            return (TOKEN, None, None)
+        if peek("op", "("):
+            take("op")
+            expr = choice()
+            take("op", ")")
+            return expr
+        fail("a name, string, '.' or '('")
+
+    rules = []
+    while not peek("end"):
+        _, name, _ = take("name")
+        take("arrow")
+        rules.append((name, choice()))
+    if not rules:
+        fail("a rule")
+    return rules
+
+def compile_grammar(source: str, names: list[tuple[str, str]]):
+    """
+    Rule names and bodies of a parse grammar, with token names resolved
+    against `names` (rule_names() of the token grammar). Rules are
+    referred to by index; the start rule is 0.
+    """
+    rules = read_grammar(source)
+    index = {}
+    for name, _ in rules:
+        if name in index:
+            raise ParseError(f"parse grammar: rule {name} defined twice")
+        index[name] = len(index)
+
+    def resolve(expr):
+        op = expr[0]
+        if op == "name":
+            _, name, offset = expr
+            if name in index:
+                return (RULE, index[name])
+            ids = frozenset(i for i, (token, _) in enumerate(names[:-1])
+                            if token == name or token.split("[")[0] == name)
+            if not ids:
+                raise ParseError(f"parse grammar, offset {offset}: no rule or token {name}")
+            return (TOKEN, ids, None)
+        if op in (SEQUENCE, CHOICE):
+            return (op, tuple(resolve(part) for part in expr[1]))
+        if op == REPEAT:
+            return (REPEAT, resolve(expr[1]), expr[2], expr[3])
+        if op in (AND, NOT):
+            return (op, resolve(expr[1]))
+        return expr
+
+    return [name for name, _ in rules], [resolve(body) for _, body in rules]
+
+
+class PackratParser:
+    """
+    Parses TokenStreams with a parse grammar. Given the stream it parsed
+    last and the `relexed` range of the IncrementalLexer edit that made
+    the new one, parse() keeps the rule results that didn't look at any
+    token in it, so parsing after an edit costs about the part of the
+    tree the edit is in.
+
+    Not thread safe; the IDE only parses on its one lexing thread.
+    """
+    def __init__(self):
+        self.source = None
+        self.names = None
+        self.rule_names = []
+        self.bodies = []
+        self.tokens = None           # the stream parsed last
+        self.memo = [{}]             # per token (and the end): rule -> (length or -1, looked, node)
+        self.reach = array('q', [0]) # per token: most tokens one of its results looked at
+
+    def grammar(self, source: str, names: list[tuple[str, str]]):
+        """Compiles a new parse grammar; results kept for the old one are dropped."""
+        if source == self.source and names == self.names:
+            return
+        self.rule_names, self.bodies = compile_grammar(source, names)
+        self.source = source
+        self.names = names
+        self.tokens = None
+
+    def parse(self, tokens: TokenStream, base: TokenStream = None, relexed=None, source: str = None) -> Node:
+        """
+        Tree of the start rule over the tokens. With `base`, the stream
+        parsed last, and `relexed` of the IncrementalLexer edit that
+        turned a copy of it into `tokens`, results from parsing `base` are
+        reused. Raises ParseError at the furthest token looked at if the
+        tokens don't parse.
+        """
+        if source is not None or self.source is None:
+            self.grammar(source or "", tokens.names)
+        elif tokens.names != self.names:
+            self.grammar(self.source, tokens.names)
+        n = len(tokens.starts)
+        if base is None or base is not self.tokens or base is tokens or relexed is None:
+            self.memo = [{} for _ in range(n + 1)]
+            self.reach = array('q', bytes(8 * (n + 1)))
+        else:
+            first = bisect_left(tokens.starts, relexed[0])
+            stop = bisect_left(tokens.starts, relexed[1], first)
+            self.update(first, stop - n + len(base.starts), stop)
+        self.tokens = tokens
+
+        length, looked, node = self.run(0, 0)
+        unknown = len(tokens.names) - 1
+        rules, starts = tokens.rules, tokens.starts
+        if length >= 0 and all(rule == unknown for rule in rules[length:]):
+            return node
+        at = max(length, looked - 1)
+        if at >= n:
+            raise ParseError(f"{len(tokens.text)}: unexpected end of text")
+        while rules[at] == unknown:
+            at += 1
+        line, column = tokens.index.coords(starts[at])
+        text = tokens.text[starts[at]:tokens.ends[at]]
+        raise ParseError(f":{line}:{column} (pos: {starts[at]}) got {tokens.names[rules[at]][0]} {text!r}")
+
+    def update(self, first: int, old_stop: int, new_stop: int):
+        # tokens [first, old_stop) were replaced by [first, new_stop):
+        # drops the results that looked at them, and moves the ones after
+        # to their new index (they are relative, so only the list moves)
+        memo, reach = self.memo, self.reach
+        looked_past = map(first.__lt__, map(add, count(), reach[:first]))
+        for p in compress(count(), looked_past):
+            kept = {rule: entry for rule, entry in memo[p].items() if p + entry[1] <= first}
+            memo[p] = kept
+            reach[p] = max((entry[1] for entry in kept.values()), default=0)
+        memo[first:old_stop] = [{} for _ in range(new_stop - first)]
+        reach[first:old_stop] = array('q', bytes(8 * (new_stop - first)))
+
+    def run(self, start: int, pos: int):
+        """(length or -1, tokens looked at, node) of rule `start` at token `pos`."""
+        tokens, memo, reach_of, bodies, names = self.tokens, self.memo, self.reach, self.bodies, self.rule_names
+        text, rules, starts, ends = tokens.text, tokens.rules, tokens.starts, tokens.ends
+        n = len(starts)
+        unknown = len(tokens.names) - 1
+        first = pos
+        stack = []  # frames: [op, expr, pos, state, end, nodes]
+        reach = pos # furthest token looked at by the rule running, exclusive
+        expr = (RULE, start)
+        while True:
+            # evaluate `expr` at `pos`: into `result` ((end, nodes) or
+            # None), or by pushing a frame and going on with a part of it
+            op = expr[0]
+            if op == TOKEN:
+                at = pos
+                while at < n and rules[at] == unknown:
+                    at += 1
+                if at >= reach:
+                    reach = at + 1
+                result = None
+                if at < n and (expr[1] is None or rules[at] in expr[1]) and \
+                        (expr[2] is None or text[starts[at]:ends[at]] == expr[2]):
+                    result = (at + 1, [LEAF if at == pos else Node(None, at + 1 - pos, ())])
+            elif op == RULE:
+                entry = memo[pos].get(expr[1])
+                if entry is None:
+                    # a rule met again at the same token before it ended is
+                    # left recursive; it fails there instead of looping
+                    memo[pos][expr[1]] = (-1, 1, None)
+                    stack.append([RULE, expr, pos, reach, 0, None])
+                    reach = pos
+                    expr = bodies[expr[1]]
+                    continue
+                length, looked, node = entry
+                if pos + looked > reach:
+                    reach = pos + looked
+                result = None if length < 0 else (pos + length, [node])
+            elif op == SEQUENCE or op == CHOICE:
+                stack.append([op, expr, pos, 0, pos, []])
+                expr = expr[1][0]
+                continue
+            elif op == REPEAT:
+                stack.append([op, expr, pos, 0, pos, []])
+                expr = expr[1]
+                continue
+            else:
+                stack.append([op, expr, pos, 0, pos, None])
+                expr = expr[1]
+                continue
+
+            # hand the result to the frames, until one has a part to evaluate
+            while True:
+                if not stack:
+                    if result is None:
+                        return -1, reach - first, None
+                    return result[0] - first, reach - first, result[1][0]
+                frame = stack[-1]
+                op = frame[0]
+                if op == SEQUENCE:
+                    if result is not None:
+                        frame[5].extend(result[1])
+                        parts = frame[1][1]
+                        frame[3] += 1
+                        if frame[3] < len(parts):
+                            expr, pos = parts[frame[3]], result[0]
+                            break
+                        result = (result[0], frame[5])
+                elif op == CHOICE:
+                    if result is None:
+                        parts = frame[1][1]
+                        frame[3] += 1
+                        if frame[3] < len(parts):
+                            expr, pos = parts[frame[3]], frame[2]
+                            break
+                elif op == REPEAT:
+                    _, (_, part, least, most), _, count, end, nodes = frame
+                    if result is not None and result[0] > end:
+                        nodes.extend(result[1])
+                        frame[3] = count = count + 1
+                        frame[4] = end = result[0]
+                        if most is None or count < most:
+                            expr, pos = part, end
+                            break
+                    result = (end, nodes) if count >= least else None
+                elif op == RULE:
+                    start = frame[2]
+                    rule = frame[1][1]
+                    if result is None:
+                        memo[start][rule] = (-1, reach - start, None)
+                    else:
+                        node = Node(names[rule], result[0] - start, result[1])
+                        memo[start][rule] = (node.length, reach - start, node)
+                        result = (result[0], [node])
+                    if reach - start > reach_of[start]:
+                        reach_of[start] = reach - start
+                    if frame[3] > reach:
+                        reach = frame[3]
+                else: # AND, NOT
+                    matched = result is not None
+                    result = (frame[2], []) if matched == (op == AND) else None
+                stack.pop()
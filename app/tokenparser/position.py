@@ -0,0 +1,188 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import repeat
+from operator import add
+
+
+class Offsets:
+    """
+    Ascending int64 columns of the same length, such as token starts and
+    ends, whose entries from `moved` on are all `delta` short of their
+    value. An edit moves everything after it; keeping that as `delta`
+    instead of adding it to every entry makes the edit cost what it
+    replaces plus the entries between it and the one before.
+
+    settled() adds the delta into new columns, so a reader never changes
+    columns another thread may be copying; only splice(), by the owner
+    of the columns, changes them in place. Owners keep an Offsets in one
+    attribute and replace it, which other threads see all at once.
+    """
+    __slots__ = ("columns", "moved", "delta")
+
+    def __init__(self, columns: tuple, moved: int = 0, delta: int = 0):
+        self.columns = columns
+        self.moved = moved
+        self.delta = delta
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def value(self, c: int, i: int) -> int:
+        """Entry `i` of column `c`."""
+        value = self.columns[c][i]
+        return value + self.delta if i >= self.moved else value
+
+    def bisect_left(self, c: int, x: int, lo: int = 0, hi: int = None) -> int:
+        column = self.columns[c]
+        hi = len(column) if hi is None else hi
+        if not self.delta:
+            return bisect_left(column, x, lo, hi)
+        mid = min(max(self.moved, lo), hi)
+        i = bisect_left(column, x, lo, mid)
+        return i if i < mid else bisect_left(column, x - self.delta, mid, hi)
+
+    def bisect_right(self, c: int, x: int, lo: int = 0, hi: int = None) -> int:
+        column = self.columns[c]
+        hi = len(column) if hi is None else hi
+        if not self.delta:
+            return bisect_right(column, x, lo, hi)
+        mid = min(max(self.moved, lo), hi)
+        i = bisect_right(column, x, lo, mid)
+        return i if i < mid else bisect_right(column, x - self.delta, mid, hi)
+
+    def settled(self) -> "Offsets":
+        """Same values, delta added in: new columns, or these if there is none."""
+        if not self.delta:
+            return self
+        moved, delta = self.moved, self.delta
+        return Offsets(tuple(column[:moved] + shifted(column, moved, len(column), delta) for column in self.columns),
+                       len(self))
+
+    def copy(self) -> "Offsets":
+        return Offsets(tuple(array('q', column) for column in self.columns), self.moved, self.delta)
+
+    def splice(self, k: int, j: int, values: tuple, delta: int) -> "Offsets":
+        """
+        Entries [k, j) of each column replaced with `values`, one list of
+        them per column, and the entries after moved by `delta`. Changes
+        the columns in place; returns the Offsets to keep.
+        """
+        columns, moved = self.columns, self.moved
+        if self.delta and moved < k: # [moved, k) stay where they are
+            for column in columns:
+                column[moved:k] = shifted(column, moved, k, self.delta)
+        elif self.delta and moved > j: # [j, moved) move with the rest
+            for column in columns:
+                column[j:moved] = shifted(column, j, moved, -self.delta)
+        for column, new in zip(columns, values):
+            column[k:j] = new
+        return Offsets(columns, k + len(values[0]), self.delta + delta)
+
+
+def shifted(column, start: int, stop: int, delta: int) -> array:
+    # column[start:stop] with delta added to each entry
+    return array('q', map(add, column[start:stop], repeat(delta)))
+
+
+class LineIndex:
+    """
+    Offsets where each line of a text starts, built in one pass.
+    Lines and columns count from 1, like the tokens of use(). After an
+    edit the starts past it are moved lazily (see Offsets).
+    """
+    def __init__(self, text: str):
+        starts = array('q', [0])
+        find = text.find
+        i = find('\n')
+        while i != -1:
+            starts.append(i + 1)
+            i = find('\n', i + 1)
+        self.starts = starts
+        self.length = len(text)
+
+    @property
+    def starts(self) -> array:
+        offsets = self._starts
+        if offsets.delta:
+            offsets = self._starts = offsets.settled()
+        return offsets.columns[0]
+
+    @starts.setter
+    def starts(self, starts):
+        self._starts = Offsets((starts,), len(starts))
+
+    def __len__(self):
+        return len(self._starts)
+
+    def coords(self, offset: int) -> tuple[int, int]:
+        offsets = self._starts
+        line = offsets.bisect_right(0, offset)
+        return line, offset - offsets.value(0, line-1) + 1
+
+    def offset(self, line: int, column: int) -> int:
+        """Inverse of coords(), clamped to the text."""
+        offsets = self._starts
+        line = min(max(line, 1), len(offsets))
+        start = offsets.value(0, line-1)
+        end = offsets.value(0, line) - 1 if line < len(offsets) else self.length
+        return min(max(start + column - 1, start), end)
+
+    def copy(self) -> "LineIndex":
+        other = LineIndex.__new__(LineIndex)
+        other._starts = self._starts.copy()
+        other.length = self.length
+        return other
+
+    def edit(self, text: str, position: int, removed: int, added: int):
+        """Updates the index for an edit; `text` is the new text."""
+        offsets = self._starts
+        first = offsets.bisect_right(0, position)
+        last = offsets.bisect_right(0, position + removed, first)
+        new = array('q')
+        find = text.find
+        i = find('\n', position, position + added)
+        while i != -1:
+            new.append(i + 1)
+            i = find('\n', i + 1, position + added)
+        self._starts = offsets.splice(first, last, (new,), added - removed)
+        self.length = len(text)
+
+
+class BufferLineIndex(LineIndex):
+    """
+    LineIndex of a bytes-like buffer such as an mmap, read only as far as
+    a lookup needs: coords() near the start of a big file doesn't scan
+    the rest of it. Columns count bytes.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.starts = array('q', [0])
+        self.length = len(buffer)
+        self.scanned = 0 # every newline before this offset is in starts
+
+    def extend(self, offset: int, lines: int = 0):
+        """Reads on until the lines up to `offset`, and `lines` line starts, are known."""
+        starts = self.starts
+        find = self.buffer.find
+        while self.scanned <= self.length and (self.scanned <= offset or len(starts) < lines):
+            i = find(b'\n', self.scanned)
+            if i == -1:
+                self.scanned = self.length + 1
+                break
+            starts.append(i + 1)
+            self.scanned = i + 1
+
+    def __len__(self):
+        self.extend(self.length)
+        return len(self.starts)
+
+    def coords(self, offset: int) -> tuple[int, int]:
+        self.extend(offset)
+        return super().coords(offset)
+
+    def offset(self, line: int, column: int) -> int:
+        self.extend(0, line + 1)
+        return super().offset(line, column)
+
+    def edit(self, text, position, removed, added):
+        raise TypeError("a buffer index is read only")
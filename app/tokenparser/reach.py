@@ -0,0 +1,314 @@
+from .parser import patternpairtype
+from .analyze import parse, sre, skipper
+from .dfa import CHAR, SPLIT, JMP, MATCH, MAX_STATES, Program, State, Unsupported, nullable
+from .engine import scan
+import re
+
+# How far lexing at an offset reads: every rule's match attempt there,
+# with what it looked ahead at and the probes that failed. An edit can
+# only change tokens whose lexing read the edited text, so this is what
+# IncrementalLexer keeps tokens by.
+#
+# Most rules never read past a newline, so trying them reads at most up
+# to the end of the line. A rule that may is run as an NFA over a
+# widened program (see Relaxed) until all its threads die; offsets are
+# exclusive bounds, and len(text) + 1 means the attempt saw the end of
+# the text.
+
+END = 4 # a lookahead is done: the thread read what it had to and stops
+
+MAX_COPIES = 64 # repeat counts past this are read as unbounded
+
+
+def anything(c) -> bool:
+    return True
+
+
+class Relaxed(Program):
+    """
+    Program whose threads read at least what re reads trying the rule:
+    lookaheads and anchors branch off a thread that reads them and stops,
+    backreferences read anything, case folding and scoped flags widen the
+    tests. Lookbehinds read before the offset and are left out; `behind`
+    is how far they and the anchors look back. `exact` is whether nothing
+    was widened, so threads can be cut at the first MATCH like DFA does.
+    """
+    def rule(self, pattern: re.Pattern, index: int = 0) -> int:
+        flags = pattern.flags
+        if flags & re.LOCALE:
+            raise Unsupported("flags")
+        self.bytes = isinstance(pattern.pattern, bytes)
+        self.ascii = self.bytes or bool(flags & re.ASCII)
+        self.dotall = bool(flags & re.DOTALL)
+        self.fold = bool(flags & re.IGNORECASE)
+        self.exact = not self.fold
+        self.behind = 0
+        self.sequence(parse(pattern))
+        return self.emit(MATCH, index)
+
+    def item(self, op, av):
+        if op is sre.SUBPATTERN:
+            _, add_flags, del_flags, items = av
+            saved = self.fold, self.dotall
+            if add_flags or del_flags:
+                self.exact = False
+                self.fold = self.fold or bool(add_flags & sre.SRE_FLAG_IGNORECASE)
+                self.dotall = self.dotall or bool(add_flags & sre.SRE_FLAG_DOTALL)
+            self.sequence(items)
+            self.fold, self.dotall = saved
+        elif op is sre.MAX_REPEAT or op is sre.MIN_REPEAT or op is getattr(sre, 'POSSESSIVE_REPEAT', None):
+            self.repeat(op, *av)
+        elif op is getattr(sre, 'ATOMIC_GROUP', None):
+            self.exact = False
+            self.sequence(av)
+        elif op is sre.AT:
+            self.exact = False
+            if av in (sre.AT_BOUNDARY, sre.AT_NON_BOUNDARY, sre.AT_BEGINNING_LINE):
+                self.behind = max(self.behind, 1)
+            # $ looks at the next character, and past a newline for the end
+            self.peek(lambda: [self.emit(CHAR, anything) for _ in range(2 if av is sre.AT_END else 1)])
+        elif op is sre.ASSERT or op is sre.ASSERT_NOT:
+            self.exact = False
+            direction, items = av
+            if direction < 0:
+                self.behind = max(self.behind, min(items.getwidth()[1], sre.MAXREPEAT))
+            else:
+                self.peek(lambda: self.sequence(items))
+        elif op is sre.GROUPREF:
+            self.exact = False
+            split = self.emit(SPLIT, None)
+            self.emit(CHAR, anything)
+            self.emit(JMP, split)
+            self.args[split] = [split + 1, len(self.ops)]
+        elif op is sre.GROUPREF_EXISTS:
+            self.exact = False
+            _, yes, no = av
+            self.item(sre.BRANCH, (None, [yes, no or []]))
+        else:
+            super().item(op, av)
+
+    def peek(self, body):
+        # a thread that reads `body` and stops, next to one going on
+        split = self.emit(SPLIT, None)
+        body()
+        self.emit(END)
+        self.args[split] = [split + 1, len(self.ops)]
+
+    def repeat(self, op, low, high, items):
+        try:
+            empty = nullable(items)
+        except Unsupported: # assertions inside, may well be
+            empty = True
+        if empty or op is not sre.MAX_REPEAT and op is not sre.MIN_REPEAT:
+            self.exact = False
+        if low > MAX_COPIES:
+            self.exact = False
+            low = 1
+        if high != sre.MAXREPEAT and high - low > MAX_COPIES:
+            self.exact = False
+            high = sre.MAXREPEAT
+        self.loop(op is sre.MIN_REPEAT, low, high, items)
+
+    def loop(self, lazy, low, high, items):
+        # Program's repeat, without its check for empty items: the
+        # closure doesn't loop on them, having seen the pcs
+        greedy = not lazy
+        for _ in range(low):
+            self.sequence(items)
+        if high == sre.MAXREPEAT:
+            split = self.emit(SPLIT, None)
+            self.sequence(items)
+            self.emit(JMP, split)
+            self.args[split] = [split + 1, len(self.ops)] if greedy else [len(self.ops), split + 1]
+        else:
+            splits = []
+            for _ in range(high - low):
+                splits.append(self.emit(SPLIT, None))
+                self.sequence(items)
+            for split in splits:
+                self.args[split] = [split + 1, len(self.ops)] if greedy else [len(self.ops), split + 1]
+
+    def test(self, op, av):
+        test = super().test(op, av)
+        if not self.fold:
+            return test
+        if self.bytes:
+            return lambda c: test(c) or 65 <= c <= 90 and test(c + 32) or 97 <= c <= 122 and test(c - 32)
+        # outside ASCII case folding has too many special cases, anything goes
+        return lambda c: c > "\x7f" or test(c) or test(c.lower()) or test(c.upper())
+
+
+class Reader:
+    """Runs one rule's Relaxed program to find out how far an attempt at an offset reads."""
+    def __init__(self, program: Relaxed):
+        self.ops = program.ops
+        self.args = program.args
+        self.tests = [arg if op == CHAR else None for op, arg in zip(program.ops, program.args)]
+        self.exact = program.exact
+        self.states = {}
+        self.dead = State((), None)
+        threads = []
+        self.closure([0], threads, set())
+        self.start = self.state(threads)
+
+    def closure(self, pcs, out, seen) -> bool:
+        # collects the CHAR threads; True if an exact program hit a MATCH,
+        # after which nothing is tried
+        ops, args = self.ops, self.args
+        stack = list(reversed(pcs))
+        while stack:
+            pc = stack.pop()
+            if pc in seen:
+                continue
+            seen.add(pc)
+            op = ops[pc]
+            if op == JMP:
+                stack.append(args[pc])
+            elif op == SPLIT:
+                stack.append(args[pc][1])
+                stack.append(args[pc][0])
+            elif op == CHAR:
+                out.append(pc)
+            elif op == MATCH and self.exact:
+                return True
+        return False
+
+    def state(self, threads) -> State:
+        threads = tuple(threads) if self.exact else tuple(sorted(threads))
+        if not threads:
+            return self.dead
+        state = self.states.get(threads)
+        if state is None:
+            if len(self.states) >= MAX_STATES:
+                for old in self.states.values():
+                    old.next.clear()
+                self.states.clear()
+            state = self.states[threads] = State(threads, None)
+        return state
+
+    def step(self, state: State, c) -> State:
+        out = []
+        seen = set()
+        tests = self.tests
+        for pc in state.threads:
+            if tests[pc](c) and self.closure([pc + 1], out, seen):
+                break
+        following = self.state(out)
+        state.next[c] = following
+        return following
+
+    def extent(self, text, pos: int, n: int) -> int:
+        state = self.start
+        dead = self.dead
+        i = pos
+        while state is not dead:
+            if i >= n:
+                return n + 1
+            c = text[i]
+            following = state.next.get(c)
+            if following is None:
+                following = self.step(state, c)
+            state = following
+            i += 1
+        return i
+
+
+class Reach:
+    """
+    Bounds on what lexing reads, for the rules of a patternpair. `behind`
+    is how far before its offset an attempt may look.
+    """
+    def __init__(self, patternpair: patternpairtype):
+        self.patternpair = patternpair
+        self.skip = skipper(patternpair)
+        self.unknown = len(patternpair)
+        self.local = False # some rule reads at most to the end of the line
+        self.readers = []  # the others
+        self.unbounded = False
+        self.behind = 0
+        bytes_ = bool(patternpair) and isinstance(patternpair[0][0].pattern, bytes)
+        self.newline = b"\n" if bytes_ else "\n"
+        newline = 10 if bytes_ else "\n"
+        for item in patternpair:
+            program = Relaxed()
+            try:
+                program.rule(item[0])
+            except Unsupported:
+                self.unbounded = True
+                continue
+            self.behind = max(self.behind, program.behind)
+            if any(op == CHAR and arg(newline) for op, arg in zip(program.ops, program.args)):
+                self.readers.append(Reader(program))
+            else:
+                self.local = True
+        self.line = (None, 0, -1) # text, and the line last asked about
+
+    def line_end(self, text, pos: int, n: int) -> int:
+        line_text, begin, end = self.line
+        if line_text is not text or not begin <= pos <= end:
+            end = text.find(self.newline, pos)
+            end = n if end < 0 else end
+            self.line = (text, pos, end)
+        return end + 1
+
+    def attempt(self, text, pos: int, n: int) -> int:
+        """How far trying the rules at `pos` reads."""
+        if self.unbounded:
+            return n + 1
+        reach = self.line_end(text, pos, n) if self.local else pos + 1
+        for reader in self.readers:
+            if reader.start.next.get(text[pos]) is not reader.dead: # most die on the first character
+                reach = max(reach, reader.extent(text, pos, n))
+        return reach
+
+    def token(self, text, rule: int, start: int, end: int, n: int) -> int:
+        """How far lexing the token (rule, start, end) of scan() read."""
+        if rule != self.unknown:
+            return max(end, self.attempt(text, start, n))
+        # an unmatched run: attempts where the skipper stopped, and the
+        # skipper itself read up to the start of the next token
+        reach = end + 1
+        if self.unbounded:
+            return max(reach, n + 1)
+        if self.local:
+            reach = max(reach, self.line_end(text, end - 1, n))
+        if self.readers:
+            if self.skip is None:
+                offsets = range(start, end)
+            else:
+                offsets = [start] + [m.start() for m in self.skip.finditer(text, start + 1, end)]
+            for reader in self.readers:
+                for pos in offsets:
+                    reach = max(reach, reader.extent(text, pos, n))
+        return reach
+
+    def scan(self, engine, text, pos: int = 0, top: int = 0):
+        """
+        scan() with a fourth item per token: how far lexing from `pos` up
+        to and including the token read, at least `top`.
+        """
+        # token() and attempt() inlined for matched tokens, the most of them
+        n = len(text)
+        token = self.token
+        unknown = self.unknown if not self.unbounded else None
+        local = self.local
+        find, newline = text.find, self.newline
+        readers = [(reader.start.next, reader.dead, reader.extent) for reader in self.readers]
+        line = -1 # offset of the newline ending the line of the last token
+        for rule, start, end in scan(engine, text, pos):
+            if rule == unknown or unknown is None:
+                top = max(top, token(text, rule, start, end, n))
+            else:
+                if local and start > line:
+                    line = find(newline, start)
+                    if line < 0:
+                        line = n
+                reach = line + 1 if local else end
+                if readers:
+                    c = text[start]
+                    for first, dead, extent in readers:
+                        if first.get(c) is not dead:
+                            reach = max(reach, extent(text, start, n))
+                if reach > top:
+                    top = max(reach, end)
+            yield rule, start, end, top
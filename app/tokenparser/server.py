@@ -0,0 +1,489 @@
+"""
+Lexing server: one process keeps compiled grammars and the token
+streams of open documents, and editors talk to it over a Unix socket or
+stdio:
+
+    python -m tokenparser.server serve --socket /tmp/meta.sock
+    python -m tokenparser.server serve --stdio
+    python -m tokenparser.server bench --clients 8 --edits 200
+
+Messages are JSON-RPC 2.0 requests and responses, one JSON object per
+line. Methods (params -> result):
+
+    grammar/register  {description}            -> {grammar, legend}
+    document/open     {uri, grammar, text}      -> {resultId, data}
+    document/edit     {uri, edits: [{offset, removed, text}]}
+                                                -> {length}
+    document/semanticTokens/full   {uri}        -> {resultId, data}
+    document/semanticTokens/full/delta {uri, previousResultId}
+                                                -> {resultId, edits: [{start, deleteCount, data}]}
+    document/close    {uri}                     -> null
+
+`data` is in the LSP semantic tokens encoding: five ints per token
+(line delta, start delta, length, type, modifiers), lines from 0,
+tokens split at line ends, and columns counting code points (LSP's
+"utf-32" position encoding). Token types index the legend, which lists
+the rule names; UNKNOWN runs are left out. Offsets count code points.
+A document keeps its data and patches it after each edit, re-encoding
+only the tokens the lexer relexed; a delta is the span patched since the
+result it is asked against.
+
+A grammar stays registered while an open document uses it. Of the
+others, only the last GrammarCache.maxsize registered are kept; opening
+a document with one dropped since is an error, register it again.
+"""
+from .all import organizer
+from .cache import GrammarCache
+from .engine import compile_engine, engines
+from .grammar import common_prefix, common_suffix
+from .incremental import IncrementalLexer
+from .position import Offsets
+from .use import rule_names
+from array import array
+from itertools import accumulate
+import argparse, asyncio, inspect, json, os, stat, sys, tempfile, time
+
+LIMIT = 1 << 30 # longest message line
+
+
+class RequestError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+PARSE_ERROR, INVALID_REQUEST, METHOD_NOT_FOUND, INVALID_PARAMS, SERVER_ERROR = -32700, -32600, -32601, -32602, -32000
+
+
+def semantic_tokens(tokens, lo: int = 0, hi: int = None, previous=(0, 0), counts: list = None) -> list[int]:
+    """
+    LSP semantic token data of a TokenStream (see the module docstring),
+    or of its tokens [lo, hi) after a data token at `previous`, a (line,
+    character). `counts`, if given, gets how many data tokens each token
+    became.
+    """
+    unknown = len(tokens.names) - 1
+    index = tokens.index
+    lines = len(index)
+    length = len(tokens.text)
+    offsets = tokens.offsets
+    hi = len(offsets) if hi is None else hi
+    if lo == 0 and hi == len(offsets):
+        rules, starts, ends = tokens.rules, tokens.starts, tokens.ends
+    else: # read around the lazy shift, see position.Offsets
+        rules = tokens.rules[lo:hi]
+        starts = [offsets.value(0, i) for i in range(lo, hi)]
+        ends = [offsets.value(1, i) for i in range(lo, hi)]
+    def line_start(line): # offset of line `line`, from 0
+        return index.offset(line + 1, 1) if line < lines else length + 1
+    data = []
+    previous_line, previous_char = previous
+    line = index.coords(starts[0])[0] - 1 if starts else 0
+    line_start_at = line_start(line)
+    next_line = line_start(line + 1) # tokens are in order, so lines only go forward
+    for rule, start, end in zip(rules, starts, ends):
+        if rule == unknown:
+            if counts is not None:
+                counts.append(0)
+            continue
+        before = len(data)
+        while next_line <= start:
+            line += 1
+            line_start_at = next_line
+            next_line = line_start(line + 1)
+        while True:
+            piece = min(end, next_line - 1) # up to the newline
+            if piece > start:
+                char = start - line_start_at
+                data += (line - previous_line, char - previous_char if line == previous_line else char,
+                         piece - start, rule, 0)
+                previous_line, previous_char = line, char
+            if end < next_line:
+                break
+            line += 1
+            line_start_at = start = next_line
+            next_line = line_start(line + 1)
+        if counts is not None:
+            counts.append((len(data) - before) // 5)
+    return data
+
+def last_position(data: list[int], previous=(0, 0)) -> tuple[int, int]:
+    """(line, character) of the last data token of `data`, which follows one at `previous`."""
+    line, char = previous
+    for i in range(0, len(data), 5):
+        char = char + data[i+1] if data[i] == 0 else data[i+1]
+        line += data[i]
+    return line, char
+
+
+class Document:
+    """
+    An open document: its lexer, and the semantic token data of its
+    tokens, patched after each edit from the range the lexer relexed.
+    `first` has, per token, the index of its first data token (five ints
+    of `data`). `changed` is the (first data token, data tokens kept at
+    the end) around what was patched since the last result.
+    """
+    def __init__(self, grammar: str, lexer: IncrementalLexer):
+        self.grammar = grammar
+        self.lexer = lexer
+        self.encode()
+        self.result_id = None
+        self.sent = 0 # data tokens in that result
+        self.changed = None
+        self.next_result = 0
+
+    def encode(self):
+        counts = []
+        self.data = semantic_tokens(self.lexer.tokens, counts=counts)
+        first = array('q', accumulate(counts, initial=0))
+        del first[-1]
+        self.first = Offsets((first,))
+
+    def edit(self, text: str, position: int, removed: int, added: int):
+        tokens = self.lexer.tokens
+        before = len(tokens.offsets)
+        if self.lexer.edit(text, position, removed, added) is not tokens: # lexed over
+            self.encode()
+            self.changed = (0, 0)
+        else:
+            self.patch(before)
+
+    def patch(self, before: int):
+        # re-encodes the tokens relexed, up to and including the first
+        # tail token with data; the tail after it is relative to it, and
+        # moved along with it
+        tokens, first = self.lexer.tokens, self.first
+        offsets = tokens.offsets
+        total = len(self.data) // 5
+        moved = len(offsets) - before
+        relexed_start, relexed_end = self.lexer.relexed
+        a = offsets.bisect_left(0, relexed_start)
+        c = offsets.bisect_left(0, relexed_end, a) - moved # old index of the first tail token
+        at = first.value(0, a) if a < before else total
+        kept = first.value(0, c) if c < before else total
+        if kept < total:
+            c = first.bisect_right(0, kept, c)
+            kept = first.value(0, c) if c < before else total
+        previous = (0, 0)
+        if at:
+            token = first.bisect_left(0, at) - 1 # the one the data before `at` ends with
+            previous = last_position(semantic_tokens(tokens, token, token + 1))
+        counts = []
+        data = semantic_tokens(tokens, a, c + moved, previous, counts)
+        old = self.data[5*at:5*kept]
+        self.data[5*at:5*kept] = data
+        starts = array('q', accumulate(counts, initial=at))
+        del starts[-1]
+        self.first = first.splice(a, c, (starts,), len(data) // 5 - (kept - at))
+        # what really changed, in whole data tokens
+        same = common_prefix(old, data) // 5
+        if same * 5 == len(old) == len(data):
+            return
+        at, kept = at + same, kept - common_suffix(old, data, min(len(old), len(data)) - 5 * same) // 5
+        lo, end = self.changed if self.changed is not None else (total, total)
+        self.changed = (min(lo, at), min(end, total - kept))
+
+    def result(self) -> tuple[str, list[int]]:
+        self.next_result += 1
+        self.result_id = str(self.next_result)
+        self.sent = len(self.data) // 5
+        self.changed = None
+        return self.result_id, list(self.data)
+
+    def delta(self, previous_id: str):
+        """(resultId, LSP SemanticTokensEdits since `previous_id`), None if that isn't the last result."""
+        if previous_id != self.result_id:
+            return None
+        sent, changed = self.sent, self.changed
+        self.next_result += 1
+        self.result_id = str(self.next_result)
+        self.sent = len(self.data) // 5
+        self.changed = None
+        if changed is None:
+            return self.result_id, []
+        lo, kept = changed
+        return self.result_id, [{"start": 5 * lo, "deleteCount": 5 * (sent - lo - kept),
+                                 "data": self.data[5*lo:5*(self.sent - kept)]}]
+
+
+class LexServer:
+    """
+    State shared by every connection: compiled grammars by key and open
+    documents by uri. Requests are handled one at a time on the event
+    loop, so each sees and leaves a consistent state.
+    """
+    def __init__(self, cache=None, kind="dispatch"):
+        self.cache = cache if cache is not None else GrammarCache()
+        self.kind = kind
+        self.grammars = {} # key -> (organized, engine)
+        self.documents = {}
+        self.methods = {
+            "grammar/register": self.register,
+            "document/open": self.open,
+            "document/edit": self.edit,
+            "document/semanticTokens/full": self.full,
+            "document/semanticTokens/full/delta": self.full_delta,
+            "document/close": self.close,
+        }
+
+    def register(self, description: str):
+        key = self.cache.key(description)
+        if key not in self.grammars:
+            try:
+                organized = organizer(description, self.cache)
+            except Exception as e:
+                raise RequestError(INVALID_PARAMS, f"grammar: {e}")
+            self.grammars[key] = (organized, compile_engine(organized, self.kind))
+        self.grammars[key] = self.grammars.pop(key) # last registered
+        self.prune()
+        organized, _ = self.grammars[key]
+        legend = [name for name, _ in rule_names(organized)[:-1]]
+        return {"grammar": key, "legend": {"tokenTypes": legend, "tokenModifiers": []}}
+
+    def open(self, uri: str, grammar: str, text: str):
+        if grammar not in self.grammars:
+            raise RequestError(INVALID_PARAMS, f"unknown grammar {grammar}")
+        organized, engine = self.grammars[grammar]
+        document = self.documents[uri] = Document(grammar, IncrementalLexer(organized, text, engine))
+        result_id, data = document.result()
+        return {"resultId": result_id, "data": data}
+
+    def document(self, uri: str) -> Document:
+        if uri not in self.documents:
+            raise RequestError(INVALID_PARAMS, f"document {uri} is not open")
+        return self.documents[uri]
+
+    def edit(self, uri: str, edits: list):
+        document = self.document(uri)
+        lexer = document.lexer
+        for change in edits:
+            if not (isinstance(change, dict) and isinstance(change.get("offset"), int)
+                    and isinstance(change.get("removed"), int) and isinstance(change.get("text"), str)):
+                raise RequestError(INVALID_PARAMS, f"edit {change!r} is not {{offset, removed, text}}")
+            offset, removed, inserted = change["offset"], change["removed"], change["text"]
+            text = lexer.text
+            if not (0 <= offset and 0 <= removed and offset + removed <= len(text)):
+                raise RequestError(INVALID_PARAMS, f"edit {offset}+{removed} is outside the document")
+            document.edit(text[:offset] + inserted + text[offset + removed:], offset, removed, len(inserted))
+        return {"length": len(lexer.text)}
+
+    def full(self, uri: str):
+        result_id, data = self.document(uri).result()
+        return {"resultId": result_id, "data": data}
+
+    def full_delta(self, uri: str, previousResultId: str):
+        document = self.document(uri)
+        edits = document.delta(previousResultId)
+        if edits is None: # stale id, send everything
+            result_id, data = document.result()
+            return {"resultId": result_id, "data": data}
+        result_id, edits = edits
+        return {"resultId": result_id, "edits": edits}
+
+    def close(self, uri: str):
+        self.documents.pop(uri, None)
+        self.prune()
+        return None
+
+    def prune(self):
+        # grammars no open document uses, beyond the cache's size, first registered first
+        used = {document.grammar for document in self.documents.values()}
+        idle = [key for key in self.grammars if key not in used]
+        for key in idle[:max(0, len(idle) - self.cache.maxsize)]:
+            del self.grammars[key]
+
+    @staticmethod
+    def arguments(method, params) -> dict:
+        # params as keyword arguments of `method`, checked against its signature
+        if not isinstance(params, dict):
+            raise RequestError(INVALID_PARAMS, "params must be an object")
+        signature = inspect.signature(method)
+        try:
+            bound = signature.bind(**params)
+        except TypeError as e:
+            raise RequestError(INVALID_PARAMS, str(e))
+        for name, value in bound.arguments.items():
+            expected = signature.parameters[name].annotation
+            if isinstance(expected, type) and not isinstance(value, expected):
+                raise RequestError(INVALID_PARAMS, f"{name} must be a {expected.__name__}")
+        return params
+
+    def handle(self, line: bytes):
+        """One request line -> its response object, None for notifications."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": PARSE_ERROR, "message": str(e)}}
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise RequestError(INVALID_REQUEST, "not a request")
+            method = self.methods.get(request["method"])
+            if method is None:
+                raise RequestError(METHOD_NOT_FOUND, f"no method {request['method']}")
+            result = method(**self.arguments(method, request.get("params") or {}))
+        except RequestError as e:
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": e.code, "message": str(e)}}
+        except Exception as e:
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": SERVER_ERROR, "message": str(e)}}
+        else:
+            response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        if isinstance(request, dict) and "id" not in request: # a notification
+            return None
+        return response
+
+    async def connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = self.handle(line)
+                if response is not None:
+                    writer.write(json.dumps(response, separators=(",", ":")).encode("utf-8") + b"\n")
+                    await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_unix(self, path: str):
+        """Serves on a Unix socket at `path`, replacing a stale socket but nothing else."""
+        if os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise FileExistsError(f"{path} exists and is not a socket")
+            os.remove(path)
+        server = await asyncio.start_unix_server(self.connection, path, limit=LIMIT)
+        async with server:
+            await server.serve_forever()
+
+    async def serve_stdio(self):
+        await self.connection(Stdio(), Stdio())
+
+
+class Stdio:
+    """
+    Reader and writer of a connection() over stdin/stdout. Plain blocking
+    reads on a thread, so stdin may be a pipe, a terminal or a file.
+    """
+    async def readline(self) -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(None, sys.stdin.buffer.readline)
+
+    def write(self, data: bytes):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def close(self):
+        pass
+
+
+class Client:
+    """Stand-in editor: JSON-RPC calls over a Unix socket, one at a time."""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+
+    @classmethod
+    async def connect(cls, path: str) -> "Client":
+        reader, writer = await asyncio.open_unix_connection(path, limit=LIMIT)
+        return cls(reader, writer)
+
+    async def call(self, method: str, **params):
+        self.next_id += 1
+        request = {"jsonrpc": "2.0", "id": self.next_id, "method": method, "params": params}
+        self.writer.write(json.dumps(request, separators=(",", ":")).encode("utf-8") + b"\n")
+        await self.writer.drain()
+        response = json.loads(await self.reader.readline())
+        if "error" in response:
+            raise RequestError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def bench(path: str, description: str, text: str, clients: int, edits: int) -> dict:
+    """
+    `clients` stand-in editors each open their own copy of `text` and
+    type `edits` characters, asking for a semantic token delta after
+    each. Returns request latencies and the overall request rate.
+    """
+    latencies = []
+    async def editor(n):
+        client = await Client.connect(path)
+        grammar = (await client.call("grammar/register", description=description))["grammar"]
+        uri = f"bench://{n}"
+        result = await client.call("document/open", uri=uri, grammar=grammar, text=text)
+        result_id = result["resultId"]
+        offset = len(text) // 2
+        for i in range(edits):
+            start = time.perf_counter()
+            await client.call("document/edit", uri=uri, edits=[{"offset": offset + i, "removed": 0, "text": "x"}])
+            result = await client.call("document/semanticTokens/full/delta", uri=uri, previousResultId=result_id)
+            result_id = result["resultId"]
+            latencies.append(time.perf_counter() - start)
+        await client.call("document/close", uri=uri)
+        await client.close()
+    start = time.perf_counter()
+    await asyncio.gather(*(editor(n) for n in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"clients": clients, "edits": edits, "bytes": len(text), "seconds": elapsed,
+            "requests_per_second": 2 * len(latencies) / elapsed,
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000}
+
+async def run_bench(args):
+    with open(args.grammar, encoding="utf-8") as f:
+        description = f.read()
+    text = description * max(1, args.size // max(1, len(description)))
+    path = args.socket or os.path.join(tempfile.mkdtemp(), "meta.sock")
+    server = None
+    if not args.socket:
+        server = await asyncio.start_unix_server(LexServer(kind=args.engine).connection, path, limit=LIMIT)
+    try:
+        print(json.dumps(await bench(path, description, text, args.clients, args.edits), indent=1))
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+def main(argv=None) -> int:
+    args = argparse.ArgumentParser(prog="python -m tokenparser.server", description="Shared lexing server.")
+    commands = args.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the server")
+    where = serve.add_mutually_exclusive_group(required=True)
+    where.add_argument("--socket", help="Unix socket path")
+    where.add_argument("--stdio", action="store_true", help="talk over stdin/stdout")
+    serve.add_argument("--engine", choices=sorted(engines), default="dispatch")
+    serve.add_argument("--cache-dir", help="keep compiled grammars here across runs")
+    test = commands.add_parser("bench", help="time stand-in clients against a server")
+    test.add_argument("grammar", help="token description file")
+    test.add_argument("--socket", help="server to use (default: start one in this process)")
+    test.add_argument("--engine", choices=sorted(engines), default="dispatch")
+    test.add_argument("--clients", type=int, default=4)
+    test.add_argument("--edits", type=int, default=100)
+    test.add_argument("--size", type=int, default=1 << 16, help="document size in characters")
+    args = args.parse_args(argv)
+
+    if args.command == "bench":
+        asyncio.run(run_bench(args))
+        return 0
+    server = LexServer(GrammarCache(directory=args.cache_dir), args.engine)
+    try:
+        asyncio.run(server.serve_stdio() if args.stdio else server.serve_unix(args.socket))
+    except KeyboardInterrupt:
+        pass
+    except FileExistsError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+from .position import LineIndex, Offsets
+from array import array
+
+EOF = ("EOF", "", "EOF", float("inf"), float("inf"))
+
+
+class TokenStream:
+    """
+    Tokens of one text kept as three columns: start offset, end offset and
+    rule id (index into `names`, one (name, category) per rule). The text
+    is referenced, not copied; a token's text, name and line/column are
+    only built when it is read.
+
+    Reads like the list use() used to return: indexing, slicing and
+    iteration give (name, text, category, line, column) tuples, and the
+    last item is the EOF token.
+
+    An IncrementalLexer edit moves the offsets past it lazily (see
+    position.Offsets): `starts` and `ends` add the move in when read,
+    while indexing, token_at() and overlapping() read around it.
+    """
+    def __init__(self, text: str, names: list[tuple[str, str]], starts=None, ends=None, rules=None, index=None):
+        self.text = text
+        self.names = names
+        starts = starts if starts is not None else array('q')
+        self.offsets = Offsets((starts, ends if ends is not None else array('q')), len(starts))
+        self.rules = rules if rules is not None else array('i')
+        self._index = index
+
+    @property
+    def starts(self):
+        return self.settled().columns[0]
+
+    @property
+    def ends(self):
+        return self.settled().columns[1]
+
+    def settled(self) -> Offsets:
+        offsets = self.offsets
+        if offsets.delta:
+            offsets = self.offsets = offsets.settled()
+        return offsets
+
+    @property
+    def index(self) -> LineIndex:
+        if self._index is None:
+            self._index = LineIndex(self.text)
+        return self._index
+
+    def copy(self) -> "TokenStream":
+        """Same tokens in new columns, safe to edit while this one is read."""
+        index = self._index.copy() if self._index is not None else None
+        other = TokenStream(self.text, self.names, rules=array('i', self.rules), index=index)
+        other.offsets = self.offsets.copy()
+        return other
+
+    def append(self, rule: int, start: int, end: int):
+        starts, ends = self.settled().columns
+        self.rules.append(rule)
+        starts.append(start)
+        ends.append(end)
+
+    def __len__(self):
+        return len(self.rules) + 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self.rules)
+        if i < 0:
+            i += n + 1
+        if i == n:
+            return EOF
+        if not 0 <= i < n:
+            raise IndexError("token index out of range")
+        offsets = self.offsets
+        start = offsets.value(0, i)
+        name, category = self.names[self.rules[i]]
+        return (name, self.text[start:offsets.value(1, i)], category, *self.index.coords(start))
+
+    def __iter__(self):
+        text, names, coords = self.text, self.names, self.index.coords
+        for start, end, rule in zip(self.starts, self.ends, self.rules):
+            name, category = names[rule]
+            yield (name, text[start:end], category, *coords(start))
+        yield EOF
+
+    def __eq__(self, other):
+        if not isinstance(other, TokenStream):
+            return NotImplemented
+        return (self.starts == other.starts and self.ends == other.ends and self.rules == other.rules
+                and self.names == other.names and self.text == other.text)
+
+    def token_at(self, offset: int) -> int:
+        """Index of the last token starting at or before `offset`, -1 if none."""
+        return self.offsets.bisect_right(0, offset) - 1
+
+    def overlapping(self, start: int, end: int):
+        """Yields (start, end, rule) of the tokens that overlap [start, end)."""
+        offsets = self.offsets
+        (starts, ends), moved, delta = offsets.columns, offsets.moved, offsets.delta
+        rules = self.rules
+        i = max(offsets.bisect_right(0, start) - 1, 0)
+        n = len(starts)
+        while i < n:
+            shift = delta if i >= moved else 0
+            if starts[i] + shift >= end:
+                break
+            if ends[i] + shift > start:
+                yield starts[i] + shift, ends[i] + shift, rules[i]
+            i += 1
+
+
+def color_changes(old: TokenStream, new: TokenStream, old_colors: dict, new_colors: dict,
+                  edit=None, window=None) -> list[tuple[int, int]]:
+    """
+    The (start, end) ranges of new.text, in order and apart, that `new`
+    colors differently from `old`; the colors map rule ids to a color,
+    rules without one are left out. `edit` is the (position, removed,
+    added) that turned old.text into new.text: old offsets after it are
+    shifted and the edited text always counts as changed (an empty range
+    where text was only removed). `window` limits the comparison to a
+    range of new.text that contains the edit, such as the `relexed` of
+    an IncrementalLexer; outside it the tokens are taken to match.
+    """
+    lo, hi = window if window is not None else (0, len(new.text))
+    if edit is not None:
+        position, removed, added = edit
+        delta = added - removed
+        def move(offset):
+            if offset <= position:
+                return offset
+            return offset + delta if offset >= position + removed else position
+    else:
+        delta = 0
+        move = None
+
+    def runs(tokens, colors, lo, hi, move):
+        out = []
+        for start, end, rule in tokens.overlapping(lo, hi):
+            color = colors.get(rule)
+            if color is not None:
+                start, end = max(start, lo), min(end, hi)
+                if move is not None:
+                    start, end = move(start), move(end)
+                if start < end:
+                    out.append((start, end, color))
+        return out
+
+    a = runs(old, old_colors, lo, hi - delta, move)
+    b = runs(new, new_colors, lo, hi, None)
+    bounds = sorted({offset for start, end, _ in a + b for offset in (start, end)})
+    changes = [] if edit is None else [(position, position + added)]
+    i = j = 0
+    for start, end in zip(bounds, bounds[1:]):
+        while i < len(a) and a[i][1] <= start:
+            i += 1
+        while j < len(b) and b[j][1] <= start:
+            j += 1
+        before = a[i][2] if i < len(a) and a[i][0] <= start else None
+        after = b[j][2] if j < len(b) and b[j][0] <= start else None
+        if before != after:
+            changes.append((start, end))
+    changes.sort()
+    merged = []
+    for start, end in changes:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
@@ -0,0 +1,163 @@
+from .parser import patternpairtype
+from .stream import TokenStream
+from .mapped import map_file
+from .use import rule_names
+from array import array
+import os, re, struct, sys
+
+# A lexed text saved for other tools to read back: the rule table and
+# the token columns, laid out so a reader maps the file and indexes the
+# columns in place. All little-endian:
+#
+#   header   magic, version, 0, rule count, token count, text length,
+#            offset of the rule table, offset of the columns
+#   rules    per rule: pattern flags (uint32), then the pattern source,
+#            token name, category, subtoken and color, each a uint32
+#            length and utf-8
+#   columns  from an offset that is a multiple of 8: int64 starts,
+#            int64 ends, int32 rules, token count of each
+#
+# Offsets and the text length are whatever the lexed text counted in:
+# characters for use(), bytes for use_mapped(). The text isn't stored.
+
+MAGIC = b"MTKF"
+VERSION = 1
+header = struct.Struct("<4sHHIQQQQ")
+length = struct.Struct("<I")
+
+
+def save(path: str, patternpair: patternpairtype, tokens: TokenStream):
+    """Writes the rule table and the tokens of a TokenStream lexed with it."""
+    table = bytearray()
+    for pattern, name, category, subtoken, color in patternpair:
+        table += length.pack(pattern.flags)
+        for field in (pattern.pattern, name, category, subtoken, color):
+            data = field.encode("utf-8")
+            table += length.pack(len(data)) + data
+    rules_at = header.size
+    columns_at = -(-(rules_at + len(table)) // 8) * 8
+    columns = [array('q', tokens.starts), array('q', tokens.ends), array('i', tokens.rules)]
+    if sys.byteorder != "little":
+        for column in columns:
+            column.byteswap()
+    temp = path + ".tmp"
+    try:
+        with open(temp, "wb") as f:
+            f.write(header.pack(MAGIC, VERSION, 0, len(patternpair), len(tokens.starts), len(tokens.text),
+                                rules_at, columns_at))
+            f.write(table)
+            f.write(bytes(columns_at - rules_at - len(table)))
+            for column in columns:
+                f.write(column)
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.lexists(temp):
+            os.remove(temp)
+        raise
+
+
+class TokenFile:
+    """
+    A file written by save(), mapped. Only the header and the rule table
+    are read when it is opened; `starts`, `ends` and `rules` are views of
+    the mapped columns (copies on a big-endian machine), so indexing them
+    reads just the pages it touches. tokens(text) gives a TokenStream over
+    them for the text the file was lexed from.
+
+    close() releases the views, so TokenStreams from tokens() can't be
+    read after it.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.buffer = map_file(path)
+        try:
+            self.read(self.buffer)
+        except BaseException:
+            if not isinstance(self.buffer, bytes):
+                self.buffer.close()
+            raise
+
+    def read(self, buffer):
+        # everything is checked against the size of the file, so a
+        # truncated or corrupt one raises ValueError
+        path = self.path
+        if len(buffer) < header.size:
+            raise ValueError(f"{path}: not a token file")
+        magic, version, _, count, n, self.text_length, rules_at, columns_at = header.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a token file")
+        if version != VERSION:
+            raise ValueError(f"{path}: token file version {version}, expected {VERSION}")
+        if not header.size <= rules_at <= columns_at or columns_at % 8:
+            raise ValueError(f"{path}: bad offsets, rules at {rules_at}, columns at {columns_at}")
+        if columns_at + 20 * n > len(buffer):
+            raise ValueError(f"{path}: truncated, {n} tokens don't fit")
+
+        self.table = [] # (flags, source, name, category, subtoken, color) per rule
+        at = rules_at
+        for _ in range(count):
+            if at + 4 > columns_at:
+                raise ValueError(f"{path}: rule {len(self.table)} runs into the columns")
+            fields = []
+            flags, = length.unpack_from(buffer, at)
+            at += 4
+            for _ in range(5):
+                if at + 4 > columns_at:
+                    raise ValueError(f"{path}: rule {len(self.table)} runs into the columns")
+                size, = length.unpack_from(buffer, at)
+                at += 4
+                if at + size > columns_at:
+                    raise ValueError(f"{path}: rule {len(self.table)} runs into the columns")
+                try:
+                    fields.append(bytes(buffer[at:at + size]).decode("utf-8"))
+                except UnicodeDecodeError as e:
+                    raise ValueError(f"{path}: rule {len(self.table)}: {e}") from e
+                at += size
+            self.table.append((flags, *fields))
+        self.names = rule_names([row[1:] for row in self.table])
+
+        view = memoryview(buffer)
+        self.starts = self.column(view, columns_at, n, 'q')
+        self.ends = self.column(view, columns_at + 8 * n, n, 'q')
+        self.rules = self.column(view, columns_at + 16 * n, n, 'i')
+
+    @staticmethod
+    def column(view: memoryview, at: int, n: int, code: str):
+        data = view[at:at + n * array(code).itemsize]
+        if sys.byteorder == "little":
+            return data.cast(code)
+        column = array(code, data)
+        column.byteswap()
+        return column
+
+    @property
+    def patternpair(self) -> patternpairtype:
+        """The rule table, patterns compiled again."""
+        return [(re.compile(source, flags), name, category, subtoken, color)
+                for flags, source, name, category, subtoken, color in self.table]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> tuple[int, int, int]:
+        """(rule, start, end) of token `i`."""
+        return self.rules[i], self.starts[i], self.ends[i]
+
+    def tokens(self, text) -> TokenStream:
+        """The tokens as a TokenStream of `text`, the columns not copied."""
+        if len(text) != self.text_length:
+            raise ValueError(f"{self.path}: lexed a text of length {self.text_length}, not {len(text)}")
+        return TokenStream(text, self.names, self.starts, self.ends, self.rules)
+
+    def close(self):
+        for column in (self.starts, self.ends, self.rules):
+            if isinstance(column, memoryview):
+                column.release()
+        if not isinstance(self.buffer, bytes):
+            self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,46 +1,132 @@
 from .parser import patternpairtype
-from typing import Union
+from .engine import RuleEngine, scan
+from .stream import TokenStream, EOF
+from .profiling import profiled
+from .reach import Reach
+from typing import Optional
 
-def use(patternpair: patternpairtype, text: str) -> list[tuple[str, str, str, Union[int, float], Union[int, float]]]:
-    out = []
+UNKNOWN = ("UNKNOWN", "UNKNOWN")
+
+def rule_names(patternpair: patternpairtype) -> list[tuple[str, str]]:
+    # (token name as shown, category) for each rule, then UNKNOWN for
+    # the text no rule matches (rule id len(patternpair))
+    return [((token+"["+subtoken+"]") if subtoken else token, category)
+            for _, token, category, subtoken, _ in patternpair] + [UNKNOWN]
+
+def use(patternpair: patternpairtype, text: str, engine=None, profile=None) -> TokenStream:
+    # engine: see tokenparser.engine, e.g. compile_engine(patternpair)
+    # profile: a profiling.RuleProfile to count each rule's attempts, matches and time in
+    if engine is None:
+        engine = RuleEngine(patternpair)
+    if profile is not None:
+        engine = profiled(engine, profile)
+    out = TokenStream(text, rule_names(patternpair))
+    rules, starts, ends = out.rules.append, out.starts.append, out.ends.append
+    for rule, start, end in scan(engine, text):
+        rules(rule)
+        starts(start)
+        ends(end)
+    if profile is not None:
+        profile.count(out)
+    return out
+
+def conformance(patternpair: patternpairtype, text: str, engine) -> Optional[int]:
+    """
+    Index of the first token where lexing `text` with `engine` differs
+    from use() with the reference RuleEngine, None if they agree.
+    """
+    expected = use(patternpair, text)
+    got = use(patternpair, text, engine)
+    if got == expected:
+        return None
+    columns = zip(zip(expected.rules, expected.starts, expected.ends), zip(got.rules, got.starts, got.ends))
+    for i, (want, have) in enumerate(columns):
+        if want != have:
+            return i
+    return min(len(expected), len(got)) - 1
+
+
+def chunks_of(source, size):
+    if isinstance(source, str):
+        yield source
+    elif hasattr(source, 'read'):
+        yield from iter(lambda: source.read(size), "")
+    else:
+        yield from source
+
+def iter_use(patternpair: patternpairtype, source, engine=None, window=1 << 16, keep=256):
+    """
+    Like use(), but yields tokens as it goes. `source` is a str, a text
+    file object or an iterable of str chunks.
+
+    About 2*window characters are buffered. An attempt that reads to the
+    end of the buffer (see tokenparser.reach), matching or not, is tried
+    again once more text is read, so the tokens are those of use() and
+    not cut at chunk boundaries; a token or a lookahead longer than the
+    window makes the buffer grow to hold it. `keep` characters before the
+    offset stay buffered for lookbehinds and ^.
+    """
+    if engine is None:
+        engine = RuleEngine(patternpair)
+    match = engine.match
+    skip = engine.skip
+    attempt = Reach(patternpair).attempt
+    names = rule_names(patternpair)
+    chunks = chunks_of(source, window)
+    buf = ""
+    done = False
     i = 0
     line = 1
     column = 1
-    n = len(text)
-
-    while i < n:
-        matched = False
-        for pat, token, category, subtoken, _ in reversed(patternpair):
-            m = pat.match(text, i)
-            if m:
-                token = (
-                    (token+"["+subtoken+"]") if subtoken else token,
-                    m.group(0),
-                    category,
-                    line,
-                    column
-                )
-                out.append(token)
-                end = min(m.end(),n)
-                matched = True
-                if end == n:
-                    i = n
-                    break
-                for j in range(end-i):
-                    j = text[j]
-                    if j == '\n':
-                        line += 1
-                        column = 1
-                    else:
-                        column += 1
-                i = end
-                break
-        if not matched:
-            if text[i] == '\n':
-                line += 1
-                column = 1
-            else:
-                column += 1
-            i += 1  # skip one char if nothing matches
-    out.append(("EOF", "", "EOF", float("inf"), float("inf")))
-    return out
\ No newline at end of file
+    run = [] # text of the unmatched run we're in
+    run_at = (1, 1)
+
+    while True:
+        if not done and len(buf) - i < window:
+            cut = max(0, i - keep)
+            buf = buf[cut:]
+            i -= cut
+            while not done and len(buf) - i < 2 * window:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    done = True
+                else:
+                    buf += chunk
+        if i >= len(buf):
+            break
+
+        found = match(buf, i)
+        if not done and (found and found[1] == len(buf) or attempt(buf, i, len(buf)) > len(buf)):
+            # twice the text ahead, so a long token is retried a few times only
+            ahead = 2 * (len(buf) - i)
+            while not done and len(buf) - i < ahead:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    done = True
+                else:
+                    buf += chunk
+            continue
+
+        if found and found[1] > i:
+            end = found[1]
+            if run:
+                yield (UNKNOWN[0], "".join(run), UNKNOWN[1], *run_at)
+                run = []
+            name, category = names[found[0]]
+            yield (name, buf[i:end], category, line, column)
+        else:
+            m = skip.search(buf, i + 1) if skip is not None else None
+            end = m.start() if m else (i + 1 if skip is None else len(buf))
+            if not run:
+                run_at = (line, column)
+            run.append(buf[i:end])
+        newlines = buf.count('\n', i, end)
+        if newlines:
+            line += newlines
+            column = end - buf.rfind('\n', i, end)
+        else:
+            column += end - i
+        i = end
+    if run:
+        yield (UNKNOWN[0], "".join(run), UNKNOWN[1], *run_at)
+    yield EOF